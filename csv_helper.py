@@ -11,6 +11,9 @@ TRAIN_CSV_PATH = 'datasets/train.csv'
 IDEAL_CSV_PATH = 'datasets/ideal.csv'
 TEST_CSV_PATH = 'datasets/test.csv'
 
+# Default number of rows read at a time when reading CSV files in chunks (out-of-core mode).
+DEFAULT_CHUNK_SIZE = 10000
+
 class CSVHelper():
     '''
     CSVHelper class deals with loading of CSV files for the project, which are train.csv, ideal.csv and test.csv. 
@@ -25,6 +28,11 @@ class CSVHelper():
     test : DataFrame
         a pandas DataFrame loaded from test.csv file.
 
+    Static Methods
+    -------
+    read_csv_chunks(filePath, chunk_size)
+        Returns an iterator of DataFrame chunks for given CSV filePath, without loading the whole file.
+
     Private Methods
     -------
     __readCSV(filePath)
@@ -84,4 +92,29 @@ class CSVHelper():
 
         '''
         return pd.read_csv(filePath)
-    
+
+    @staticmethod
+    def read_csv_chunks(filePath, chunk_size = DEFAULT_CHUNK_SIZE):
+        '''
+        Returns an iterator of DataFrame chunks (of chunk_size rows each) for given CSV filePath, without loading the whole file.
+        It does not require a CSVHelper object, e.g. CSVHelper.read_csv_chunks(IDEAL_CSV_PATH).
+        ...
+
+        Parameters
+        ----------
+        filePath: str
+            File path of CSV file to be read.
+
+        chunk_size : int
+            Number of rows in each chunk.
+
+        Raises
+        ------
+        DataSetNotFoundException
+            If the CSV file is not found.
+        '''
+        try:
+            return pd.read_csv(filePath, chunksize=chunk_size)
+        except FileNotFoundError as ex:
+            # Raising user-defined exception in case of CSV file not found.
+            raise DataSetNotFoundException(ex)
@@ -12,9 +12,16 @@ class DataSetNotFoundException(Exception):
             Error message given at time of raising the exception.
 
         '''
+        self.original_message = message
         self.message = str(message) + ' Please check that there are all 3 files "train.csv", "ideal.csv" and "test.csv" inside the "datasets" folder inside the project root directory."'
         super().__init__(self.message)
 
+    def __reduce__(self):
+        '''
+        Rebuilds the exception from the original message when unpickled (e.g. raised in a worker process), so that the hint is not added twice.
+        '''
+        return (self.__class__, (self.original_message,))
+
 class InvalidDataFormatException(Exception):
     '''
     Should be raised if any DataSet not having expected columns.
@@ -29,9 +36,16 @@ class InvalidDataFormatException(Exception):
             Error message given at time of raising the exception.
             
         '''
+        self.original_message = message
         self.message = message + ' Make sure the input files (train.csv, ideal.csv and test.csv) has same structure and columns as defined in the assignment.'
         super().__init__(self.message)
 
+    def __reduce__(self):
+        '''
+        Rebuilds the exception from the original message when unpickled (e.g. raised in a worker process), so that the hint is not added twice.
+        '''
+        return (self.__class__, (self.original_message,))
+
 class InitDatabaseException(Exception):
     '''
     Should be raised if there is problem while initializing or connecting to the database. 
@@ -47,4 +61,38 @@ class InitDatabaseException(Exception):
             
         '''
         self.message = message + ' Make sure you have required permissions to create SQLite database in project\'s directory.'
+        super().__init__(self.message)
+
+class InvalidModelArtifactException(Exception):
+    '''
+    Should be raised if a mapping model artifact file can't be loaded (missing, corrupted or of an unsupported version).
+    '''
+    def __init__(self, message):
+        '''
+        User defined exception InvalidModelArtifactException constructor.
+
+        Parameters
+        ----------
+        message : str
+            Error message given at time of raising the exception.
+            
+        '''
+        self.message = str(message) + ' Make sure the model artifact was exported by the same version of the program (python main.py --export-model).'
+        super().__init__(self.message)
+
+class DistributedFittingException(Exception):
+    '''
+    Should be raised if a shard of the distributed fitting can't be scored by any fitting worker (after all retries).
+    '''
+    def __init__(self, message):
+        '''
+        User defined exception DistributedFittingException constructor.
+
+        Parameters
+        ----------
+        message : str
+            Error message given at time of raising the exception.
+            
+        '''
+        self.message = str(message) + ' Make sure the fitting workers are running (python distributed_fitting.py --port PORT) and reachable from the coordinator.'
         super().__init__(self.message)
\ No newline at end of file
@@ -1,8 +1,19 @@
 # External imports
 import numpy as np
-import pandas as pd
-from math import sqrt
-from stats_analysis import StatsAnalysis
+from stats_analysis import StatsAnalysis, EARLY_ABANDON_BLOCK_SIZE, FIT_CRITERIA
+from custom_exceptions import InvalidDataFormatException
+from mapping_model import MappingModel
+from x_grid_alignment import XGridAlignment
+from distributed_fitting import FittingCoordinator, DEFAULT_SHARD_SIZE, DEFAULT_BEST_K, DEFAULT_MAX_RETRIES
+
+# Relative slack used when abandoning candidates, so block-wise rounding never drops a candidate that ties with the best one.
+EARLY_ABANDON_TOLERANCE = 1e-9
+
+# Fit criteria ranking the ideal functions in the same order as SSE, hence usable with the early-abandoning search.
+EARLY_ABANDON_CRITERIA = ('sse', 'mse', 'rmse')
+
+# Default minimum fraction of rows (without missing values) an ideal function needs to be a candidate, in missing-data mode (skip_nan).
+DEFAULT_MIN_COVERAGE = 0.5
 
 class DataAnalysis(StatsAnalysis):
     '''
@@ -18,44 +29,107 @@ class DataAnalysis(StatsAnalysis):
         A pandas DataFrame for train dataset given to the constructor.
     ideal_df : DataFrame
         A pandas DataFrame for ideal dataset given to the constructor.
+    alignment_method : str
+        Method used to align the ideal dataset on the train x grid before scoring, one of ALIGNMENT_METHODS ('exact', 'nearest', 'interpolate').
 
     Public Methods
     ----------
-    find_matching_ideal_functions()
+    find_matching_ideal_functions(early_abandon, criterion, skip_nan, min_coverage, return_metrics)
         Finds the matching ideal function for all 4 training functions.
+
+    find_matching_ideal_functions_out_of_core(train_chunks, ideal_chunks, criterion, skip_nan, min_coverage, return_metrics)
+        Same as find_matching_ideal_functions, but streams the train and ideal data chunk by chunk instead of using train_df and ideal_df.
+
+    find_matching_ideal_functions_distributed(worker_urls, criterion, skip_nan, min_coverage, shard_size, k, max_retries, return_metrics)
+        Same as find_matching_ideal_functions, but the ideal functions are scored in shards by fitting workers (see FittingCoordinator).
     
-    map_test_to_ideal(test_df, ideal_df, ideal_match)
+    map_test_to_ideal(test_df, ideal_df, ideal_match, skip_nan)
         Maps the test data to chosen best 4 ideal function based on criteria 2, given in assignment task.
 
+    prepare_mapping_model(ideal_df, ideal_match)
+        Prepares the matched ideal functions and thresholds once, for mapping any number of test datasets.
+
+    map_test_files_to_ideal(test_files, ideal_df, ideal_match, max_workers, skip_nan)
+        Maps many test CSV files (a list or a directory) to chosen best 4 ideal functions, in parallel.
+
     Private Methods
     -------
 
-    __find_individual_matching_ideal(col_name)
+    __find_individual_matching_ideal(alignment, col_name, criterion, skip_nan, min_coverage)
         Finds the matching ideal function for a given train function.
 
+    __find_individual_matching_ideal_early_abandon(alignment, col_name, criterion)
+        Same as __find_individual_matching_ideal, but abandons candidates whose partial error already exceeds the best one.
+
+    __select_best_match(col_name, ideal_cols, metrics, criterion, min_coverage)
+        Selects the ideal function with the least error for given criterion (and enough coverage) and returns the match tuple and its metrics.
+
+    __check_criterion(criterion)
+        Checks that the given fit criterion is one of FIT_CRITERIA.
+
+    __get_alignment()
+        Returns the train and ideal datasets aligned on the same x grid, computed once per fit.
+
     '''
 
-    def __init__(self, train_df, ideal_df):
+    def __init__(self, train_df = None, ideal_df = None, alignment_method = 'exact'):
         '''
-        DataAnalysis class constructor to initialize attributes train_df and ideal_df.
+        DataAnalysis class constructor to initialize attributes train_df, ideal_df and alignment_method.
         ...
 
         Parameters
         ----------
         train_df: DataFrame
-            a pandas DataFrame for train dataset.
+            a pandas DataFrame for train dataset. Can be None if only the out-of-core mode is used.
 
         ideal_df : DataFrame
-            a pandas DataFrame for ideal dataset.
+            a pandas DataFrame for ideal dataset. Can be None if only the out-of-core mode is used.
+
+        alignment_method : str
+            How the ideal dataset is aligned on the train x grid before scoring (see XGridAlignment): 'exact' (join on x, default), 
+            'nearest' (nearest ideal x) or 'interpolate' (linear interpolation of ideal functions).
 
         '''
         super().__init__()
         self.train_df = train_df
         self.ideal_df = ideal_df
+        self.alignment_method = alignment_method
 
-    def find_matching_ideal_functions(self):
+    def find_matching_ideal_functions(self, early_abandon = False, criterion = 'sse', skip_nan = False, min_coverage = DEFAULT_MIN_COVERAGE, return_metrics = False):
         '''
         Finds the best matching ideal functions out of all 50 ideal functions, for each training functions. 
+        All fit criteria of the matches can also be returned (return_metrics), for audit.
+
+        Parameters
+        ----------
+        early_abandon: Boolean
+            If True, uses the early-abandoning search (recommended for very long series). The result is the same
+            as the full computation, but most candidates are rejected after summing only a part of their rows.
+            Only available for criteria ranking the same as SSE ('sse', 'mse' and 'rmse').
+
+        criterion: str
+            Fit criterion used to rank the ideal functions, one of FIT_CRITERIA ('sse', 'mse', 'rmse', 'mae', 'max_deviation').
+            Default is 'sse' (criteria 1 of assignment).
+
+        skip_nan: Boolean
+            Missing-data mode. If True, rows where the train or ideal value is missing (NaN) are skipped for each train/ideal pair,
+            instead of making the error NaN. The coverage (fraction of rows used) of each match is part of its metrics (see return_metrics).
+            Not available with early_abandon.
+
+        min_coverage: float
+            In missing-data mode, minimum coverage an ideal function needs to be a candidate. Default is 0.5.
+
+        return_metrics: Boolean
+            If True, returns a tuple of the result and of the metrics of the matches: a dictionary with, for each train function, 
+            all fit criteria (see FIT_CRITERIA) and the coverage of its matched ideal function. Default is False.
+
+        Raises
+        ------
+        ValueError
+            If criterion is unknown, or not usable with early_abandon, or if early_abandon is used with skip_nan.
+
+        InvalidDataFormatException
+            If no ideal function has enough coverage for a train function (missing-data mode).
 
         Return
         ----------
@@ -69,22 +143,200 @@ class DataAnalysis(StatsAnalysis):
 
         Where each item is a key-value pair. Key being the train function and value is a tuple of following 3 elements:
             1. Matching ideal function (Y column) name.
-            2. Error value (based on criteria 1 / sum of squared deviations).
+            2. Error value (based on criteria 1 / sum of squared deviations, or on the given criterion).
             3. Maximum deviation between train and matching ideal function. (This will be used while working with test data.)
 
+        With return_metrics, a tuple of the result and of the metrics of the matches, e.g. (result, {'y1': {'sse': 100.05..., ...}, ...}).
+
         '''
+        self.__check_criterion(criterion)
+        if early_abandon and criterion not in EARLY_ABANDON_CRITERIA:
+            raise ValueError(f'Early abandon search is only available for criteria {EARLY_ABANDON_CRITERIA}, not "{criterion}".')
+        if early_abandon and skip_nan:
+            raise ValueError('Early abandon search is not available in missing-data mode (skip_nan).')
 
-        # Declaring result dictionary
+        # Declaring result dictionary (and the metrics of the matches, kept local so that concurrent fits don't share them)
         result = {}
+        match_metrics = {}
+        alignment = self.__get_alignment()
 
-        # Running loop on all ideal_cols of Train DataFrame, except first ideal_col first (which is ideal_col 'x')
-        for col_name in self.train_df.columns[1:]:
+        # Running loop on all train functions (Y columns of Train DataFrame, without 'x')
+        for col_name in alignment.train_cols:
             # Finding matching ideal function for individual train function and adding that in the result dictionary.
-            result[col_name] = self.__find_individual_matching_ideal(col_name)
+            if early_abandon:
+                result[col_name], match_metrics[col_name] = self.__find_individual_matching_ideal_early_abandon(alignment, col_name, criterion)
+            else:
+                result[col_name], match_metrics[col_name] = self.__find_individual_matching_ideal(alignment, col_name, criterion, skip_nan, min_coverage)
         
-        return result
+        return (result, match_metrics) if return_metrics else result
+
+    def find_matching_ideal_functions_out_of_core(self, train_chunks, ideal_chunks, criterion = 'sse', skip_nan = False, min_coverage = DEFAULT_MIN_COVERAGE, return_metrics = False):
+        '''
+        Finds the best matching ideal functions for each training function, same as find_matching_ideal_functions, 
+        but without having the train and ideal datasets fully loaded in memory. Chunks of rows are streamed 
+        (e.g. from DBHelper.load_train_chunks_from_db or CSVHelper.read_csv_chunks) and a running sum of squared deviations 
+        and a running maximum deviation are kept for every train/ideal pair. Peak memory is bounded by chunk size x number of columns.
+
+        Return
+        ----------
+        Same format as find_matching_ideal_functions. Matched functions and maximum deviations are the same as the in-memory 
+        result, errors may only differ in last digits due to the different order of summation.
+
+        Parameters
+        ----------
+        train_chunks: Iterable of DataFrames
+            Train dataset chunks, first column being 'x'.
+
+        ideal_chunks: Iterable of DataFrames
+            Ideal dataset chunks, first column being 'x'. Each chunk must have the same number of rows as the related train chunk.
+
+        criterion: str
+            Fit criterion used to rank the ideal functions, one of FIT_CRITERIA. Default is 'sse'.
+
+        skip_nan: Boolean
+            Missing-data mode, same as in find_matching_ideal_functions.
+
+        min_coverage: float
+            In missing-data mode, minimum coverage an ideal function needs to be a candidate. Default is 0.5.
+
+        return_metrics: Boolean
+            If True, also returns the metrics of the matches, same as in find_matching_ideal_functions.
+
+        Raises
+        ------
+        InvalidDataFormatException
+            If train and ideal chunks are not aligned (different number of rows or different x values),
+            or if no ideal function has enough coverage for a train function (missing-data mode).
+
+        ValueError
+            If criterion is unknown.
+        '''
+        self.__check_criterion(criterion)
+
+        train_cols = None
+        ideal_cols = None
+        sum_squares = None
+        sum_abs = None
+        max_deviations = None
+        valid_counts = None
+        row_count = 0
+
+        train_iterator = iter(train_chunks)
+        ideal_iterator = iter(ideal_chunks)
+        for train_chunk in train_iterator:
+            ideal_chunk = next(ideal_iterator, None)
+            if ideal_chunk is None or len(ideal_chunk) != len(train_chunk):
+                raise InvalidDataFormatException('Train and ideal datasets do not have the same number of rows.')
+            # Chunks can't be aligned on x (see XGridAlignment) without the whole datasets, hence both x grids must be the same.
+            if not np.array_equal(train_chunk.iloc[:, 0].to_numpy(dtype=float), ideal_chunk.iloc[:, 0].to_numpy(dtype=float)):
+                raise InvalidDataFormatException('Train and ideal datasets do not have the same x values in the same order (needed by out-of-core mode).')
+
+            if train_cols is None:
+                # Setting up the accumulators (one row per train function, one column per ideal function) with the first chunk.
+                train_cols = list(train_chunk.columns[1:])
+                ideal_cols = list(ideal_chunk.columns[1:])
+                sum_squares = np.zeros((len(train_cols), len(ideal_cols)))
+                sum_abs = np.zeros((len(train_cols), len(ideal_cols)))
+                max_deviations = np.zeros((len(train_cols), len(ideal_cols)))
+                valid_counts = np.zeros((len(train_cols), len(ideal_cols)), dtype=np.int64)
+
+            row_count += len(train_chunk)
+            ideal_values = ideal_chunk[ideal_cols].to_numpy(dtype=float)
+            for train_index, train_col in enumerate(train_cols):
+                # Deviation of the chunk rows between this train function and all ideal functions at once.
+                abs_deviation = np.abs(ideal_values - train_chunk[train_col].to_numpy(dtype=float)[:, None])
+                if skip_nan:
+                    # Masking missing deviations with 0, which changes neither the sums nor the maximum, and counting the others.
+                    valid = ~np.isnan(abs_deviation)
+                    valid_counts[train_index] += np.sum(valid, axis=0)
+                    abs_deviation = np.where(valid, abs_deviation, 0.0)
+                sum_squares[train_index] += np.sum(np.square(abs_deviation), axis=0)
+                sum_abs[train_index] += np.sum(abs_deviation, axis=0)
+                max_deviations[train_index] = np.maximum(max_deviations[train_index], np.max(abs_deviation, axis=0))
+
+        if next(ideal_iterator, None) is not None:
+            raise InvalidDataFormatException('Train and ideal datasets do not have the same number of rows.')
+
+        # Declaring result dictionary
+        result = {}
+        match_metrics = {}
+        if train_cols is None:
+            return (result, match_metrics) if return_metrics else result
+
+        for train_index, train_col in enumerate(train_cols):
+            if skip_nan:
+                max_dev = np.where(valid_counts[train_index] > 0, max_deviations[train_index], np.nan)
+                metrics = self.metrics_from_sums(sum_squares[train_index], sum_abs[train_index], max_dev, valid_counts[train_index], row_count)
+            else:
+                metrics = self.metrics_from_sums(sum_squares[train_index], sum_abs[train_index], max_deviations[train_index], row_count)
+            result[train_col], match_metrics[train_col] = self.__select_best_match(train_col, ideal_cols, metrics, criterion, min_coverage)
+
+        return (result, match_metrics) if return_metrics else result
+
+    def find_matching_ideal_functions_distributed(self, worker_urls, criterion = 'sse', skip_nan = False, min_coverage = DEFAULT_MIN_COVERAGE,
+                                                  shard_size = DEFAULT_SHARD_SIZE, k = DEFAULT_BEST_K, max_retries = DEFAULT_MAX_RETRIES, return_metrics = False):
+        '''
+        Finds the best matching ideal functions for each training function, same as find_matching_ideal_functions, but the 
+        ideal functions are partitioned into shards scored by fitting workers, possibly on other machines (see FittingCoordinator
+        and FittingWorker in distributed_fitting.py). Every worker returns its local best-k per train function, and the
+        merged candidates give the same result (and metrics) as find_matching_ideal_functions.
+
+        Parameters
+        ----------
+        worker_urls: List
+            Base URLs of the running fitting workers, e.g. ['http://10.0.0.2:8765', 'http://10.0.0.3:8765'].
+
+        criterion: str
+            Fit criterion used to rank the ideal functions, one of FIT_CRITERIA. Default is 'sse'.
+
+        skip_nan: Boolean
+            Missing-data mode, same as in find_matching_ideal_functions.
+
+        min_coverage: float
+            In missing-data mode, minimum coverage an ideal function needs to be a candidate. Default is 0.5.
+
+        shard_size: int
+            Number of ideal functions scored by a worker in one request. Default is DEFAULT_SHARD_SIZE.
+
+        k: int
+            Number of best candidates returned by the workers for every train function. Default is 1.
+
+        max_retries: int
+            Number of times a failed shard is sent again to the next worker. Default is DEFAULT_MAX_RETRIES.
+
+        return_metrics: Boolean
+            If True, also returns the metrics of the matches, same as in find_matching_ideal_functions.
+
+        Raises
+        ------
+        ValueError
+            If criterion is unknown.
+
+        InvalidDataFormatException
+            If no ideal function has enough coverage for a train function (missing-data mode).
+
+        DistributedFittingException
+            If a shard can't be scored by any worker, after all retries.
+
+        Return
+        ----------
+        Same as find_matching_ideal_functions.
+        '''
+        self.__check_criterion(criterion)
+
+        alignment = self.__get_alignment()
+        coordinator = FittingCoordinator(worker_urls, shard_size, k, max_retries)
+        candidates = coordinator.find_best_candidates(alignment.train_values, alignment.ideal_values, criterion, skip_nan, min_coverage)
 
-    def map_test_to_ideal(self, test_df, ideal_df, ideal_match):
+        result = {}
+        match_metrics = {}
+        for col_name, (ideal_indices, metrics) in zip(alignment.train_cols, candidates):
+            # Candidates are already ranked (ties by ideal function order), so selecting among them gives the same match.
+            candidate_cols = [alignment.ideal_cols[ideal_index] for ideal_index in ideal_indices]
+            result[col_name], match_metrics[col_name] = self.__select_best_match(col_name, candidate_cols, metrics, criterion, min_coverage)
+        return (result, match_metrics) if return_metrics else result
+
+    def map_test_to_ideal(self, test_df, ideal_df, ideal_match, skip_nan = False):
         '''
         Maps the test data provided to the four chosen best ideal functions based on criteria 2, in given assignment task.
         It checks for each x-y pair of values (test functions), whether or not they can be mapped.
@@ -114,97 +366,221 @@ class DataAnalysis(StatsAnalysis):
                 'y3': ('y15', 101.28976004399982, 0.4975619999999985), 
                 'y4': ('y10', 99.50240088299999, 0.49966569999999955)
             }
-        '''
 
+        skip_nan: Boolean
+            Missing-data mode. If True, test points with a missing x or y value are added to unmapped test data instead of raising an error.
+        '''
+        # All test points are mapped at once (vectorized) by the mapping model, see MappingModel.map_test.
+        return self.prepare_mapping_model(ideal_df, ideal_match).map_test(test_df, skip_nan)
 
-        # Creating blank pandas data frames with column definitions. These will be used to store mapped and unmapped test points.
-        test_mapped_df = pd.DataFrame(columns = ['x', 'y', 'ideal_function', 'related_deviation'])
-        test_unmapped_df = pd.DataFrame(columns = ['x', 'y'])
+    def prepare_mapping_model(self, ideal_df, ideal_match):
+        '''
+        Prepares the matched ideal functions (x and y values) and maximum deviations allowed (criteria 2) once, 
+        so that any number of test datasets can then be mapped with MappingModel.map_test or MappingModel.map_test_files.
 
-        # Looping through all Test DataFrame rows using iterrows function.
-        # Since Test dataset isn't expected to be too large in size, hence iterrows is being used to simplify, for large dataset vectorization is recommended.
+        ...
 
-        for index, test_row in test_df.iterrows():
-            # Unpacking x and y value from current loop Test row.
-            test_x, test_y = test_row
+        Parameters
+        ----------
+        ideal_df : DataFrame
+            Pandas DataFrame for Ideal DataSet.
 
-            # These two vars will store the mapped ideal function and it's difference (related deviation) with test function.
-            # In case there are multiple mapping ideal function with one test function, we will 
-            # over-write this with the best ideal function mapped having least difference with test function.
-            mapping_ideal_function = None
-            mapping_ideal_function_difference = 0
+        ideal_match: Dictionary
+            Dictionary of best matching ideal functions, exactly what is returned from "find_matching_ideal_functions" function.
+        '''
+        return MappingModel.from_match(ideal_df, ideal_match)
 
-            # Looping through all 4 ideal match that we found earlier and passed to this function.
-            for train_col, matching in ideal_match.items():
+    def map_test_files_to_ideal(self, test_files, ideal_df, ideal_match, max_workers = None, skip_nan = False):
+        '''
+        Maps many test CSV files to the chosen best ideal functions based on criteria 2, in given assignment task.
+        The mapping model is prepared only once and the files are mapped in parallel worker processes.
 
-                # Getting the ideal column name from 0th index of matching tuple.
-                ideal_col = matching[0]
+        ...
 
-                # Getting the ideal column value for given Test X value. "ideal_col" is the name of matching ideal column.
-                ideal_value = float(ideal_df.loc[ideal_df['x']==test_x][ideal_col])
+        Return
+        ----------
+        Returns a dictionary with two keys "test_mapped_df" and "test_unmapped_df" with both mapped and unmapped 
+        test data of all files, each having an additional "source_file" column.
 
-                # Finding the difference between test and ideal values.
-                test_ideal_difference = np.abs(test_y-ideal_value)
+        Parameters
+        ----------
+        test_files : str or List
+            Directory containing the test CSV files (all *.csv files are used), or list of test CSV file paths.
 
-                # Since we already calculated maximum deviation between train and ideal function, we are using it here in order to 
-                # calculate the maximum deviation allowed (Criteria 2 of assignment) by multiplying it with sqrt(2).
-                max_deviation_allowed = matching[2] * sqrt(2)
+        ideal_df : DataFrame
+            Pandas DataFrame for Ideal DataSet.
 
+        ideal_match: Dictionary
+            Dictionary of best matching ideal functions, exactly what is returned from "find_matching_ideal_functions" function.
 
-                # Based on Criteria 2 of mapping test data to ideal, we are checking if the difference between
-                # test and ideal is less than or equal to maximum deviation allowed.
+        max_workers : int
+            Number of worker processes. Default (None) uses the number of CPUs.
 
-                # A test point can be mapped to an ideal function if the deviation between test point and ideal function 
-                # is smaller than the maximum deviation between that ideal function and its training function times sqrt(2).            
-                if (test_ideal_difference<=max_deviation_allowed):
-                    
-                    if(mapping_ideal_function == None or test_ideal_difference < mapping_ideal_function_difference):
-                        # In case there are multiple mapping ideal function with one test function, we will 
-                        # over-write this with the best ideal function having least difference.
-                        mapping_ideal_function = ideal_col
-                        mapping_ideal_function_difference = test_ideal_difference
-            
-            # Once loop of ideal functions is finished, we check if there was a mapping_ideal_function.
-            if(mapping_ideal_function is None):
-                # If not (None) we add the data in 'test_unmapped_df' DataFrame.
-                test_unmapped_df.loc[len(test_unmapped_df), test_unmapped_df.columns] = test_x, test_y
-            else:
-                # Else (if found a map) we add the data in 'test_mapped_df' DataFrame along with 'mapping_ideal_function' as well as 'mapping_ideal_function_difference'.
-                test_mapped_df.loc[len(test_mapped_df), test_mapped_df.columns] = test_x, test_y, mapping_ideal_function, mapping_ideal_function_difference
-        
-        return {'test_mapped_df': test_mapped_df, 'test_unmapped_df': test_unmapped_df}
+        skip_nan: Boolean
+            Missing-data mode, same as in map_test_to_ideal.
+        '''
+        return self.prepare_mapping_model(ideal_df, ideal_match).map_test_files(test_files, max_workers, skip_nan)
 
 
-    def __find_individual_matching_ideal(self, col_name):
+    def __find_individual_matching_ideal(self, alignment, col_name, criterion, skip_nan, min_coverage):
         '''
-        Finds the matching ideal function for a given train function by finding the error (using sum_of_deviation_squared) 
-        and returns the best matched ideal function that has the least error (sum_of_deviation_squared).
+        Finds the matching ideal function for a given train function by finding the error (using sum_of_deviation_squared, 
+        or the given criterion) and returns the best matched ideal function that has the least error, with its metrics.
+        All fit criteria are computed for all ideal functions at once, in a single pass (see deviation_metrics).
 
         ...
 
         Parameters
         ----------
+        alignment: XGridAlignment
+            Train and ideal datasets aligned on the same x grid, see __get_alignment.
+
         col_name: NumPy Array
             Name of column for finding the best ideal function. Should be y1, y2, y3 or y4.
+
+        criterion: str
+            Fit criterion used to rank the ideal functions, one of FIT_CRITERIA.
+
+        skip_nan: Boolean
+            If True, rows with missing values are skipped (missing-data mode).
+
+        min_coverage: float
+            In missing-data mode, minimum coverage an ideal function needs to be a candidate.
         '''
-        train_col_data = self.train_df[col_name]
-        error_list = []
-        for ideal_col in self.ideal_df.columns[1:]:
-            ideal_col_data = self.ideal_df[ideal_col]
-            # Finding error amount by Sum of deviations squared (Least Squared) for each ideal function.
-            error = self.sum_of_deviation_squared(train_col_data, ideal_col_data)
+        ideal_cols = alignment.ideal_cols
+        train_col_data = alignment.train_values[alignment.train_cols.index(col_name)]
+        ideal_col_data = alignment.ideal_values
+
+        # Finding all error amounts (Sum of deviations squared, MSE, ...) and maximum deviations (required for Criteria 2 
+        # when working with Test functions) of all ideal functions.
+        metrics = self.deviation_metrics(train_col_data, ideal_col_data, skip_nan)
 
-            # Since we're already looping, finding and storing maximum deviation between columns as it'll be required for Criteria 2 when working with Test functions.
-            max_dev = self.max_deviation(train_col_data, ideal_col_data)
+        return self.__select_best_match(col_name, ideal_cols, metrics, criterion, min_coverage)
 
-            # Appending the ideal column, it's error and maximum deviation in error list.
-            error_list.append((ideal_col, error, max_dev))
+    def __select_best_match(self, col_name, ideal_cols, metrics, criterion, min_coverage = 0):
+        '''
+        Selects the ideal function with the least error for given criterion, among the ones having at least min_coverage, 
+        and returns the match tuple together with the metrics (including coverage) of the selected ideal function.
 
-        # Returning the first item of sorted list, this will return the best matching ideal function with minimum (least) error.
-        # Returning item will be a Tuple with following 3 elements:
+        ...
+
+        Parameters
+        ----------
+        col_name: str
+            Name of the train function (column).
+
+        ideal_cols: List
+            Names of the ideal functions (columns), in the same order as metrics values.
+
+        metrics: Dictionary
+            All fit criteria of every ideal function, as returned by deviation_metrics.
+
+        criterion: str
+            Fit criterion used to rank the ideal functions, one of FIT_CRITERIA.
+
+        min_coverage: float
+            Minimum coverage an ideal function needs to be a candidate.
+
+        Raises
+        ------
+        InvalidDataFormatException
+            If no ideal function has enough coverage.
+        '''
+        # A candidate without any row is never selected, even with min_coverage 0.
+        enough_coverage = (metrics['coverage'] >= min_coverage) & (metrics['coverage'] > 0)
+        if not np.any(enough_coverage):
+            raise InvalidDataFormatException(f'No ideal function has at least {min_coverage:.0%} of rows without missing values for train function {col_name}.')
+
+        # argmin returns the first ideal function in case of a tie, same as sort_list does.
+        best_index = np.argmin(np.where(enough_coverage, metrics[criterion], np.inf))
+        best_metrics = {name: values[best_index] for name, values in metrics.items()}
+
+        # Returning item will be a Tuple with following 3 elements (and the metrics of the match):
         #       1. Matching ideal function (Y column) name.
-        #       2. Error value (based on criteria 1 / sum of squared deviations).
+        #       2. Error value (based on criteria 1 / sum of squared deviations, or on the given criterion).
         #       3. Maximum deviation between train and matching ideal function. (This will be used while working with test data.)
+        return (ideal_cols[best_index], metrics[criterion][best_index], metrics['max_deviation'][best_index]), best_metrics
+
+    def __check_criterion(self, criterion):
+        '''
+        Checks that the given fit criterion is one of FIT_CRITERIA.
+
+        ...
 
-        return self.sort_list(error_list)[0]
-    
\ No newline at end of file
+        Raises
+        ------
+        ValueError
+            If criterion is unknown.
+        '''
+        if criterion not in FIT_CRITERIA:
+            raise ValueError(f'Unknown fit criterion "{criterion}", must be one of {FIT_CRITERIA}.')
+
+    def __find_individual_matching_ideal_early_abandon(self, alignment, col_name, criterion):
+        '''
+        Finds the matching ideal function for a given train function, same as __find_individual_matching_ideal, 
+        but without computing the full error of every ideal function:
+            1. Candidates are ordered by their error on an evenly spaced sample of rows, so strong ones are evaluated first.
+            2. The error of each candidate is summed block by block, and the candidate is abandoned as soon as 
+               its partial error passes the best error found so far.
+            3. Maximum deviation (and the other fit criteria) are only computed for the winning candidate.
+
+        The returned match tuple and metrics are identical to the ones of __find_individual_matching_ideal.
+
+        ...
+
+        Parameters
+        ----------
+        alignment: XGridAlignment
+            Train and ideal datasets aligned on the same x grid, see __get_alignment.
+
+        col_name: NumPy Array
+            Name of column for finding the best ideal function. Should be y1, y2, y3 or y4.
+
+        criterion: str
+            Fit criterion used to rank the ideal functions, one of EARLY_ABANDON_CRITERIA.
+        '''
+        ideal_cols = alignment.ideal_cols
+        train_values = alignment.train_values[alignment.train_cols.index(col_name)]
+        ideal_values = alignment.ideal_values
+
+        # Estimating every candidate's error on a sample of rows in one vectorized step, and ordering candidates by it.
+        # Stable sort keeps the column order between candidates having the same estimate.
+        sample_step = max(1, len(train_values) // EARLY_ABANDON_BLOCK_SIZE)
+        sample_error = np.sum(np.square(ideal_values[:, ::sample_step] - train_values[::sample_step]), axis=1)
+        candidate_order = np.argsort(sample_error, kind='stable')
+
+        best_position = None
+        best_error = np.inf
+        for position in candidate_order:
+            # Allowing a tiny slack over the best error, so candidates tying with it are not lost to rounding.
+            upper_bound = best_error + abs(best_error) * EARLY_ABANDON_TOLERANCE
+            partial_error = self.sum_of_deviation_squared_bounded(train_values, ideal_values[position], upper_bound)
+            if partial_error is None:
+                continue
+
+            # The candidate was not abandoned, so computing its exact error the same way as the full search does.
+            error = self.sum_of_deviation_squared(train_values, ideal_values[position])
+
+            # Keeping the least error, and the first column in case of a tie (same as sort_list does).
+            # An infinite error ties with the initial best error, so the first such candidate is kept too.
+            if error < best_error or (error == best_error and (best_position is None or position < best_position)):
+                best_position = position
+                best_error = error
+
+        if best_position is None:
+            # No candidate has a finite error (missing values in the data), falling back to the full search, 
+            # so that the result is the same as without early abandon.
+            return self.__find_individual_matching_ideal(alignment, col_name, criterion, False, 0)
+
+        best_col = ideal_cols[best_position]
+        metrics = self.deviation_metrics(train_values, ideal_values[best_position])
+
+        return (best_col, metrics[criterion], metrics['max_deviation']), metrics
+
+    def __get_alignment(self):
+        '''
+        Returns the train and ideal datasets aligned on the same x grid (see XGridAlignment), as contiguous NumPy arrays 
+        used by all scoring. It is computed once per fit (find_matching_* call) and shared by all train functions, so that 
+        any change of train_df, ideal_df or alignment_method (even in place) is taken into account by the next fit.
+        '''
+        return XGridAlignment(self.train_df, self.ideal_df, self.alignment_method)
@@ -1,50 +1,179 @@
 # External imports
 from bokeh.plotting import figure, output_file, save
 from bokeh.layouts import row, column
-from bokeh.models import Title, Range1d
+from bokeh.models import Title, Range1d, ColumnDataSource
+from concurrent.futures import ProcessPoolExecutor
+import bokeh
+import numpy as np
+import copy
+import hashlib
+import html
+import json
 import os
 
+# Internal imports
+from hash_helper import hash_data_frame
+
 # Defining folder and file names constants.
 FOLDER_NAME = 'visualization'
 PLOTS_FILE_URL = FOLDER_NAME + '/visualization.html'
+REPORT_FOLDER_URL = FOLDER_NAME + '/report'
+REPORT_INDEX_FILE_NAME = 'index.html'
+# The manifest of an html file (hash of its plot inputs and settings) is saved next to it, e.g. "visualization.manifest.json".
+MANIFEST_FILE_SUFFIX = '.manifest.json'
+# Version of the manifest content. Bump it on any change of the rendering, so that all html files are rendered again.
+MANIFEST_VERSION = 1
 PLOT_WIDTH = 450
 PLOT_HEIGHT = 450
 
+# Downsampling methods available for line series: min/max bucketing (one bucket per pixel of PLOT_WIDTH) or LTTB.
+DOWNSAMPLE_METHODS = ('minmax', 'lttb')
+# Line series longer than this are downsampled before plotting (min/max bucketing keeps at most 4 points per pixel).
+MAX_LINE_POINTS = 4 * PLOT_WIDTH
+# Maximum number of points of a scatter overlay, after keeping only one point per pixel.
+MAX_SCATTER_POINTS = 2000
+# Line colors of the train functions rows, used in turn.
+LINE_COLORS = ('red', 'darkgreen', 'blue', 'fuchsia')
+# Output backends available for the figures ('webgl' draws large scatters and lines on the GPU).
+OUTPUT_BACKENDS = ('canvas', 'webgl')
+# Data type of the series in the report pages (base64 binary encoded in the HTML, float32 halves their size).
+REPORT_DATA_DTYPE = np.float32
+
+# Index page of the report, linking the page of every train function.
+REPORT_INDEX_TEMPLATE = '''<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>Ideal functions report</title>
+</head>
+<body>
+<h1>Ideal functions report</h1>
+<table border="1" cellpadding="4">
+<tr><th>Train function</th><th>Best matched ideal function</th><th>Error</th><th>Maximum deviation</th><th>Mapped test points</th></tr>
+{rows}
+</table>
+</body>
+</html>
+'''
+
+
+def _render_report_page(visualization, page_args):
+    '''
+    Renders one page of DataVisualization.visualize_report (in a worker process) and returns its file path.
+    (Defined at module level, so that worker processes can find it.)
+    '''
+    visualization.visualize(*page_args)
+    return page_args[4]
+
+
 class DataVisualization():
     '''
     The core class for dealing with all data visualization of the assignment project. It mainly uses Bokeh library to generate HTML charts.
 
     Public Methods
     ----------
-    visualize(train_df, ideal_df, train_ideal_match, test_mapped_df)
-        Visualizes the all 3 graphs, combines them and save all html files.
+    visualize(train_df, ideal_df, train_ideal_match, test_mapped_df, file_url, line_colors, force)
+        Visualizes the 3 graphs of every train function, combines them and save the html file (unless it is up to date).
+
+    visualize_report(train_df, ideal_df, train_ideal_match, test_mapped_df, folder_url, max_workers, force)
+        Saves one html page per train function (rendered in parallel worker processes) and an index page.
+
+    downsample_min_max(x, y, buckets)
+        Downsamples a line series keeping the first, minimum, maximum and last point of each x bucket.
+
+    downsample_lttb(x, y, max_points)
+        Downsamples a line series with the Largest-Triangle-Three-Buckets algorithm.
+
+    cap_scatter_density(x, y, max_points, grid_width, grid_height)
+        Thins scatter points to one point per pixel, and then to at most max_points points.
 
     Private Methods
     ----------
-    __plot_train_data(train_df, y_col, line_color)
+    __plot_train_data(train_source, y_col, line_color)
         Create figure/graph for the Train data plotting using line charts.
 
-    __plot_matched_ideal_data(self, ideal_df, train_ideal_match, y_index, line_color)
+    __plot_matched_ideal_data(ideal_source, train_col, matched_col, line_color)
         Create figure/graph for the Matched ideal functions data plotting using line charts.
 
-    __plot_mapped_test_data(self, ideal_df, train_ideal_match, test_mapped_df, y_index, line_color)
+    __plot_mapped_test_data(ideal_source, test_source, train_col, matched_col, line_color)
         Create figure/graph for the mapped Test functions data plotting.
 
+    __inputs_hash(train_df, ideal_df, train_ideal_match, test_mapped_df, line_colors)
+        Returns a hash of the plot inputs and settings.
+
+    __is_up_to_date(file_url, inputs_hash)
+        Checks if the html file has been rendered from the same plot inputs and settings, according to its manifest.
+
+    __save_manifest(file_url, inputs_hash)
+        Saves the manifest of a rendered html file.
+
+    __line_source(x, y)
+        Returns the (downsampled) Bokeh data source of a line series.
+
+    __scatter_source(x, y)
+        Returns the (density-capped) Bokeh data source of a scatter overlay.
+
+    __line_points(x, y)
+        Returns the points of a line series to be plotted, downsampled if it is longer than MAX_LINE_POINTS.
+
+    __scatter_points(x, y)
+        Returns the points of a scatter overlay to be plotted, density-capped if it has more than MAX_SCATTER_POINTS points.
+
+    __sorted_finite_points(x, y)
+        Returns the points of a series without missing values, sorted by x.
+
     '''
 
-    def __init__(self):
+    def __init__(self, downsample = 'minmax', max_scatter_points = MAX_SCATTER_POINTS, output_backend = 'canvas', data_dtype = np.float64):
         '''
         Constructor of class. Mainly creating the folder for visualization.
+
+        Parameters
+        ----------
+        downsample: str
+            Downsampling method of long line series, one of DOWNSAMPLE_METHODS, or None to plot all points. Default is 'minmax'.
+            Series with at most MAX_LINE_POINTS points are always plotted as they are.
+
+        max_scatter_points: int
+            Maximum number of points of a scatter overlay, or None to plot all points. Default is MAX_SCATTER_POINTS.
+
+        output_backend: str
+            Output backend of the figures, one of OUTPUT_BACKENDS. Default is 'canvas'.
+
+        data_dtype: NumPy dtype
+            Data type of the plotted series in the html file. Default is float64.
+
+        Raises
+        ------
+        ValueError
+            If downsample method or output backend is unknown.
         '''
+        if downsample is not None and downsample not in DOWNSAMPLE_METHODS:
+            raise ValueError(f'Unknown downsampling method "{downsample}", must be one of {DOWNSAMPLE_METHODS} or None.')
+        if output_backend not in OUTPUT_BACKENDS:
+            raise ValueError(f'Unknown output backend "{output_backend}", must be one of {OUTPUT_BACKENDS}.')
+        self.downsample = downsample
+        self.max_scatter_points = max_scatter_points
+        self.output_backend = output_backend
+        self.data_dtype = data_dtype
+
         try: 
             # Creating the folder for visualization.
             os.makedirs(FOLDER_NAME, exist_ok=True)
         except OSError:
             print('Error creating reports directory/folder for visualization.')
 
-    def visualize(self, train_df, ideal_df, train_ideal_match, test_mapped_df):
+    def visualize(self, train_df, ideal_df, train_ideal_match, test_mapped_df, file_url = PLOTS_FILE_URL, line_colors = LINE_COLORS, force = False):
         '''
-        Visualizes the all 12 graphs (3 graphs for each y), combines them and save the html file.
+        Visualizes the 3 graphs of every train function (train, matched ideal and mapped test graphs), one row per train function
+        of train_ideal_match, combines them and save the html file. Each series is stored once in the html file: plots of the same 
+        function share one data source (e.g. the matched ideal function in the ideal and test graphs).
+        A manifest with a hash of the plot inputs and settings is saved next to the html file. Rendering is skipped if the 
+        html file is unchanged and was rendered from the same inputs and settings.
+
+        Return
+        ----------
+        Returns the combined Bokeh column layout that has been saved, or None if rendering was skipped.
 
         Parameters
         ----------
@@ -53,12 +182,9 @@ class DataVisualization():
 
         ideal_df : DataFrame
             Pandas DataFrame for Ideal DataSet.
-        
-        test_df : DataFrame
-            Pandas DataFrame for Test DataSet.
 
         train_ideal_match: Dictionary
-            This a custom dictionary that has the 4 best matching ideal functions for all 4 train functions.
+            This a custom dictionary that has the best matching ideal function for every train function.
             Expected format of "train_ideal_match" is exactly what is returned from "find_matching_ideal_functions" function of DataAnalysis class. 
             An example of expected "train_ideal_match" parameter is as below:
             {
@@ -70,168 +196,435 @@ class DataVisualization():
         
         test_mapped_df: DataFrame
             Pandas DataFrame for Mapped Test functions data.
-        '''
 
-        # Creating 3 plots i.e. train, ideal and test plots for Y1.
-        train_plot_y1 = self.__plot_train_data(train_df, 'y1', 'red')
-        ideal_plot_y1 = self.__plot_matched_ideal_data(ideal_df, train_ideal_match, 0, 'red')
-        test_plot_y1 = self.__plot_mapped_test_data(ideal_df, train_ideal_match, test_mapped_df, 0, 'red')
+        file_url: str
+            Path of the HTML file to be saved. Default is "visualization/visualization.html".
+
+        line_colors: Tuple
+            Line colors of the rows, used in turn. Default is LINE_COLORS.
+
+        force: Boolean
+            If True, the html file is rendered even if it is up to date.
+        '''
+        inputs_hash = self.__inputs_hash(train_df, ideal_df, train_ideal_match, test_mapped_df, line_colors)
+        if not force and self.__is_up_to_date(file_url, inputs_hash):
+            print(f'Visualization "{file_url}" is up to date (same plot inputs and settings), skipping rendering.')
+            return None
+
+        # One data source per unique series: train functions, matched ideal functions and mapped test points of each ideal function.
+        train_sources = {train_col: self.__line_source(train_df.x, train_df[train_col]) for train_col in train_ideal_match}
+        matched_cols = list(dict.fromkeys(matching[0] for matching in train_ideal_match.values()))
+        ideal_sources = {matched_col: self.__line_source(ideal_df.x, ideal_df[matched_col]) for matched_col in matched_cols}
+
+        # Grouping the mapped test points by ideal function once (instead of filtering them for every plot).
+        test_groups = {ideal_col: group for ideal_col, group in test_mapped_df.groupby('ideal_function', sort=False)}
+        test_sources = {}
+        for matched_col in matched_cols:
+            test_points = test_groups.get(matched_col, test_mapped_df.iloc[:0])
+            test_sources[matched_col] = self.__scatter_source(test_points.x, test_points.y)
+
+        # Creating 3 plots i.e. train, ideal and test plots for every train function, combined into a row layout.
+        rows = []
+        for index, (train_col, matching) in enumerate(train_ideal_match.items()):
+            matched_col = matching[0]
+            line_color = line_colors[index % len(line_colors)]
+            rows.append(row(
+                self.__plot_train_data(train_sources[train_col], train_col, line_color),
+                self.__plot_matched_ideal_data(ideal_sources[matched_col], train_col, matched_col, line_color),
+                self.__plot_mapped_test_data(ideal_sources[matched_col], test_sources[matched_col], train_col, matched_col, line_color)
+            ))
+
+        # Combine all row layouts into a column layout.
+        combined_plots = column(*rows)
+        # Save the combined column plots
+        output_file(file_url)
+        save(combined_plots)
+        self.__save_manifest(file_url, inputs_hash)
+        return combined_plots
 
-        # Combine these 3 plots into a row layout.
-        row_y1 = row(train_plot_y1, ideal_plot_y1, test_plot_y1)
+    def visualize_report(self, train_df, ideal_df, train_ideal_match, test_mapped_df, folder_url = REPORT_FOLDER_URL, max_workers = None, force = False):
+        '''
+        Saves one lightweight html page per train function (same 3 graphs as a row of visualize) and an index page linking them,
+        so that each page opens quickly and can be regenerated alone (pages that are up to date are skipped). Pages are rendered in parallel worker processes, 
+        with the WebGL output backend and float32 binary encoded series (REPORT_DATA_DTYPE).
 
-        # Creating 3 plots i.e. train, ideal and test plots for Y2.
-        train_plot_y2 = self.__plot_train_data(train_df, 'y2', 'darkgreen')
-        ideal_plot_y2 = self.__plot_matched_ideal_data(ideal_df, train_ideal_match, 1, 'darkgreen')
-        test_plot_y2 = self.__plot_mapped_test_data(ideal_df, train_ideal_match, test_mapped_df, 1, 'darkgreen')
+        Return
+        ----------
+        Returns the path of the index page.
 
-        # Combine these 3 plots into a row layout.
-        row_y2 = row(train_plot_y2, ideal_plot_y2, test_plot_y2)
+        Parameters
+        ----------
+        train_df : DataFrame
+            Pandas DataFrame for Train DataSet.
 
-        # Creating 3 plots i.e. train, ideal and test plots for Y3.
-        train_plot_y3 = self.__plot_train_data(train_df, 'y3', 'blue')
-        ideal_plot_y3 = self.__plot_matched_ideal_data(ideal_df, train_ideal_match, 2, 'blue')
-        test_plot_y3 = self.__plot_mapped_test_data(ideal_df, train_ideal_match, test_mapped_df, 2, 'blue')
+        ideal_df : DataFrame
+            Pandas DataFrame for Ideal DataSet.
 
-        # Combine these 3 plots into a row layout.
-        row_y3 = row(train_plot_y3, ideal_plot_y3, test_plot_y3)
+        train_ideal_match: Dictionary
+            Best matching ideal function for every train function, exactly what is returned from "find_matching_ideal_functions" function of DataAnalysis class.
 
-        # Creating 3 plots i.e. train, ideal and test plots for Y4.
-        train_plot_y4 = self.__plot_train_data(train_df, 'y4', 'fuchsia')
-        ideal_plot_y4 = self.__plot_matched_ideal_data(ideal_df, train_ideal_match, 3, 'fuchsia')
-        test_plot_y4 = self.__plot_mapped_test_data(ideal_df, train_ideal_match, test_mapped_df, 3, 'fuchsia')
+        test_mapped_df: DataFrame
+            Pandas DataFrame for Mapped Test functions data.
 
-        # Combine these 3 plots into a row layout.
-        row_y4 = row(train_plot_y4, ideal_plot_y4, test_plot_y4)
+        folder_url: str
+            Folder of the html pages. Default is "visualization/report".
 
-        # Combine all 4 row layouts into a column layout.
-        combined_plots = column(row_y1, row_y2, row_y3, row_y4)
-        # Save the combined column plots
-        output_file(PLOTS_FILE_URL)
-        save(combined_plots)
+        max_workers : int
+            Number of worker processes. Default (None) uses the number of CPUs. Use 1 to render all pages in current process.
 
-    def __plot_train_data(self, train_df, y_col, line_color):
+        force: Boolean
+            If True, all pages are rendered even if they are up to date.
+        '''
+        os.makedirs(folder_url, exist_ok=True)
+        page_visualization = copy.copy(self)
+        page_visualization.output_backend = 'webgl'
+        page_visualization.data_dtype = REPORT_DATA_DTYPE
+
+        # Grouping the mapped test points by ideal function once, and sending to each worker only the data of its page.
+        test_groups = {ideal_col: group for ideal_col, group in test_mapped_df.groupby('ideal_function', sort=False)}
+        pages = []
+        index_rows = []
+        for index, (train_col, matching) in enumerate(train_ideal_match.items()):
+            matched_col = matching[0]
+            test_points = test_groups.get(matched_col, test_mapped_df.iloc[:0])
+            file_name = f'{train_col}.html'
+            pages.append((
+                train_df[['x', train_col]], ideal_df[['x', matched_col]], {train_col: matching}, test_points,
+                os.path.join(folder_url, file_name), (LINE_COLORS[index % len(LINE_COLORS)],), force
+            ))
+            index_rows.append(
+                f'<tr><td><a href="{html.escape(file_name)}">{html.escape(train_col)}</a></td><td>{html.escape(matched_col)}</td>'
+                f'<td>{matching[1]:.6g}</td><td>{matching[2]:.6g}</td><td>{len(test_points)}</td></tr>'
+            )
+
+        if max_workers == 1 or len(pages) <= 1:
+            for page_args in pages:
+                _render_report_page(page_visualization, page_args)
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                list(executor.map(_render_report_page, [page_visualization] * len(pages), pages))
+
+        index_url = os.path.join(folder_url, REPORT_INDEX_FILE_NAME)
+        with open(index_url, 'w') as index_file:
+            index_file.write(REPORT_INDEX_TEMPLATE.format(rows='\n'.join(index_rows)))
+        return index_url
+
+    def __plot_train_data(self, train_source, y_col, line_color):
         '''
         Create figure/graph for the Train data plotting using line charts.
 
         Parameters
         ----------
-        train_df : DataFrame
-            Pandas DataFrame for Train DataSet.
+        train_source : ColumnDataSource
+            Bokeh data source of the train function (x and y columns).
         
         y_col: String
-            Y Column name. Values should be y1, y2, y3 or y4. This will define which y col needs to be plotted.
+            Train function (Y column name), e.g. y1.
         
         line_color: String
             Color to be used for the plotting line.
         '''
 
         # Creating the figure / graph and setting up their title, x and y labels.
-        graph = figure(title = f'Train data graph with X and Train {y_col.upper()}', plot_width = PLOT_WIDTH, plot_height = PLOT_HEIGHT)
+        graph = figure(title = f'Train data graph with X and Train {y_col.upper()}', plot_width = PLOT_WIDTH, plot_height = PLOT_HEIGHT, output_backend = self.output_backend)
         graph.xaxis.axis_label = 'Train X'
         graph.yaxis.axis_label = f'Train {y_col.upper()}'
         graph.y_range = Range1d(-50, 1000)
 
-        # Plotting the train X and given train functions (either Y1, Y2, Y3 or Y4)
-        graph.line(train_df.x, train_df[y_col], line_color=line_color,legend_label=f'Train {y_col.upper()}', line_width=2)
+        # Plotting the train X and given train function.
+        graph.line('x', 'y', source=train_source, line_color=line_color,legend_label=f'Train {y_col.upper()}', line_width=2)
 
         # Returning the training graph object.
         return graph
 
-    def __plot_matched_ideal_data(self, ideal_df, train_ideal_match, y_index, line_color):
+    def __plot_matched_ideal_data(self, ideal_source, train_col, matched_col, line_color):
         '''
         Create figure/graph for the Matched ideal functions data plotting using line charts.
 
         Parameters
         ----------
-        ideal_df : DataFrame
-            Pandas DataFrame for Ideal DataSet.
-        
-        train_ideal_match: Dictionary
-            This a custom dictionary that has the 4 best matching ideal functions for all 4 train functions.
-            Expected format of "train_ideal_match" is exactly what is returned from "find_matching_ideal_functions" function of DataAnalysis class. 
-            An example of expected "train_ideal_match" parameter is as below:
-            {
-                'y1': ('y13', 100.0506255399994, 0.4999699999999976), 
-                'y2': ('y31', 95.34986419200027, 0.49812999999999974), 
-                'y3': ('y15', 101.28976004399982, 0.4975619999999985), 
-                'y4': ('y10', 99.50240088299999, 0.49966569999999955)
-            }
+        ideal_source : ColumnDataSource
+            Bokeh data source of the matched ideal function (x and y columns).
         
-        y_index: int
-            Index for best matched column. Values must be 0, 1, 2 or 3 (respecting to y1, y2, y3 and y4 best match).
+        train_col: String
+            Train function (Y column name), e.g. y1.
+
+        matched_col: String
+            Ideal function best matching the train function, e.g. y13.
         
         line_color: String
             Color to be used for the plotting line.
         '''
 
-        # Using train_ideal_match, extracting the matched ideal y points, with help of List Comprehension.
-        matched_y_points = [values[0] for values in train_ideal_match.values()]
-        # Getting best match Y ideal functions at given index.
-        matched_col = matched_y_points[y_index]
-
         # Creating the figure / graph and setting up their title, x and y labels.
-        graph = figure(title = f'Ideal data graph with X & Ideal{matched_col.upper()} (best match to train Y{y_index+1}).', plot_width = PLOT_WIDTH, plot_height = PLOT_HEIGHT)
+        graph = figure(title = f'Ideal data graph with X & Ideal{matched_col.upper()} (best match to train {train_col.upper()}).', plot_width = PLOT_WIDTH, plot_height = PLOT_HEIGHT, output_backend = self.output_backend)
         graph.xaxis.axis_label = 'Ideal X'
         graph.yaxis.axis_label = f'Ideal {matched_col.upper()}'
         graph.y_range = Range1d(-50, 1000)
 
-        # Plotting the ideal X and best matched ideal functions at given index.
-        graph.line(ideal_df.x, ideal_df[matched_col], line_color=line_color,legend_label=f'Ideal {matched_col} - (Best match to Train y{y_index+1})', line_width=2)
+        # Plotting the ideal X and best matched ideal function.
+        graph.line('x', 'y', source=ideal_source, line_color=line_color,legend_label=f'Ideal {matched_col} - (Best match to Train {train_col})', line_width=2)
         
         # Returning the ideal graph object.
         return graph
 
-    def __plot_mapped_test_data(self, ideal_df, train_ideal_match, test_mapped_df, y_index, line_color):
+    def __plot_mapped_test_data(self, ideal_source, test_source, train_col, matched_col, line_color):
         '''
         Create figure/graph for the mapped Test functions data plotting using line charts (for ideal) and scatter points (for test).
 
         Parameters
         ----------
-        ideal_df : DataFrame
-            Pandas DataFrame for Ideal DataSet.
-        
-        train_ideal_match: Dictionary
-            This a custom dictionary that has the 4 best matching ideal functions for all 4 train functions.
-            Expected format of "train_ideal_match" is exactly what is returned from "find_matching_ideal_functions" function of DataAnalysis class. 
-            An example of expected "train_ideal_match" parameter is as below:
-            {
-                'y1': ('y13', 100.0506255399994, 0.4999699999999976), 
-                'y2': ('y31', 95.34986419200027, 0.49812999999999974), 
-                'y3': ('y15', 101.28976004399982, 0.4975619999999985), 
-                'y4': ('y10', 99.50240088299999, 0.49966569999999955)
-            }
-        
-        test_mapped_df: DataFrame
-            Pandas DataFrame for Mapped Test functions data.
+        ideal_source : ColumnDataSource
+            Bokeh data source of the matched ideal function (x and y columns), shared with the ideal graph.
+
+        test_source : ColumnDataSource
+            Bokeh data source of the test points mapped to the matched ideal function (x and y columns).
         
-        y_index: int
-            Index for best matched column. Values must be 0, 1, 2 or 3 (respecting to y1, y2, y3 and y4 best match).
+        train_col: String
+            Train function (Y column name), e.g. y1.
+
+        matched_col: String
+            Ideal function best matching the train function, e.g. y13.
         
         line_color: String
             Color to be used for the plotting line.
         '''
-        # Using train_ideal_match, extracting the matched ideal y points, with help of List Comprehension.
-        matched_y_points = [values[0] for values in train_ideal_match.values()]
-        # Getting best match Y ideal functions at given index.
-        matched_col = matched_y_points[y_index]
-
-        # Filtering the mapped Test data rows from test_mapped_df DataFrame, based on matched y ideal functions.
-        # We are filtering so we can plot them with different colors.
-        test_points = test_mapped_df.query(f'ideal_function == "{matched_col}"')
-        
         # Creating the figure / graph and setting up their title, x and y labels.
-        graph = figure(title = f'Mapped test data to best matched ideal function {matched_col}', plot_width = PLOT_WIDTH, plot_height = PLOT_HEIGHT)
+        graph = figure(title = f'Mapped test data to best matched ideal function {matched_col}', plot_width = PLOT_WIDTH, plot_height = PLOT_HEIGHT, output_backend = self.output_backend)
         graph.xaxis.axis_label = 'Ideal X'
         graph.yaxis.axis_label = f'Ideal {matched_col.upper()}'
         graph.y_range = Range1d(-50, 1000)
 
 
         # Plotting the given matched ideal function with line.
-        graph.line(ideal_df.x, ideal_df[matched_col], line_color=line_color,legend_label=f'Ideal {matched_col} - (Best match to Train y{y_index+1})', line_width=2)
+        graph.line('x', 'y', source=ideal_source, line_color=line_color,legend_label=f'Ideal {matched_col} - (Best match to Train {train_col})', line_width=2)
         # Plotting the mapped test data to the given matched ideal function with scatter on same color.
-        graph.scatter(test_points.x, test_points.y, fill_color=line_color, line_color=line_color, radius=0.4, legend_label=f'Mapped test points to Ideal {matched_col}')
+        graph.scatter('x', 'y', source=test_source, fill_color=line_color, line_color=line_color, radius=0.4, legend_label=f'Mapped test points to Ideal {matched_col}')
 
 
         # Returning the test graph object.
         return graph
+
+    def __inputs_hash(self, train_df, ideal_df, train_ideal_match, test_mapped_df, line_colors):
+        '''
+        Returns a SHA-256 hash (hex string) of the plot inputs (datasets and fit result) and of all settings changing the html output.
+        '''
+        inputs = {
+            'version': MANIFEST_VERSION,
+            'bokeh_version': bokeh.__version__,
+            'data': [hash_data_frame(data_frame) for data_frame in (train_df, ideal_df, test_mapped_df)],
+            'train_ideal_match': train_ideal_match,
+            'settings': [self.downsample, self.max_scatter_points, self.output_backend, np.dtype(self.data_dtype).name, list(line_colors)],
+            'constants': [PLOT_WIDTH, PLOT_HEIGHT, MAX_LINE_POINTS]
+        }
+        return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=float).encode()).hexdigest()
+
+    def __is_up_to_date(self, file_url, inputs_hash):
+        '''
+        Checks if the html file exists, is unchanged since it was rendered and was rendered from the same plot inputs and 
+        settings, according to its manifest.
+        '''
+        try:
+            with open(os.path.splitext(file_url)[0] + MANIFEST_FILE_SUFFIX) as manifest_file:
+                manifest = json.load(manifest_file)
+            with open(file_url, 'rb') as html_file:
+                output_hash = hashlib.sha256(html_file.read()).hexdigest()
+        except (OSError, ValueError):
+            return False
+        return manifest.get('inputs_hash') == inputs_hash and manifest.get('output_hash') == output_hash
+
+    def __save_manifest(self, file_url, inputs_hash):
+        '''
+        Saves the manifest of a rendered html file: hash of its plot inputs and settings, and hash of the html file itself.
+        '''
+        with open(file_url, 'rb') as html_file:
+            output_hash = hashlib.sha256(html_file.read()).hexdigest()
+        with open(os.path.splitext(file_url)[0] + MANIFEST_FILE_SUFFIX, 'w') as manifest_file:
+            json.dump({'version': MANIFEST_VERSION, 'inputs_hash': inputs_hash, 'output_hash': output_hash}, manifest_file, indent=4)
+
+    def __line_source(self, x, y):
+        '''
+        Returns the data source of a line series, downsampled with __line_points.
+        '''
+        line_x, line_y = self.__line_points(x, y)
+        return ColumnDataSource(data={'x': line_x.astype(self.data_dtype), 'y': line_y.astype(self.data_dtype)})
+
+    def __scatter_source(self, x, y):
+        '''
+        Returns the data source of a scatter overlay, density-capped with __scatter_points.
+        '''
+        scatter_x, scatter_y = self.__scatter_points(x, y)
+        return ColumnDataSource(data={'x': scatter_x.astype(self.data_dtype), 'y': scatter_y.astype(self.data_dtype)})
+
+    def __line_points(self, x, y):
+        '''
+        Returns the x and y arrays of a line series to be plotted, downsampled with the selected method if the series 
+        is longer than MAX_LINE_POINTS, so that the HTML output size does not depend on the data size.
+        '''
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        if self.downsample is None or len(x) <= MAX_LINE_POINTS:
+            return x, y
+        if self.downsample == 'lttb':
+            return self.downsample_lttb(x, y, MAX_LINE_POINTS)
+        return self.downsample_min_max(x, y, PLOT_WIDTH)
+
+    def __scatter_points(self, x, y):
+        '''
+        Returns the x and y arrays of a scatter overlay to be plotted, density-capped if it has more than max_scatter_points points.
+        '''
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        if self.max_scatter_points is None or len(x) <= self.max_scatter_points:
+            return x, y
+        return self.cap_scatter_density(x, y, self.max_scatter_points)
+
+    @staticmethod
+    def downsample_min_max(x, y, buckets = PLOT_WIDTH):
+        '''
+        Downsamples a line series by splitting the x range into equal buckets (one per pixel by default) and keeping 
+        the first, minimum, maximum and last point of each bucket, in x order. Peaks stay visible, as the extremes of 
+        every pixel column are kept. Points with a missing value are dropped.
+
+        Return
+        ----------
+        Tuple of x and y NumPy arrays, with at most 4 points per bucket.
+
+        Parameters
+        ----------
+        x : Array like
+            x values of the series.
+
+        y : Array like
+            y values of the series.
+
+        buckets : int
+            Number of x buckets. Default is PLOT_WIDTH.
+        '''
+        x, y = DataVisualization.__sorted_finite_points(x, y)
+        if len(x) <= 4 * buckets:
+            # Already at most 4 points per bucket.
+            return x, y
+
+        span = x[-1] - x[0]
+        bucket_ids = np.zeros(len(x), dtype=int) if span == 0 else np.minimum(((x - x[0]) / span * buckets).astype(int), buckets - 1)
+
+        # x is sorted, so each bucket is a contiguous run of points. Sorting by y within each bucket gives its minimum (first)
+        # and maximum (last) points.
+        by_bucket_and_y = np.lexsort((y, bucket_ids))
+        starts = np.flatnonzero(np.r_[True, np.diff(bucket_ids) != 0])
+        ends = np.r_[starts[1:], len(x)] - 1
+        keep = np.unique(np.concatenate((starts, ends, by_bucket_and_y[starts], by_bucket_and_y[ends])))
+        return x[keep], y[keep]
+
+    @staticmethod
+    def downsample_lttb(x, y, max_points = MAX_LINE_POINTS):
+        '''
+        Downsamples a line series with the Largest-Triangle-Three-Buckets algorithm: the first and last points are kept, 
+        and for every bucket in between, the point forming the largest triangle with the previously kept point and 
+        the average point of the next bucket. Points with a missing value are dropped.
+
+        Return
+        ----------
+        Tuple of x and y NumPy arrays, with at most max_points points.
+
+        Parameters
+        ----------
+        x : Array like
+            x values of the series.
+
+        y : Array like
+            y values of the series.
+
+        max_points : int
+            Number of points to keep (at least 3). Default is MAX_LINE_POINTS.
+        '''
+        x, y = DataVisualization.__sorted_finite_points(x, y)
+        if max_points < 3 or len(x) <= max_points:
+            return x, y
+
+        # Bucket edges over the points between the first and last ones, every bucket having at least one point.
+        edges = np.linspace(1, len(x) - 1, max_points - 1).astype(int)
+        keep = np.empty(max_points, dtype=int)
+        keep[0] = 0
+        keep[-1] = len(x) - 1
+
+        previous = 0
+        for bucket in range(max_points - 2):
+            start, end = edges[bucket], edges[bucket + 1]
+            if bucket + 2 < len(edges):
+                next_x, next_y = x[end:edges[bucket + 2]].mean(), y[end:edges[bucket + 2]].mean()
+            else:
+                next_x, next_y = x[-1], y[-1]
+            # Twice the triangle areas (the factor does not change the largest one).
+            areas = np.abs((x[previous] - next_x) * (y[start:end] - y[previous]) - (x[previous] - x[start:end]) * (next_y - y[previous]))
+            previous = start + int(np.argmax(areas))
+            keep[bucket + 1] = previous
+
+        return x[keep], y[keep]
+
+    @staticmethod
+    def cap_scatter_density(x, y, max_points = MAX_SCATTER_POINTS, grid_width = PLOT_WIDTH, grid_height = PLOT_HEIGHT):
+        '''
+        Caps the density of scatter points: only the first point of each cell of a grid_width x grid_height grid 
+        (one cell per pixel by default) is kept, as the others would be drawn on top of it. While more than max_points 
+        points remain, the grid is made twice coarser. Isolated points (outliers) have their own cells, so they stay visible.
+
+        Return
+        ----------
+        Tuple of x and y NumPy arrays, with at most max_points points.
+
+        Parameters
+        ----------
+        x : Array like
+            x values of the points.
+
+        y : Array like
+            y values of the points.
+
+        max_points : int
+            Maximum number of points to keep. Default is MAX_SCATTER_POINTS.
+
+        grid_width : int
+            Number of grid cells along x. Default is PLOT_WIDTH.
+
+        grid_height : int
+            Number of grid cells along y. Default is PLOT_HEIGHT.
+        '''
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        finite = np.isfinite(x) & np.isfinite(y)
+        x, y = x[finite], y[finite]
+        if len(x) <= max_points:
+            return x, y
+
+        # Relative position (0 to 1) of every point in the x and y ranges.
+        positions = []
+        for values in (x, y):
+            span = values.max() - values.min()
+            positions.append(np.zeros(len(values)) if span == 0 else (values - values.min()) / span)
+
+        while True:
+            cell_x = np.minimum((positions[0] * grid_width).astype(int), grid_width - 1)
+            cell_y = np.minimum((positions[1] * grid_height).astype(int), grid_height - 1)
+            _, keep = np.unique(cell_x * grid_height + cell_y, return_index=True)
+            if len(keep) <= max_points or (grid_width == 1 and grid_height == 1):
+                break
+            grid_width, grid_height = max(grid_width // 2, 1), max(grid_height // 2, 1)
+
+        keep = np.sort(keep)[:max_points]
+        return x[keep], y[keep]
+
+    @staticmethod
+    def __sorted_finite_points(x, y):
+        '''
+        Returns the x and y arrays without the points having a missing value, sorted by x.
+        '''
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        finite = np.isfinite(x) & np.isfinite(y)
+        x, y = x[finite], y[finite]
+        if np.any(np.diff(x) < 0):
+            order = np.argsort(x, kind='stable')
+            x, y = x[order], y[order]
+        return x, y
@@ -1,8 +1,17 @@
 # External imports
 import sqlalchemy as db
-from sqlalchemy import create_engine, MetaData, Table, Column, Integer, Float, String
+from sqlalchemy import create_engine, event, MetaData, Table, Column, Integer, Float, String, Text
+from sqlalchemy.pool import QueuePool
+import numpy as np
 import pandas as pd
+import json
 import os
+import threading
+import uuid
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timezone
 
 # Internal imports
 from custom_exceptions import InitDatabaseException
@@ -13,26 +22,112 @@ IDEAL_TBL_NAME = 'ideal'
 TEST_MAPPED_TBL_NAME = 'test_mapped'
 TEST_UNMAPPED_TBL_NAME = 'test_unmapped'
 
+# Tables used by the append-only (run partitioned) storage of test mapping results.
+TEST_RUNS_TBL_NAME = 'test_runs'
+TEST_MAPPED_RUNS_TBL_NAME = 'test_mapped_runs'
+TEST_UNMAPPED_RUNS_TBL_NAME = 'test_unmapped_runs'
+
 DB_FOLDER = "database"
 
+# Default number of rows read at a time when loading tables in chunks (out-of-core mode).
+DEFAULT_CHUNK_SIZE = 10000
+
+# Connection pool settings. Each thread using a DBHelper gets its own connection from the pool.
+DB_POOL_SIZE = 5
+DB_POOL_MAX_OVERFLOW = 20
+
+# Seconds a connection waits for the database to be unlocked (e.g. by another writer) before failing.
+DB_BUSY_TIMEOUT = 30
+
+# Default maximum size (in bytes) of the DataFrames kept in the read cache of load_train_from_db and load_ideal_from_db.
+DB_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Default width of the related_deviation buckets of the mapping summary (deviation distribution).
+DEFAULT_DEVIATION_BUCKET_SIZE = 0.1
+
+# Indexes used by the mapping summary (GROUP BY ideal_function and related_deviation buckets), per table.
+MAPPING_SUMMARY_INDEXES = {
+    TEST_MAPPED_TBL_NAME: ('ix_test_mapped_ideal_function_deviation', ('ideal_function', 'related_deviation')),
+    TEST_MAPPED_RUNS_TBL_NAME: ('ix_test_mapped_runs_run_function_deviation', ('run_id', 'ideal_function', 'related_deviation'))
+}
+
+
+def _json_default(value):
+    '''
+    Default of json.dumps for the run metadata: converts NumPy scalars (e.g. errors of the fit result) to the 
+    equivalent Python numbers, and refuses any other object, so that no information is silently lost.
+    '''
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable.')
+
+
+def _release_thread_connection(connection, connections, connections_lock):
+    '''
+    Returns the connection of a thread of DBHelper.connection to the pool, once the thread has ended or on release_connection().
+    It may already have been closed by DBHelper.close(), hence the connection is only removed if still listed.
+    (Defined at module level, so that the finalizer of the thread does not keep the DBHelper alive.)
+    '''
+    with connections_lock:
+        if connection in connections:
+            connections.remove(connection)
+    connection.close()
+
+
 class DBHelper():
     '''
     The core class for dealing with all database operations of the assignment project. 
     It mainly uses SQLAlchemy library to work with SQLite database.
 
+    A DBHelper can be shared by several threads: connections come from a pool, one per task (all reads and writes of 
+    DBHelper use connect(), so the connection goes back to the pool right after), SQLite runs in WAL mode so that reads are concurrent, 
+    and writes are serialized by a lock (single writer). It should be closed with close(), or used as a context manager:
+
+        with DBHelper('sqlite_database') as db_helper:
+            ...
+
+    Loaded train and ideal DataFrames are kept in a read cache (LRU, limited in bytes), keyed by table name, selected columns 
+    and data version of the table. The data version is bumped by every write made through this DBHelper, so writes 
+    invalidate the cache. Every caller gets its own DataFrame, so adding or replacing columns doesn't affect other callers, 
+    but its values are shared with the cache and read-only: use copy() before modifying them in place.
+    Writes made to the database file by other programs are not seen by the cache (see clear_cache()).
+
+    Attributes
+    ----------
+    connection : Connection
+        SQLAlchemy connection of the calling thread, checked out from the pool on first use and returned when the thread ends.
+
     Public Methods
     ----------
+    connect()
+        Context manager giving a connection from the pool for one task, returned to the pool afterwards.
+
+    release_connection()
+        Returns the connection of the calling thread to the pool.
+
+    close()
+        Closes all connections and disposes the database engine.
+
+    clear_cache()
+        Empties the read cache of loaded tables.
+    
     copy_train_to_db(train_df)
         Copies (stores) Train DataFrame provided, to the train table.
 
     copy_ideal_to_db(ideal_df)
         Copies (stores) Ideal DataFrame provided, to the train table.
     
-    load_train_from_db()
-        Loads and returns the train dataset by reading the SQLite database train table.
+    load_train_from_db(columns)
+        Loads and returns the train dataset by reading the SQLite database train table (or the read cache).
 
-    load_ideal_from_db()
-        Loads and returns the ideal dataset by reading the SQLite database ideal table.
+    load_ideal_from_db(columns)
+        Loads and returns the ideal dataset by reading the SQLite database ideal table (or the read cache).
+
+    load_train_chunks_from_db(chunk_size)
+        Returns an iterator of train DataFrame chunks, read from the SQLite database train table.
+
+    load_ideal_chunks_from_db(chunk_size)
+        Returns an iterator of ideal DataFrame chunks, read from the SQLite database ideal table.
     
     store_test_mapped_to_db(test_mapped_df)
         Copies (stores) Test (Mapped) DataFrame provided, to the test_mapped table.
@@ -40,17 +135,58 @@ class DBHelper():
     store_test_unmapped_to_db(test_unmapped_df)
         Copies (stores) Test (Un Mapped) DataFrame provided, to the test_unmapped table.        
 
+    store_test_run_to_db(run_id, test_mapped_df, test_unmapped_df, metadata)
+        Appends the test mapping result of one run, with its metadata, to the run partitioned tables.
+
+    load_runs_from_db()
+        Loads and returns the metadata of all runs stored with store_test_run_to_db.
+
+    load_test_mapped_run_from_db(run_id)
+        Loads and returns the mapped Test data of given run.
+
+    load_test_unmapped_run_from_db(run_id)
+        Loads and returns the unmapped Test data of given run.
+
+    load_test_mapping_summary_from_db(run_id, deviation_bucket_size)
+        Computes the mapping analytics (counts per function, deviation distribution, mapped ratio) inside SQLite.
+
+    Static Methods
+    ----------
+    new_run_id()
+        Generates a new unique run_id.
+
     Private Methods
     ----------
+    __set_sqlite_pragmas(dbapi_connection, connection_record)
+        Enables the SQLite settings for concurrent reads and a single writer, on each new connection.
+
     __copy_data_frame_to_db(self, table_name, table_data_frame)
         Stores the given data frame into the SQLite table with given table_name.
+
+    __load_table_cached(table_name, columns)
+        Loads the given table through the read cache.
+
+    __bump_data_version(table_name)
+        Bumps the data version of given table, invalidating its cached DataFrames.
+
+    __load_table_chunks(table_name, chunk_size)
+        Reads the given table chunk by chunk, ordered by the DataFrame index.
+
+    __load_run_table(table, run_id)
+        Reads the rows of given run from a run partitioned table.
+
+    __create_run_tables()
+        Creates the run partitioned tables once, if they do not exist yet.
+
+    __create_mapping_summary_index(table_name)
+        Creates the index used by the mapping summary on given table, if not existing yet.
     '''
 
-    def __init__(self, db_name):
+    def __init__(self, db_name, cache_max_bytes = DB_CACHE_MAX_BYTES):
         '''
         Constructor of DBHelper Class. Main tasks are:
         - Creates the database folder.
-        - Connects to the database.
+        - Creates the database engine with its connection pool.
         - Defines all table schemas.
 
         Raises
@@ -62,6 +198,9 @@ class DBHelper():
         ----------
         db_name: str
             Name of SQLite database file.
+
+        cache_max_bytes: int
+            Maximum size (in bytes) of the read cache of loaded tables. Use 0 to disable the cache.
         '''
         try:
             # Creating the folder for database.
@@ -73,9 +212,29 @@ class DBHelper():
             # Creating the folder for database.
             # os.makedirs(DB_FOLDER)
 
-            # Setting up connection.
-            self.engine = create_engine('sqlite:///' + DB_FOLDER + '/' + db_name + '.db')
-            self.connection = self.engine.connect()
+            # Setting up the connection pool. Connections are checked out lazily, per thread or per task.
+            self.__thread_local = threading.local()
+            self.__connections = []
+            self.__connections_lock = threading.Lock()
+            self.__write_lock = threading.RLock()
+            self.__run_tables_created = False
+
+            # Setting up the read cache: (table name, columns, data version) -> (DataFrame, size in bytes), in LRU order.
+            self.__cache = OrderedDict()
+            self.__cache_bytes = 0
+            self.__cache_max_bytes = cache_max_bytes
+            self.__cache_lock = threading.Lock()
+            self.__data_versions = {}
+            self.engine = create_engine(
+                    'sqlite:///' + DB_FOLDER + '/' + db_name + '.db', 
+                    poolclass = QueuePool, pool_size = DB_POOL_SIZE, max_overflow = DB_POOL_MAX_OVERFLOW,
+                    connect_args = {'check_same_thread': False, 'timeout': DB_BUSY_TIMEOUT}
+                    )
+            event.listen(self.engine, 'connect', self.__set_sqlite_pragmas)
+
+            # Connecting once, so that a database which can't be opened fails here and not on first use.
+            with self.connect():
+                pass
             self.meta = MetaData()
 
             # Defining train table schema
@@ -127,10 +286,131 @@ class DBHelper():
                     Column('y', Float)
                     )
 
+            # Defining test_runs table schema (one row of metadata per run).
+            self.tbl_test_runs = Table(
+                    TEST_RUNS_TBL_NAME, self.meta, 
+                    Column('run_id', String, primary_key = True), 
+                    Column('created_at', String), 
+                    Column('metadata', Text)
+                    )
+
+            # Defining test_mapped_runs table schema (append-only, partitioned by run_id).
+            # source_file is only set for results of many test files (see MappingModel.map_test_files).
+            self.tbl_test_mapped_runs = Table(
+                    TEST_MAPPED_RUNS_TBL_NAME, self.meta, 
+                    Column('id',Integer, primary_key = True), 
+                    Column('run_id', String, index = True), 
+                    Column('x', Float), 
+                    Column('y', Float), 
+                    Column('ideal_function', String), 
+                    Column('related_deviation', Float),
+                    Column('source_file', String, nullable = True)
+                    )
+
+            # Defining test_unmapped_runs table schema (append-only, partitioned by run_id).
+            self.tbl_test_unmapped_runs = Table(
+                    TEST_UNMAPPED_RUNS_TBL_NAME, self.meta, 
+                    Column('id',Integer, primary_key = True), 
+                    Column('run_id', String, index = True), 
+                    Column('x', Float), 
+                    Column('y', Float),
+                    Column('source_file', String, nullable = True)
+                    )
+
         except Exception as ex:
-            # Raising user-defined exception in case of SQLite database could not be initialized.
+            # Releasing whatever was already opened, then raising user-defined exception in case of SQLite database could not be initialized.
+            self.close()
             raise InitDatabaseException('Could not initialize the database.')
 
+    def __enter__(self):
+        '''
+        Allows using DBHelper as a context manager, closing it at the end of the with block.
+        '''
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        '''
+        Closes all connections and disposes the database engine at the end of the with block.
+        '''
+        self.close()
+
+    @property
+    def connection(self):
+        '''
+        SQLAlchemy connection of the calling thread, for callers running several statements on the same connection. 
+        It is checked out from the pool on first use by the thread and kept until release_connection() or close() 
+        is called, or until the thread ends (and its Thread object is released).
+        '''
+        connection = getattr(self.__thread_local, 'connection', None)
+        if connection is None or connection.closed:
+            connection = self.engine.connect()
+            self.__thread_local.connection = connection
+            with self.__connections_lock:
+                self.__connections.append(connection)
+            weakref.finalize(threading.current_thread(), _release_thread_connection, connection, self.__connections, self.__connections_lock)
+        return connection
+
+    @contextmanager
+    def connect(self):
+        '''
+        Context manager giving a connection from the pool for one task (e.g. one mapping worker job). 
+        The connection is returned to the pool at the end of the with block.
+
+            with db_helper.connect() as connection:
+                pd.read_sql('ideal', connection)
+        '''
+        connection = self.engine.connect()
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    def release_connection(self):
+        '''
+        Returns the connection of the calling thread to the pool, e.g. before a worker thread ends.
+        '''
+        connection = getattr(self.__thread_local, 'connection', None)
+        if connection is not None:
+            self.__thread_local.connection = None
+            _release_thread_connection(connection, self.__connections, self.__connections_lock)
+
+    def close(self):
+        '''
+        Closes all connections (of all threads) and disposes the database engine. 
+        Safe to call several times, and on a partially initialized object.
+        '''
+        connections_lock = getattr(self, '_DBHelper__connections_lock', None)
+        if connections_lock is not None:
+            with connections_lock:
+                for connection in self.__connections:
+                    connection.close()
+                self.__connections.clear()
+
+        engine = getattr(self, 'engine', None)
+        if engine is not None:
+            engine.dispose()
+
+    def __set_sqlite_pragmas(self, dbapi_connection, connection_record):
+        '''
+        Enables the SQLite settings safe for concurrent reads and a single writer, on each new connection of the pool:
+        - WAL journal mode, so that readers don't block the writer (and the other way around).
+        - NORMAL synchronous mode, which is safe with WAL.
+        - Busy timeout, so that a connection waits for a lock to be released instead of failing.
+
+        Parameters
+        ----------
+        dbapi_connection: sqlite3.Connection
+            The new DBAPI connection.
+
+        connection_record: _ConnectionRecord
+            SQLAlchemy pool record of the connection (not used).
+        '''
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute(f'PRAGMA busy_timeout={DB_BUSY_TIMEOUT * 1000}')
+        cursor.close()
+
     def copy_train_to_db(self, train_df):
         '''
         Copies (stores) Train DataFrame provided, to the train table.
@@ -172,24 +452,147 @@ class DBHelper():
         '''
         copy_success = False
         try:
-            # Using if_exists='replace' to avoid failure while overwriting.
-            table_data_frame.to_sql(table_name, self.connection, if_exists='replace')
+            # Using if_exists='replace' to avoid failure while overwriting. Holding the write lock, as SQLite allows only one writer.
+            with self.__write_lock:
+                try:
+                    with self.connect() as connection:
+                        table_data_frame.to_sql(table_name, connection, if_exists='replace')
+                finally:
+                    # Invalidating the cached DataFrames of the table, even if the write failed half way.
+                    self.__bump_data_version(table_name)
             copy_success = True
         except Exception as ex:
             print('Error copying dataset to table. Error: ', ex)
         return copy_success
 
-    def load_train_from_db(self):
+    def load_train_from_db(self, columns = None):
         '''
         Loads and returns the train dataset by reading the SQLite database train table.
+        Repeated loads are served from the read cache, as a read-only DataFrame.
+
+        Parameters
+        ----------
+        columns : List
+            Names of the columns to be loaded, e.g. ['x', 'y1']. Default (None) loads all columns.
         '''
-        return pd.read_sql(TRAIN_TBL_NAME, self.connection, index_col='index')
+        return self.__load_table_cached(TRAIN_TBL_NAME, columns)
     
-    def load_ideal_from_db(self):
+    def load_ideal_from_db(self, columns = None):
         '''
         Loads and returns the ideal dataset by reading the SQLite database ideal table.
+        Repeated loads are served from the read cache, as a read-only DataFrame.
+
+        Parameters
+        ----------
+        columns : List
+            Names of the columns to be loaded, e.g. ['x', 'y13']. Default (None) loads all columns.
+        '''
+        return self.__load_table_cached(IDEAL_TBL_NAME, columns)
+
+    def clear_cache(self):
+        '''
+        Empties the read cache of loaded tables, e.g. after the database file was modified by another program.
+        '''
+        with self.__cache_lock:
+            self.__cache.clear()
+            self.__cache_bytes = 0
+
+    def __load_table_cached(self, table_name, columns):
+        '''
+        Loads the given table through the read cache. On a cache miss the table is read from the database, 
+        made read-only and stored in the cache, evicting the least recently used DataFrames if the cache gets too big.
+        A shallow copy of the cached DataFrame is returned, so that callers can't change the columns of the cached one.
+
+        Parameters
+        ----------
+        table_name: str
+            Name of the table to be loaded.
+
+        columns : List
+            Names of the columns to be loaded, or None for all columns.
+        '''
+        columns_key = None if columns is None else tuple(columns)
+        with self.__cache_lock:
+            cache_key = (table_name, columns_key, self.__data_versions.get(table_name, 0))
+            cached = self.__cache.get(cache_key)
+            if cached is not None:
+                self.__cache.move_to_end(cache_key)
+                return cached[0].copy(deep=False)
+
+        with self.connect() as connection:
+            table_df = pd.read_sql(table_name, connection, index_col='index', columns=None if columns is None else list(columns))
+
+        # Making the values read-only (without copying), as they are shared by every caller. When all columns have the
+        # same dtype (e.g. train and ideal), to_numpy() is a view of the values, which the DataFrame is rebuilt on.
+        if table_df.dtypes.nunique() == 1:
+            values = table_df.to_numpy()
+            values.flags.writeable = False
+            table_df = pd.DataFrame(values, index=table_df.index, columns=table_df.columns, copy=False)
+
+        data_size = int(table_df.memory_usage(index=True, deep=True).sum())
+        with self.__cache_lock:
+            # Storing only if no write happened to the table while reading it, and if the DataFrame fits in the cache.
+            if cache_key[2] == self.__data_versions.get(table_name, 0) and data_size <= self.__cache_max_bytes and cache_key not in self.__cache:
+                self.__cache[cache_key] = (table_df, data_size)
+                self.__cache_bytes += data_size
+                while self.__cache_bytes > self.__cache_max_bytes:
+                    _, (_, evicted_size) = self.__cache.popitem(last=False)
+                    self.__cache_bytes -= evicted_size
+        return table_df.copy(deep=False)
+
+    def __bump_data_version(self, table_name):
+        '''
+        Bumps the data version of given table, and drops its cached DataFrames (which can't be requested anymore).
+
+        Parameters
+        ----------
+        table_name: str
+            Name of the table which was written.
         '''
-        return pd.read_sql(IDEAL_TBL_NAME, self.connection, index_col='index')
+        with self.__cache_lock:
+            self.__data_versions[table_name] = self.__data_versions.get(table_name, 0) + 1
+            for cache_key in [cache_key for cache_key in self.__cache if cache_key[0] == table_name]:
+                self.__cache_bytes -= self.__cache.pop(cache_key)[1]
+
+    def load_train_chunks_from_db(self, chunk_size = DEFAULT_CHUNK_SIZE):
+        '''
+        Returns an iterator of train DataFrame chunks (of chunk_size rows each), read from the SQLite database train table.
+
+        Parameters
+        ----------
+        chunk_size : int
+            Number of rows in each chunk.
+        '''
+        return self.__load_table_chunks(TRAIN_TBL_NAME, chunk_size)
+
+    def load_ideal_chunks_from_db(self, chunk_size = DEFAULT_CHUNK_SIZE):
+        '''
+        Returns an iterator of ideal DataFrame chunks (of chunk_size rows each), read from the SQLite database ideal table.
+
+        Parameters
+        ----------
+        chunk_size : int
+            Number of rows in each chunk.
+        '''
+        return self.__load_table_chunks(IDEAL_TBL_NAME, chunk_size)
+
+    def __load_table_chunks(self, table_name, chunk_size):
+        '''
+        Reads the given table chunk by chunk, ordered by the DataFrame index, so that chunks of 
+        different tables (e.g. train and ideal) stay aligned row by row.
+
+        Parameters
+        ----------
+        table_name: str
+            Name of the table to be read.
+
+        chunk_size : int
+            Number of rows in each chunk.
+        '''
+        query = f'SELECT * FROM "{table_name}" ORDER BY "index"'
+        # Generator keeping its own connection until all chunks are read (or the generator is closed).
+        with self.connect() as connection:
+            yield from pd.read_sql(query, connection, index_col='index', chunksize=chunk_size)
     
     def store_test_mapped_to_db(self, test_mapped_df):
         '''
@@ -200,7 +603,11 @@ class DBHelper():
         test_mapped_df : DataFrame
             Pandas DataFrame for mapped Test DataSet.
         '''
-        return self.__copy_data_frame_to_db(TEST_MAPPED_TBL_NAME, test_mapped_df)
+        copy_success = self.__copy_data_frame_to_db(TEST_MAPPED_TBL_NAME, test_mapped_df)
+        if copy_success:
+            # The table was replaced, hence creating again the index used by the mapping summary.
+            self.__create_mapping_summary_index(TEST_MAPPED_TBL_NAME)
+        return copy_success
     
     def store_test_unmapped_to_db(self, test_unmapped_df):
         '''
@@ -213,14 +620,209 @@ class DBHelper():
         '''
         return self.__copy_data_frame_to_db(TEST_UNMAPPED_TBL_NAME, test_unmapped_df)
 
+    def store_test_run_to_db(self, run_id, test_mapped_df, test_unmapped_df, metadata = None):
+        '''
+        Appends the test mapping result of one run to the test_mapped_runs and test_unmapped_runs tables, 
+        and its metadata to the test_runs table, in a single transaction. Earlier runs are kept as they are,
+        so the cost of a write only depends on the size of the run itself (unlike store_test_mapped_to_db).
+
+        Parameters
+        ----------
+        run_id : str
+            Unique identifier of the run, e.g. from new_run_id().
+
+        test_mapped_df : DataFrame
+            Pandas DataFrame for mapped Test DataSet, optionally with a source_file column (results of many test files).
+
+        test_unmapped_df : DataFrame
+            Pandas DataFrame for unmapped Test DataSet, optionally with a source_file column.
+
+        metadata : Dictionary
+            Any JSON serializable information about the run, e.g. input hashes (see hash_helper.hash_data_frame), fit result and timings.
+            NumPy scalars are stored as Python numbers, other objects which are not JSON serializable fail the store operation.
+
+        Returns:
+        ----------
+        store_success: Boolean
+            Wether the store operation was success.
+        '''
+        store_success = False
+        try:
+            self.__create_run_tables()
+
+            # Holding the write lock, as SQLite allows only one writer.
+            with self.__write_lock, self.connect() as connection, connection.begin():
+                connection.execute(self.tbl_test_runs.insert(), {
+                    'run_id': run_id,
+                    'created_at': datetime.now(timezone.utc).isoformat(),
+                    'metadata': json.dumps(metadata or {}, default=_json_default)
+                })
+                test_mapped_df.assign(run_id=run_id).to_sql(TEST_MAPPED_RUNS_TBL_NAME, connection, if_exists='append', index=False)
+                test_unmapped_df.assign(run_id=run_id).to_sql(TEST_UNMAPPED_RUNS_TBL_NAME, connection, if_exists='append', index=False)
+            self.__create_mapping_summary_index(TEST_MAPPED_RUNS_TBL_NAME)
+            store_success = True
+        except Exception as ex:
+            print('Error storing test run to tables. Error: ', ex)
+        return store_success
+
+    def load_runs_from_db(self):
+        '''
+        Loads and returns the metadata of all runs stored with store_test_run_to_db, as a DataFrame indexed by run_id.
+        The metadata column contains the decoded metadata dictionaries.
+        '''
+        self.__create_run_tables()
+        with self.connect() as connection:
+            runs_df = pd.read_sql(f'SELECT * FROM "{TEST_RUNS_TBL_NAME}" ORDER BY created_at', connection, index_col='run_id')
+        runs_df['metadata'] = runs_df['metadata'].map(json.loads)
+        return runs_df
+
+    def load_test_mapped_run_from_db(self, run_id):
+        '''
+        Loads and returns the mapped Test data of given run.
+
+        Parameters
+        ----------
+        run_id : str
+            Identifier of the run.
+        '''
+        return self.__load_run_table(self.tbl_test_mapped_runs, run_id)
+
+    def load_test_unmapped_run_from_db(self, run_id):
+        '''
+        Loads and returns the unmapped Test data of given run.
+
+        Parameters
+        ----------
+        run_id : str
+            Identifier of the run.
+        '''
+        return self.__load_run_table(self.tbl_test_unmapped_runs, run_id)
+
+    def __load_run_table(self, table, run_id):
+        '''
+        Reads the rows of given run from a run partitioned table (using its run_id index), in insertion order.
+        The source_file column is only returned if the run was stored with one.
+
+        Parameters
+        ----------
+        table: Table
+            SQLAlchemy table, either tbl_test_mapped_runs or tbl_test_unmapped_runs.
+
+        run_id : str
+            Identifier of the run.
+        '''
+        self.__create_run_tables()
+        data_columns = [column for column in table.columns if column.name not in ('id', 'run_id')]
+        query = db.select(data_columns).where(table.c.run_id == run_id).order_by(table.c.id)
+        with self.connect() as connection:
+            run_df = pd.read_sql(query, connection)
+        if run_df['source_file'].isna().all():
+            run_df = run_df.drop(columns='source_file')
+        return run_df
+
+    def load_test_mapping_summary_from_db(self, run_id = None, deviation_bucket_size = DEFAULT_DEVIATION_BUCKET_SIZE):
+        '''
+        Computes the mapping analytics of the test data inside SQLite (GROUP BY queries using the mapping summary index, 
+        created when the test data is stored), without loading the mapped and unmapped rows in Python.
+        Tables which do not exist yet (nothing stored) are summarized as empty.
+
+        ...
+
+        Return
+        ----------
+        Dictionary with following keys:
+            - 'mapped_count': Number of mapped test points.
+            - 'unmapped_count': Number of unmapped test points.
+            - 'mapped_ratio': Ratio of mapped test points out of all test points (None if there are no test points).
+            - 'functions': DataFrame indexed by ideal_function, with columns count, mean_deviation, min_deviation and max_deviation.
+            - 'deviation_distribution': DataFrame with columns ideal_function, bucket_start (lower bound of 
+              related_deviation bucket) and count.
+
+        Parameters
+        ----------
+        run_id : str
+            Identifier of a run stored with store_test_run_to_db. Default (None) summarizes the test_mapped and test_unmapped tables.
+
+        deviation_bucket_size : float
+            Width of the related_deviation buckets of the deviation distribution.
+        '''
+        if run_id is None:
+            mapped_table, unmapped_table, run_filter = TEST_MAPPED_TBL_NAME, TEST_UNMAPPED_TBL_NAME, ''
+        else:
+            mapped_table, unmapped_table, run_filter = TEST_MAPPED_RUNS_TBL_NAME, TEST_UNMAPPED_RUNS_TBL_NAME, 'WHERE run_id = :run_id'
+        parameters = {'run_id': run_id, 'bucket_size': deviation_bucket_size}
+
+        with self.connect() as connection:
+            table_names = db.inspect(connection).get_table_names()
+            if mapped_table in table_names:
+                functions_df = pd.read_sql(db.text(f'''
+                    SELECT ideal_function, COUNT(*) AS count, AVG(related_deviation) AS mean_deviation, 
+                           MIN(related_deviation) AS min_deviation, MAX(related_deviation) AS max_deviation
+                    FROM "{mapped_table}" {run_filter}
+                    GROUP BY ideal_function ORDER BY ideal_function
+                    '''), connection, params=parameters, index_col='ideal_function')
+
+                # Related deviations are never negative, hence CAST (truncation) gives the bucket number.
+                deviation_distribution_df = pd.read_sql(db.text(f'''
+                    SELECT ideal_function, CAST(related_deviation / :bucket_size AS INTEGER) * :bucket_size AS bucket_start, COUNT(*) AS count
+                    FROM "{mapped_table}" {run_filter}
+                    GROUP BY ideal_function, CAST(related_deviation / :bucket_size AS INTEGER) ORDER BY ideal_function, bucket_start
+                    '''), connection, params=parameters)
+            else:
+                functions_df = pd.DataFrame(columns=['count', 'mean_deviation', 'min_deviation', 'max_deviation'], index=pd.Index([], name='ideal_function'))
+                deviation_distribution_df = pd.DataFrame(columns=['ideal_function', 'bucket_start', 'count'])
+
+            unmapped_count = connection.execute(db.text(f'SELECT COUNT(*) FROM "{unmapped_table}" {run_filter}'), parameters).scalar() if unmapped_table in table_names else 0
+        mapped_count = int(functions_df['count'].sum())
+        total_count = mapped_count + unmapped_count
+
+        return {
+            'mapped_count': mapped_count,
+            'unmapped_count': unmapped_count,
+            'mapped_ratio': mapped_count / total_count if total_count else None,
+            'functions': functions_df,
+            'deviation_distribution': deviation_distribution_df
+        }
+
+    def __create_run_tables(self):
+        '''
+        Creates the run partitioned tables (and their run_id indexes) if they do not exist yet, once per DBHelper.
+        Holding the write lock, so that concurrent first writes of runs do not race on CREATE TABLE.
+        Run tables created before the source_file column existed get it added (as NULL for their earlier runs).
+        '''
+        with self.__write_lock:
+            if not self.__run_tables_created:
+                with self.connect() as connection:
+                    self.meta.create_all(connection, tables=[self.tbl_test_runs, self.tbl_test_mapped_runs, self.tbl_test_unmapped_runs])
+                    for table in (self.tbl_test_mapped_runs, self.tbl_test_unmapped_runs):
+                        if 'source_file' not in [column['name'] for column in db.inspect(connection).get_columns(table.name)]:
+                            connection.execute(db.text(f'ALTER TABLE "{table.name}" ADD COLUMN source_file VARCHAR'))
+                self.__run_tables_created = True
+
+    def __create_mapping_summary_index(self, table_name):
+        '''
+        Creates the index used by the mapping summary (see MAPPING_SUMMARY_INDEXES) on given table, if not existing yet.
+
+        Parameters
+        ----------
+        table_name: str
+            Name of the mapped test data table, either test_mapped or test_mapped_runs.
+        '''
+        index_name, index_columns = MAPPING_SUMMARY_INDEXES[table_name]
+        columns_sql = ', '.join(f'"{column}"' for column in index_columns)
+        with self.__write_lock, self.connect() as connection:
+            connection.execute(db.text(f'CREATE INDEX IF NOT EXISTS "{index_name}" ON "{table_name}" ({columns_sql})'))
+
+    @staticmethod
+    def new_run_id():
+        '''
+        Generates a new unique run_id for store_test_run_to_db.
+        '''
+        return uuid.uuid4().hex
+
     # Destructor
     def __del__(self):
         '''
-        Destructor of DBHelper Class. Main tasks are:
-        - Closing the database connection.
-        - Dispose the database engine.
+        Destructor of DBHelper Class. Closes all connections and disposes the database engine, in case close() was not called.
         '''
-        # Closing connection and disposing engine in case of destructor called.
-        self.connection.close()
-        self.engine.dispose()
-
+        self.close()
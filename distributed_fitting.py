@@ -0,0 +1,508 @@
+# External imports
+import argparse
+import io
+import threading
+import uuid
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPException
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+# Internal imports
+from stats_analysis import StatsAnalysis, FIT_CRITERIA
+from custom_exceptions import DistributedFittingException
+
+# Defaults of the fitting workers and of the coordinator.
+DEFAULT_WORKER_HOST = '127.0.0.1'
+DEFAULT_WORKER_PORT = 8765
+# Number of ideal functions scored by a worker in one request.
+DEFAULT_SHARD_SIZE = 1000
+# Number of best candidates (ideal functions) returned by a worker for every train function of its shard.
+DEFAULT_BEST_K = 1
+# Number of times a failed shard is sent again (to the next worker) before giving up.
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_REQUEST_TIMEOUT = 60
+# Number of fits whose train data a worker keeps (the least recently used is dropped first).
+MAX_WORKER_FITS = 16
+
+TRAIN_PATH = '/train'
+SCORE_SHARD_PATH = '/score'
+RELEASE_PATH = '/release'
+# HTTP status of a shard request for a fit whose train data the worker doesn't have (e.g. restarted or dropped).
+UNKNOWN_FIT_STATUS = 404
+# Metrics sent back by the workers for every candidate: all fit criteria and the coverage.
+CANDIDATE_METRICS = FIT_CRITERIA + ('coverage',)
+
+
+def _encode_arrays(**arrays):
+    '''
+    Encodes the given NumPy arrays as the body of a request or response (NumPy .npz format, without pickled objects).
+    '''
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    return buffer.getvalue()
+
+
+def _decode_arrays(body):
+    '''
+    Decodes the body of a request or response encoded by _encode_arrays into a dictionary of NumPy arrays.
+    '''
+    with np.load(io.BytesIO(body), allow_pickle=False) as arrays:
+        return {name: arrays[name] for name in arrays.files}
+
+
+class _FittingWorkerRequestHandler(BaseHTTPRequestHandler):
+    '''
+    HTTP request handler of FittingWorker: keeps the train data of a fit posted to TRAIN_PATH, scores the shards of
+    ideal functions posted to SCORE_SHARD_PATH against it, and drops it when posted to RELEASE_PATH.
+    '''
+
+    def do_POST(self):
+        if self.path not in (TRAIN_PATH, SCORE_SHARD_PATH, RELEASE_PATH):
+            self.send_error(404, f'Unknown path "{self.path}".')
+            return
+        fitting_worker = self.server.fitting_worker
+        try:
+            request = _decode_arrays(self.rfile.read(int(self.headers['Content-Length'])))
+            fit_id = str(request['fit_id'])
+            if self.path == TRAIN_PATH:
+                fitting_worker.train(
+                    fit_id, request['train_values'], str(request['criterion']), int(request['k']),
+                    bool(request['skip_nan']), float(request['min_coverage'])
+                )
+                body = b''
+            elif self.path == RELEASE_PATH:
+                fitting_worker.release(fit_id)
+                body = b''
+            else:
+                try:
+                    best_indices, best_metrics = fitting_worker.score_fit_shard(fit_id, request['ideal_values'])
+                except KeyError:
+                    self.send_error(UNKNOWN_FIT_STATUS, f'Unknown fit "{fit_id}".')
+                    return
+                body = _encode_arrays(best_indices = best_indices, **best_metrics)
+        except Exception as ex:
+            self.send_error(500, f'Could not process request. Error: {ex}')
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Not logging every request, errors are reported to the coordinator.
+        pass
+
+
+class FittingWorker(StatsAnalysis):
+    '''
+    Fitting worker of the distributed fitting: a small HTTP server scoring the shards of ideal functions sent by a
+    FittingCoordinator against the train functions, and returning its local best-k candidates per train function.
+    The train functions (and settings) of a fit are sent once, and kept by the worker under the id of the fit.
+    Run one worker per machine (or per core) with "python distributed_fitting.py --host HOST --port PORT".
+
+    ...
+
+    Attributes
+    ----------
+    url : str
+        Base URL of the worker, to be given to the coordinator, e.g. "http://127.0.0.1:8765".
+
+    Public Methods
+    ----------
+    train(fit_id, train_values, criterion, k, skip_nan, min_coverage)
+        Keeps the train functions and settings of a fit, for score_fit_shard.
+
+    score_fit_shard(fit_id, ideal_values)
+        Scores a shard of ideal functions with the train functions and settings of given fit (see score_shard).
+
+    release(fit_id)
+        Drops the train functions and settings of a fit.
+
+    score_shard(train_values, ideal_values, criterion, k, skip_nan, min_coverage)
+        Scores a shard of ideal functions against all train functions and returns the best-k candidates of every train function.
+
+    start()
+        Starts serving requests in a background thread.
+
+    serve_forever()
+        Serves requests in the current thread, until stop is called.
+
+    stop()
+        Stops serving requests and closes the server socket.
+    '''
+
+    def __init__(self, host = DEFAULT_WORKER_HOST, port = 0):
+        '''
+        FittingWorker class constructor, binding the server socket.
+        ...
+
+        Parameters
+        ----------
+        host : str
+            Host (interface) to listen on. Default is localhost only.
+
+        port : int
+            Port to listen on. Default (0) uses any free port, see url.
+        '''
+        self.__server = ThreadingHTTPServer((host, port), _FittingWorkerRequestHandler)
+        self.__server.fitting_worker = self
+        self.__thread = None
+
+        # Train data of the fits: fit id -> (train values, criterion, k, skip_nan, min_coverage), in LRU order.
+        self.__fits = OrderedDict()
+        self.__fits_lock = threading.Lock()
+        self.url = f'http://{host}:{self.__server.server_address[1]}'
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        '''
+        Starts serving requests in a background thread and returns the worker.
+        '''
+        self.__thread = threading.Thread(target=self.__server.serve_forever, daemon=True)
+        self.__thread.start()
+        return self
+
+    def serve_forever(self):
+        '''
+        Serves requests in the current thread, until stop is called (or the process is interrupted).
+        '''
+        self.__server.serve_forever()
+
+    def stop(self):
+        '''
+        Stops serving requests and closes the server socket.
+        '''
+        if self.__thread is not None:
+            self.__server.shutdown()
+            self.__thread.join()
+            self.__thread = None
+        self.__server.server_close()
+
+    def train(self, fit_id, train_values, criterion, k, skip_nan, min_coverage):
+        '''
+        Keeps the train functions and settings of a fit, so that its shards only need to carry the ideal functions.
+        Only the MAX_WORKER_FITS most recently used fits are kept.
+
+        Parameters
+        ----------
+        fit_id : str
+            Unique identifier of the fit, given by the coordinator.
+
+        train_values, criterion, k, skip_nan, min_coverage
+            See score_shard.
+
+        Raises
+        ------
+        ValueError
+            If criterion is not one of FIT_CRITERIA.
+        '''
+        if criterion not in FIT_CRITERIA:
+            raise ValueError(f'Unknown fit criterion "{criterion}".')
+        with self.__fits_lock:
+            self.__fits[fit_id] = (np.ascontiguousarray(train_values, dtype=float), criterion, k, skip_nan, min_coverage)
+            self.__fits.move_to_end(fit_id)
+            while len(self.__fits) > MAX_WORKER_FITS:
+                self.__fits.popitem(last=False)
+
+    def score_fit_shard(self, fit_id, ideal_values):
+        '''
+        Scores a shard of ideal functions with the train functions and settings kept for given fit (see train and score_shard).
+
+        Raises
+        ------
+        KeyError
+            If the fit is not known (never trained, released or dropped), so that its train data has to be sent again.
+        '''
+        with self.__fits_lock:
+            train_values, criterion, k, skip_nan, min_coverage = self.__fits[fit_id]
+            self.__fits.move_to_end(fit_id)
+        return self.score_shard(train_values, ideal_values, criterion, k, skip_nan, min_coverage)
+
+    def release(self, fit_id):
+        '''
+        Drops the train functions and settings of given fit, if known.
+        '''
+        with self.__fits_lock:
+            self.__fits.pop(fit_id, None)
+
+    def score_shard(self, train_values, ideal_values, criterion, k, skip_nan, min_coverage):
+        '''
+        Scores a shard of ideal functions against all train functions, with the same fused kernel as DataAnalysis
+        (deviation_metrics), and keeps the best-k candidates of every train function.
+
+        ...
+
+        Return
+        ----------
+        Tuple of the candidates indices (in the shard) and a dictionary of their metrics (CANDIDATE_METRICS),
+        all 2 dimensional arrays with one row per train function and k columns, best candidate first.
+        Missing candidates (shard smaller than k, or not enough coverage) have the index -1.
+
+        Parameters
+        ----------
+        train_values : NumPy Array
+            Aligned train values, one row per train function.
+
+        ideal_values : NumPy Array
+            Aligned values of the shard of ideal functions, one row per ideal function.
+
+        criterion : str
+            Fit criterion used to rank the ideal functions, one of FIT_CRITERIA.
+
+        k : int
+            Number of best candidates kept for every train function.
+
+        skip_nan : Boolean
+            If True, rows with missing values are skipped (missing-data mode).
+
+        min_coverage : float
+            Minimum coverage an ideal function needs to be a candidate.
+        '''
+        ideal_values = np.ascontiguousarray(ideal_values, dtype=float)
+        k = min(k, ideal_values.shape[0])
+        best_indices = np.full((len(train_values), k), -1)
+        best_metrics = {name: np.full((len(train_values), k), np.nan) for name in CANDIDATE_METRICS}
+
+        for train_index, train_col_data in enumerate(train_values):
+            metrics = self.deviation_metrics(train_col_data, ideal_values, skip_nan)
+            enough_coverage = (metrics['coverage'] >= min_coverage) & (metrics['coverage'] > 0)
+            ranking = np.where(enough_coverage, metrics[criterion], np.inf)
+
+            # Stable sort, so that the first ideal function comes first in case of a tie (same as argmin).
+            candidates = np.argsort(ranking, kind='stable')[:k]
+            candidates = candidates[enough_coverage[candidates]]
+            best_indices[train_index, :len(candidates)] = candidates
+            for name in CANDIDATE_METRICS:
+                best_metrics[name][train_index, :len(candidates)] = metrics[name][candidates]
+
+        return best_indices, best_metrics
+
+
+class FittingCoordinator():
+    '''
+    Coordinator of the distributed fitting: partitions the ideal functions into shards, sends every shard to the fitting
+    workers (over HTTP), and merges the local best-k candidates returned by the workers. The train functions are sent
+    once per worker and fit (keyed by a fit id), before its first shard, and again if the worker lost them (e.g. restarted).
+    A shard failing on a worker (unreachable, timeout or error) is sent again to the next worker. As scoring a shard
+    has no side effect, retries are safe.
+
+    ...
+
+    Public Methods
+    ----------
+    find_best_candidates(train_values, ideal_values, criterion, skip_nan, min_coverage)
+        Scores all ideal functions on the workers and returns the merged best-k candidates of every train function.
+
+    Private Methods
+    ----------
+    __score_shard(shard_index, start, end, fit, ideal_values)
+        Sends a shard to the workers, retrying on the next worker if it fails.
+
+    __train_worker(worker_url, fit, retrain)
+        Sends the train functions of the fit to given worker, if not sent yet (or if retrain).
+
+    __release_fit(fit)
+        Asks the workers to drop the train functions of the fit.
+
+    __post(url, body)
+        Posts the body to given URL and returns the body of the response.
+    '''
+
+    def __init__(self, worker_urls, shard_size = DEFAULT_SHARD_SIZE, k = DEFAULT_BEST_K, max_retries = DEFAULT_MAX_RETRIES, timeout = DEFAULT_REQUEST_TIMEOUT):
+        '''
+        FittingCoordinator class constructor.
+        ...
+
+        Parameters
+        ----------
+        worker_urls : List
+            Base URLs of the fitting workers, e.g. ['http://10.0.0.2:8765', 'http://10.0.0.3:8765'].
+
+        shard_size : int
+            Number of ideal functions per shard. Default is DEFAULT_SHARD_SIZE.
+
+        k : int
+            Number of best candidates kept for every train function. Default is 1.
+
+        max_retries : int
+            Number of times a failed shard is sent again to the next worker. Default is DEFAULT_MAX_RETRIES.
+
+        timeout : float
+            Timeout of a worker request, in seconds. Default is DEFAULT_REQUEST_TIMEOUT.
+
+        Raises
+        ------
+        ValueError
+            If no worker URL is given, or shard_size or k is not positive.
+        '''
+        if not worker_urls:
+            raise ValueError('At least one fitting worker URL is needed.')
+        if shard_size < 1 or k < 1:
+            raise ValueError('Shard size and k must be positive.')
+        self.worker_urls = list(worker_urls)
+        self.shard_size = shard_size
+        self.k = k
+        self.max_retries = max_retries
+        self.timeout = timeout
+
+    def find_best_candidates(self, train_values, ideal_values, criterion = 'sse', skip_nan = False, min_coverage = 0):
+        '''
+        Scores all ideal functions against all train functions on the workers, one request per shard of ideal functions
+        (several shards in parallel), and merges the local best-k candidates of the workers.
+
+        ...
+
+        Return
+        ----------
+        List with, for every train function (row of train_values), a tuple of the indices of its best-k candidates
+        (rows of ideal_values) and a dictionary of their metrics (CANDIDATE_METRICS), best candidate first.
+        In case of a tie, the first ideal function comes first.
+
+        Parameters
+        ----------
+        train_values : NumPy Array
+            Aligned train values, one row per train function.
+
+        ideal_values : NumPy Array
+            Aligned ideal values, one row per ideal function.
+
+        criterion : str
+            Fit criterion used to rank the ideal functions, one of FIT_CRITERIA. Default is 'sse'.
+
+        skip_nan : Boolean
+            If True, rows with missing values are skipped (missing-data mode).
+
+        min_coverage : float
+            Minimum coverage an ideal function needs to be a candidate. Default is 0.
+
+        Raises
+        ------
+        DistributedFittingException
+            If a shard can't be scored by any worker, after all retries.
+        '''
+        train_values = np.asarray(train_values, dtype=float)
+        ideal_values = np.asarray(ideal_values, dtype=float)
+        fit_id = uuid.uuid4().hex
+        train_body = _encode_arrays(
+            fit_id = np.array(fit_id), train_values = train_values, criterion = np.array(criterion), k = np.array(self.k),
+            skip_nan = np.array(skip_nan), min_coverage = np.array(min_coverage)
+        )
+        fit = _CoordinatorFit(fit_id, train_body, self.worker_urls)
+        shards = [(start, min(start + self.shard_size, len(ideal_values))) for start in range(0, len(ideal_values), self.shard_size)]
+
+        try:
+            with ThreadPoolExecutor(max_workers=len(self.worker_urls)) as executor:
+                futures = [
+                    executor.submit(self.__score_shard, shard_index, start, end, fit, ideal_values[start:end])
+                    for shard_index, (start, end) in enumerate(shards)
+                ]
+                shard_results = [future.result() for future in futures]
+        finally:
+            self.__release_fit(fit)
+
+        # Merging the local best-k of all shards: ranking by criterion, then by ideal function index (shards are in order).
+        result = []
+        for train_index in range(len(train_values)):
+            indices = np.concatenate([start + best_indices[train_index] for (start, _), (best_indices, _) in zip(shards, shard_results)] + [np.empty(0, dtype=int)])
+            metrics = {
+                name: np.concatenate([best_metrics[name][train_index] for _, best_metrics in shard_results] + [np.empty(0)])
+                for name in CANDIDATE_METRICS
+            }
+            found = np.concatenate([best_indices[train_index] >= 0 for best_indices, _ in shard_results] + [np.empty(0, dtype=bool)])
+            order = np.lexsort((indices[found], metrics[criterion][found]))[:self.k]
+            result.append((indices[found][order], {name: values[found][order] for name, values in metrics.items()}))
+        return result
+
+    def __score_shard(self, shard_index, start, end, fit, ideal_values):
+        '''
+        Sends a shard (ideal functions start to end) to its worker, and to the next workers if it fails, up to max_retries times.
+        '''
+        body = _encode_arrays(fit_id = np.array(fit.fit_id), ideal_values = ideal_values)
+        errors = []
+        for attempt in range(self.max_retries + 1):
+            worker_url = self.worker_urls[(shard_index + attempt) % len(self.worker_urls)]
+            try:
+                self.__train_worker(worker_url, fit)
+                try:
+                    response_body = self.__post(worker_url + SCORE_SHARD_PATH, body)
+                except HTTPError as ex:
+                    if ex.code != UNKNOWN_FIT_STATUS:
+                        raise
+                    # The worker lost the train functions (e.g. restarted), sending them again.
+                    self.__train_worker(worker_url, fit, retrain=True)
+                    response_body = self.__post(worker_url + SCORE_SHARD_PATH, body)
+                response_arrays = _decode_arrays(response_body)
+                return response_arrays.pop('best_indices'), response_arrays
+            except (OSError, HTTPException, ValueError, KeyError) as ex:
+                errors.append(f'{worker_url}: {ex}')
+                if attempt < self.max_retries:
+                    print(f'Fitting worker {worker_url} failed for shard {shard_index} (ideal functions {start} to {end - 1}), retrying. Error: {ex}')
+        raise DistributedFittingException(f'Shard {shard_index} (ideal functions {start} to {end - 1}) could not be scored after {self.max_retries + 1} attempts. Errors: {"; ".join(errors)}.')
+
+    def __train_worker(self, worker_url, fit, retrain = False):
+        '''
+        Sends the train functions of the fit to given worker, unless they were already sent to it (and retrain is False).
+        Shards of the same worker wait for it, so that the train functions are only sent once.
+        '''
+        with fit.worker_locks[worker_url]:
+            if retrain or worker_url not in fit.trained_worker_urls:
+                self.__post(worker_url + TRAIN_PATH, fit.train_body)
+                fit.trained_worker_urls.add(worker_url)
+
+    def __release_fit(self, fit):
+        '''
+        Asks the workers which received the train functions of the fit to drop them. Failures are ignored, as the
+        workers drop the least recently used fits anyway (see MAX_WORKER_FITS).
+        '''
+        body = _encode_arrays(fit_id = np.array(fit.fit_id))
+        for worker_url in fit.trained_worker_urls:
+            try:
+                self.__post(worker_url + RELEASE_PATH, body)
+            except (OSError, HTTPException):
+                pass
+
+    def __post(self, url, body):
+        '''
+        Posts the body (encoded arrays) to given URL and returns the body of the response.
+        '''
+        request = Request(url, data=body, headers={'Content-Type': 'application/octet-stream'})
+        with urlopen(request, timeout=self.timeout) as response:
+            return response.read()
+
+
+class _CoordinatorFit():
+    '''
+    State of one fit of FittingCoordinator.find_best_candidates: its id, the encoded train functions and settings,
+    and the workers they were sent to.
+    '''
+
+    def __init__(self, fit_id, train_body, worker_urls):
+        self.fit_id = fit_id
+        self.train_body = train_body
+        self.trained_worker_urls = set()
+        self.worker_locks = {worker_url: threading.Lock() for worker_url in worker_urls}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Runs a fitting worker of the distributed fitting (see DataAnalysis.find_matching_ideal_functions_distributed).')
+    parser.add_argument('--host', default=DEFAULT_WORKER_HOST, help=f'host (interface) to listen on (default: {DEFAULT_WORKER_HOST})')
+    parser.add_argument('--port', type=int, default=DEFAULT_WORKER_PORT, help=f'port to listen on (default: {DEFAULT_WORKER_PORT})')
+    arguments = parser.parse_args()
+
+    worker = FittingWorker(arguments.host, arguments.port)
+    print(f'Fitting worker listening on {worker.url}')
+    try:
+        worker.serve_forever()
+    except KeyboardInterrupt:
+        worker.stop()
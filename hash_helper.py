@@ -0,0 +1,20 @@
+# External imports
+import hashlib
+import pandas as pd
+
+
+def hash_data_frame(data_frame):
+    '''
+    Returns a SHA-256 hash (hex string) of the content (index, columns and values) of given DataFrame.
+    Used to record the inputs of a run in its metadata (see DBHelper.store_test_run_to_db), and to detect
+    changed plot inputs (see DataVisualization).
+
+    Parameters
+    ----------
+    data_frame : DataFrame
+        Pandas DataFrame to be hashed.
+    '''
+    data_hash = hashlib.sha256()
+    data_hash.update(','.join(map(str, data_frame.columns)).encode())
+    data_hash.update(pd.util.hash_pandas_object(data_frame, index=True).values.tobytes())
+    return data_hash.hexdigest()
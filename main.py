@@ -1,18 +1,54 @@
+# External imports
+import argparse
+import os
+import time
+
 # Internal imports
-from csv_helper import CSVHelper
+from csv_helper import CSVHelper, TEST_CSV_PATH
 from db_helper import DBHelper
+from hash_helper import hash_data_frame
 from custom_exceptions import *
 from data_analysis import DataAnalysis
 from data_visualization import DataVisualization
+from mapping_model import MappingModel
+
+# Default paths of the exported mapping model artifact and of the map-only results.
+MODEL_ARTIFACT_PATH = 'model/ideal_match_model.npz'
+MAP_ONLY_OUTPUT_FOLDER = 'results'
 
 
-def main():
+def main(export_model_path = None, report = False, force_visualization = False, worker_urls = None, store_run = False):
     '''
     Main function that uses all other different classes to perform the tasks required in assignment description.
     It can be described with the Steps which are being printed and at the end, it shows the results. 
+
+    Parameters
+    ----------
+    export_model_path: str
+        If given, the mapping model (fit result and matched ideal functions) is exported to this path after Step 4, 
+        so that later test data can be mapped with map_only, without the train and ideal datasets.
+
+    report: Boolean
+        If True, Step 7 saves one html page per train function and an index page in "visualization/report" 
+        (rendered in parallel), instead of the single "visualization.html" file.
+
+    force_visualization: Boolean
+        If True, Step 7 renders the html files even if they are up to date (same plot inputs and settings as last run).
+
+    worker_urls: List
+        If given, Step 4 is distributed over the fitting workers running at these URLs (see distributed_fitting.py).
+
+    store_run: Boolean
+        If True, Step 6 appends the test data mapping result as a new run (see DBHelper.store_test_run_to_db) with 
+        its metadata (input hashes, fit result and timings of the steps), instead of replacing the test_mapped and 
+        test_unmapped tables.
     '''
+    # Seconds spent in each step, stored in the run metadata.
+    timings = {}
+
     # Load the CSV.
     print('Step 1: Loading the CSV files for train and ideal data.')
+    step_start = time.perf_counter()
     csv = None
     try:
         csv = CSVHelper()
@@ -24,8 +60,10 @@ def main():
     if(csv is None): 
         print('Error loading the CSV, hence stopping the program execution. Please fix the error mentioned above and try to run the program again.')
         return
+    timings['load_csv'] = time.perf_counter() - step_start
     
     print('Step 2: Copying the loaded CSV data into SQLite Database. (Will overwrite tables if they exists).')
+    step_start = time.perf_counter()
     try:
         db_helper = DBHelper('sqlite_database')
     except InitDatabaseException as ex:
@@ -33,39 +71,77 @@ def main():
         print(ex.message)
         return
 
-    copy_train_success = db_helper.copy_train_to_db(csv.train)
-    copy_ideal_success = db_helper.copy_ideal_to_db(csv.ideal)
+    # Using the database as a context manager, so that all its connections are closed at the end (or on early return).
+    with db_helper:
+        copy_train_success = db_helper.copy_train_to_db(csv.train)
+        copy_ideal_success = db_helper.copy_ideal_to_db(csv.ideal)
 
-    # Proceed further only if we have successfully copied the CSV data into SQLite DB. 
-    if(copy_train_success is False or copy_ideal_success is False): 
-        print('Error copying the CSV data into SQLite DB, hence stopping the program execution. Please fix the error mentioned above and try to run the program again.')
-        return
+        # Proceed further only if we have successfully copied the CSV data into SQLite DB. 
+        if(copy_train_success is False or copy_ideal_success is False): 
+            print('Error copying the CSV data into SQLite DB, hence stopping the program execution. Please fix the error mentioned above and try to run the program again.')
+            return
+        timings['copy_to_db'] = time.perf_counter() - step_start
 
-    print('Step 3: Loading the Pandas DataFrames (train and ideal) from SQLite database for the train and ideal tables.')
-    train_df = db_helper.load_train_from_db()
-    ideal_df = db_helper.load_ideal_from_db()
+        print('Step 3: Loading the Pandas DataFrames (train and ideal) from SQLite database for the train and ideal tables.')
+        step_start = time.perf_counter()
+        train_df = db_helper.load_train_from_db()
+        ideal_df = db_helper.load_ideal_from_db()
+        timings['load_from_db'] = time.perf_counter() - step_start
 
-    print('Step 4: Finding best ideal functions for each train function.')
-    data_analysis = DataAnalysis(train_df, ideal_df)
-    train_ideal_match = data_analysis.find_matching_ideal_functions()
-    
-    print('Step 5: Mapping test data to matched ideal functions.')
-    test_map_result = data_analysis.map_test_to_ideal(csv.test, csv.ideal, train_ideal_match)
-    test_mapped_df = test_map_result['test_mapped_df']
-    test_unmapped_df = test_map_result['test_unmapped_df']
+        print('Step 4: Finding best ideal functions for each train function.')
+        step_start = time.perf_counter()
+        data_analysis = DataAnalysis(train_df, ideal_df)
+        if worker_urls:
+            try:
+                train_ideal_match = data_analysis.find_matching_ideal_functions_distributed(worker_urls)
+            except DistributedFittingException as ex:
+                print(ex.message)
+                return
+        else:
+            train_ideal_match = data_analysis.find_matching_ideal_functions()
+        timings['fit'] = time.perf_counter() - step_start
 
-    print('Step 6: Storing the test data mapping result into SQLite database.')
-    store_test_mapped_success = db_helper.store_test_mapped_to_db(test_mapped_df)
-    store_test_unmapped_success = db_helper.store_test_unmapped_to_db(test_unmapped_df)
+        if export_model_path is not None:
+            data_analysis.prepare_mapping_model(ideal_df, train_ideal_match).save(export_model_path)
+            print(f'Step 4.1: Exported the mapping model artifact to "{export_model_path}".')
 
-    # Proceed further only if we have successfully stored the test mapping data into SQLite DB. 
-    if(store_test_mapped_success is False or store_test_unmapped_success is False): 
-        print('Error storing the test mapped and unmapped data into SQLite DB, hence stopping the program execution. Please fix the error mentioned above and try to run the program again.')
-        return
+        print('Step 5: Mapping test data to matched ideal functions.')
+        step_start = time.perf_counter()
+        test_map_result = data_analysis.map_test_to_ideal(csv.test, csv.ideal, train_ideal_match)
+        test_mapped_df = test_map_result['test_mapped_df']
+        test_unmapped_df = test_map_result['test_unmapped_df']
+        timings['map'] = time.perf_counter() - step_start
+
+        print('Step 6: Storing the test data mapping result into SQLite database.')
+        if store_run:
+            run_id = DBHelper.new_run_id()
+            metadata = {
+                'train_hash': hash_data_frame(csv.train),
+                'ideal_hash': hash_data_frame(csv.ideal),
+                'test_hash': hash_data_frame(csv.test),
+                'fit_result': train_ideal_match,
+                'timings': timings
+            }
+            store_success = db_helper.store_test_run_to_db(run_id, test_mapped_df, test_unmapped_df, metadata)
+            if store_success:
+                print(f'Step 6.1: Stored the test data mapping result as run "{run_id}".')
+        else:
+            store_test_mapped_success = db_helper.store_test_mapped_to_db(test_mapped_df)
+            store_test_unmapped_success = db_helper.store_test_unmapped_to_db(test_unmapped_df)
+            store_success = store_test_mapped_success and store_test_unmapped_success
+
+        # Proceed further only if we have successfully stored the test mapping data into SQLite DB. 
+        if(store_success is False): 
+            print('Error storing the test mapped and unmapped data into SQLite DB, hence stopping the program execution. Please fix the error mentioned above and try to run the program again.')
+            return
 
     print('Step 7: Data visualization (plotting)')
     data_visualization = DataVisualization()
-    data_visualization.visualize(train_df, ideal_df, train_ideal_match, test_mapped_df)
+    if report:
+        report_index_url = data_visualization.visualize_report(train_df, ideal_df, train_ideal_match, test_mapped_df, force=force_visualization)
+        print(f'Step 7.1: Saved the report pages, see "{report_index_url}".')
+    else:
+        data_visualization.visualize(train_df, ideal_df, train_ideal_match, test_mapped_df, force=force_visualization)
 
     print('\n\n')
     print('All steps are completed successfully. ')
@@ -81,6 +157,76 @@ def main():
 
     print('\n\n')
 
+def map_only(model_path, test_files, output_folder = MAP_ONLY_OUTPUT_FOLDER):
+    '''
+    Maps test data with a mapping model artifact exported by main (--export-model), without loading the train and 
+    ideal datasets and without using the database. Mapped and unmapped test data are saved as CSV files in output_folder.
+
+    Parameters
+    ----------
+    model_path: str
+        Path of the mapping model artifact.
+
+    test_files: List
+        Test CSV files, or folders containing test CSV files.
+
+    output_folder: str
+        Folder where "test_mapped.csv" and "test_unmapped.csv" are saved.
+    '''
+    print('Step 1: Loading the mapping model artifact.')
+    try:
+        model = MappingModel.load(model_path)
+    except InvalidModelArtifactException as ex:
+        print(ex.message)
+        return
+
+    print('Step 2: Mapping test data to matched ideal functions.')
+    test_paths = []
+    for test_file in test_files:
+        if os.path.isdir(test_file):
+            test_paths.extend(sorted(os.path.join(test_file, name) for name in os.listdir(test_file) if name.endswith('.csv')))
+        else:
+            test_paths.append(test_file)
+    try:
+        test_map_result = model.map_test_files(test_paths)
+    except (DataSetNotFoundException, InvalidDataFormatException) as ex:
+        print(ex)
+        return
+    test_mapped_df = test_map_result['test_mapped_df']
+    test_unmapped_df = test_map_result['test_unmapped_df']
+
+    print('Step 3: Storing the test data mapping result into CSV files.')
+    os.makedirs(output_folder, exist_ok=True)
+    test_mapped_df.to_csv(os.path.join(output_folder, 'test_mapped.csv'), index=False)
+    test_unmapped_df.to_csv(os.path.join(output_folder, 'test_unmapped.csv'), index=False)
+
+    print('\n\n')
+    print('Results: \n')
+    print(f'-- Out of {test_mapped_df.shape[0] + test_unmapped_df.shape[0]} test functions from {len(test_paths)} file(s), {test_mapped_df.shape[0]} test functions (items) were mapped to the matched ideal functions {model.ideal_cols}. And {test_unmapped_df.shape[0]} items were unmapped.\n')
+    print(f'-- Results are saved in "{output_folder}" folder ("test_mapped.csv" and "test_unmapped.csv").\n')
+
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='Finds the best matching ideal functions for the train functions and maps the test data to them.')
+    parser.add_argument('--export-model', nargs='?', const=MODEL_ARTIFACT_PATH, default=None, metavar='MODEL_PATH',
+                        help=f'export the mapping model artifact after fitting (default path: {MODEL_ARTIFACT_PATH})')
+    parser.add_argument('--map-only', default=None, metavar='MODEL_PATH',
+                        help='only map test data with an exported mapping model artifact (train/ideal datasets and database are not used)')
+    parser.add_argument('--test', nargs='+', default=[TEST_CSV_PATH], metavar='TEST_PATH',
+                        help=f'test CSV files or folders for --map-only (default: {TEST_CSV_PATH})')
+    parser.add_argument('--output', default=MAP_ONLY_OUTPUT_FOLDER, metavar='FOLDER',
+                        help=f'output folder of --map-only results (default: {MAP_ONLY_OUTPUT_FOLDER})')
+    parser.add_argument('--report', action='store_true',
+                        help='save one visualization page per train function and an index page (rendered in parallel) instead of a single page')
+    parser.add_argument('--force-visualization', action='store_true',
+                        help='render the visualization even if it is up to date (same plot inputs and settings as last run)')
+    parser.add_argument('--workers', nargs='+', default=None, metavar='WORKER_URL',
+                        help='distribute the fitting over fitting workers (started with "python distributed_fitting.py --port PORT"), e.g. http://127.0.0.1:8765')
+    parser.add_argument('--store-run', action='store_true',
+                        help='append the test mapping result as a new run (with input hashes, fit result and timings) to the test_runs, test_mapped_runs and test_unmapped_runs tables, instead of replacing the test_mapped and test_unmapped tables')
+    arguments = parser.parse_args()
+
+    if arguments.map_only is not None:
+        map_only(arguments.map_only, arguments.test, arguments.output)
+    else:
+        main(arguments.export_model, arguments.report, arguments.force_visualization, arguments.workers, arguments.store_run)
 
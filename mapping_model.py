@@ -0,0 +1,353 @@
+# External imports
+import numpy as np
+import pandas as pd
+import glob
+import os
+import zipfile
+from math import sqrt
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+
+# Internal imports
+from custom_exceptions import DataSetNotFoundException, InvalidDataFormatException, InvalidModelArtifactException
+
+# Version of the model artifact format written by MappingModel.save. Bump it on any change of the saved arrays.
+MODEL_ARTIFACT_VERSION = 1
+
+# Mapping model used by the worker processes of map_test_files, set once per process by _init_mapping_worker.
+_worker_model = None
+
+
+def _init_mapping_worker(model):
+    '''
+    Initializer of worker processes of MappingModel.map_test_files, keeping the mapping model for all files mapped by the worker.
+    (Defined at module level, so that worker processes can find it.)
+    '''
+    global _worker_model
+    _worker_model = model
+
+
+def _map_test_file_in_worker(file_path, skip_nan = False):
+    '''
+    Maps the given test CSV file in a worker process, with the mapping model given to _init_mapping_worker.
+    '''
+    return _worker_model.map_test_file(file_path, skip_nan)
+
+
+class MappingModel():
+    '''
+    Everything needed to map test data to the best matched ideal functions (criteria 2 of assignment), prepared once
+    from the ideal dataset and the fit result, so that any number of test datasets can be mapped without preparing it again.
+    The x values and y values of only the matched ideal functions are kept, sorted by x, as NumPy arrays.
+
+    ...
+
+    Attributes
+    ----------
+    train_cols : List
+        Train functions (Y column names), e.g. ['y1', 'y2', 'y3', 'y4'].
+    ideal_cols : List
+        Matched ideal function of each train function, e.g. ['y13', 'y31', 'y15', 'y10'].
+    errors : NumPy Array
+        Error value of each match (criteria 1 / sum of squared deviations).
+    max_deviations : NumPy Array
+        Maximum deviation between each train function and its matched ideal function.
+    thresholds : NumPy Array
+        Maximum deviation allowed when mapping test data to each matched ideal function (max_deviations times sqrt(2)).
+    x : NumPy Array
+        Sorted x values of the ideal dataset.
+    y : NumPy Array
+        Values of the matched ideal functions (one column per match), in the same order as x.
+
+    Public Methods
+    ----------
+    from_match(ideal_df, ideal_match)
+        Creates the mapping model from the ideal dataset and the result of DataAnalysis.find_matching_ideal_functions.
+
+    map_test(test_df, skip_nan)
+        Maps the test data to the matched ideal functions, all test points at once.
+
+    map_test_file(file_path, skip_nan)
+        Reads a test CSV file and maps it, tagging the results with the file path.
+
+    map_test_files(test_files, max_workers, skip_nan)
+        Maps many test CSV files (a list or a directory) to the matched ideal functions, in parallel worker processes.
+
+    save(file_path)
+        Exports the mapping model as a compact, versioned artifact (NumPy .npz file).
+
+    load(file_path)
+        Imports a mapping model artifact exported by save, without needing train or ideal datasets.
+    '''
+
+    def __init__(self, train_cols, ideal_cols, errors, max_deviations, x, y):
+        '''
+        MappingModel class constructor. Use from_match to create it from an ideal DataFrame and a fit result.
+        ...
+
+        Parameters
+        ----------
+        train_cols: List
+            Train functions (Y column names).
+
+        ideal_cols: List
+            Matched ideal function of each train function.
+
+        errors: List or NumPy Array
+            Error value of each match.
+
+        max_deviations: List or NumPy Array
+            Maximum deviation between each train function and its matched ideal function.
+
+        x: NumPy Array
+            x values of the ideal dataset.
+
+        y: NumPy Array
+            Values of the matched ideal functions, 2 dimensional array with one column per match and one row per x value.
+        '''
+        self.train_cols = list(train_cols)
+        self.ideal_cols = list(ideal_cols)
+        self.errors = np.asarray(errors, dtype=float)
+        self.max_deviations = np.asarray(max_deviations, dtype=float)
+
+        # Maximum deviation allowed, as per criteria 2 of assignment.
+        self.thresholds = self.max_deviations * sqrt(2)
+
+        # Sorting by x once, so that the ideal values of any test x can be found with a binary search.
+        x = np.asarray(x, dtype=float)
+        order = np.argsort(x, kind='stable')
+        self.x = x[order]
+        self.y = np.asarray(y, dtype=float).reshape(len(x), len(self.ideal_cols))[order]
+
+    @classmethod
+    def from_match(cls, ideal_df, ideal_match):
+        '''
+        Creates the mapping model from the ideal dataset and the fit result.
+
+        Parameters
+        ----------
+        ideal_df : DataFrame
+            Pandas DataFrame for Ideal DataSet.
+
+        ideal_match: Dictionary
+            Dictionary of best matching ideal functions, exactly what is returned from "find_matching_ideal_functions" function of DataAnalysis class.
+        '''
+        ideal_cols = [matching[0] for matching in ideal_match.values()]
+        return cls(
+            train_cols = ideal_match.keys(),
+            ideal_cols = ideal_cols,
+            errors = [matching[1] for matching in ideal_match.values()],
+            max_deviations = [matching[2] for matching in ideal_match.values()],
+            x = ideal_df['x'].to_numpy(dtype=float),
+            y = ideal_df[ideal_cols].to_numpy(dtype=float)
+        )
+
+    def map_test(self, test_df, skip_nan = False):
+        '''
+        Maps the test data to the matched ideal functions based on criteria 2, in given assignment task, all test points at once.
+        A test point is mapped to the matched ideal function having the least deviation with it, among the ones for which
+        the deviation is smaller than or equal to the maximum deviation allowed (threshold). Same result as DataAnalysis.map_test_to_ideal.
+
+        ...
+
+        Return
+        ----------
+        Returns a dictionary with two keys "test_mapped_df" and
+        "test_unmapped_df" with both mapped and unmapped test data.
+
+        Parameters
+        ----------
+        test_df : DataFrame
+            Pandas DataFrame for Test DataSet (x and y columns).
+
+        skip_nan : Boolean
+            Missing-data mode. If True, test points with a missing x or y value are added to unmapped test data 
+            instead of raising an error. Missing ideal values never allow a mapping (in both modes).
+
+        Raises
+        ------
+        InvalidDataFormatException
+            If the test data has not 2 columns, or a test x value is not found in the ideal dataset.
+        '''
+        if test_df.shape[1] != 2:
+            raise InvalidDataFormatException('Invalid format for test data. It must have 2 columns.')
+
+        test_x = test_df.iloc[:, 0].to_numpy(dtype=float)
+        test_y = test_df.iloc[:, 1].to_numpy(dtype=float)
+        # Test points with a missing x value are only looked up (and then left unmapped) in missing-data mode.
+        present = ~np.isnan(test_x) if skip_nan else np.ones(len(test_x), dtype=bool)
+
+        # Finding the ideal row of each test x value with a binary search on the sorted ideal x values.
+        positions = np.minimum(np.searchsorted(self.x, test_x), len(self.x) - 1)
+        found = self.x[positions] == test_x
+        if len(test_x) and not np.all(found | ~present):
+            missing_x = test_x[~found & present][0]
+            raise InvalidDataFormatException(f'Test x value {missing_x} not found in ideal dataset.')
+
+        # Deviation between each test point (row) and each matched ideal function (column).
+        # A missing test y or ideal value gives a NaN deviation, which is never allowed (NaN comparisons are False).
+        differences = np.abs(test_y[:, None] - self.y[positions])
+        allowed = (differences <= self.thresholds) & present[:, None]
+
+        # Keeping the least allowed deviation. argmin returns the first ideal function in case of a tie, same as map_test_to_ideal.
+        allowed_differences = np.where(allowed, differences, np.inf)
+        best = np.argmin(allowed_differences, axis=1) if len(self.ideal_cols) else np.zeros(len(test_x), dtype=int)
+        mapped = allowed.any(axis=1)
+
+        test_mapped_df = pd.DataFrame({
+            'x': test_x[mapped],
+            'y': test_y[mapped],
+            'ideal_function': np.array(self.ideal_cols, dtype=object)[best[mapped]],
+            'related_deviation': allowed_differences[mapped, best[mapped]]
+        })
+        test_unmapped_df = pd.DataFrame({'x': test_x[~mapped], 'y': test_y[~mapped]})
+
+        return {'test_mapped_df': test_mapped_df, 'test_unmapped_df': test_unmapped_df}
+
+    def map_test_files(self, test_files, max_workers = None, skip_nan = False):
+        '''
+        Maps many test CSV files to the matched ideal functions. The files are read and mapped in parallel worker processes,
+        the mapping model being sent only once to each worker. Results are tagged by source file.
+
+        ...
+
+        Return
+        ----------
+        Returns a dictionary with two keys "test_mapped_df" and "test_unmapped_df" with both mapped and unmapped
+        test data of all files, each having an additional "source_file" column.
+
+        Parameters
+        ----------
+        test_files : str or List
+            Directory containing the test CSV files (all *.csv files are used), or list of test CSV file paths.
+
+        max_workers : int
+            Number of worker processes. Default (None) uses the number of CPUs. Use 1 to map all files in current process.
+
+        skip_nan : Boolean
+            Missing-data mode, same as in map_test.
+
+        Raises
+        ------
+        DataSetNotFoundException
+            If a test CSV file is not found.
+
+        InvalidDataFormatException
+            If a test CSV file has not 2 columns, or a test x value is not found in the ideal dataset.
+        '''
+        if isinstance(test_files, str):
+            test_files = sorted(glob.glob(os.path.join(test_files, '*.csv')))
+
+        if max_workers == 1 or len(test_files) <= 1:
+            results = [self.map_test_file(file_path, skip_nan) for file_path in test_files]
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_mapping_worker, initargs=(self,)) as executor:
+                results = list(executor.map(_map_test_file_in_worker, test_files, repeat(skip_nan)))
+
+        mapped_dfs = [result['test_mapped_df'] for result in results]
+        unmapped_dfs = [result['test_unmapped_df'] for result in results]
+        return {
+            'test_mapped_df': pd.concat(mapped_dfs, ignore_index=True) if mapped_dfs else pd.DataFrame(columns = ['x', 'y', 'ideal_function', 'related_deviation', 'source_file']),
+            'test_unmapped_df': pd.concat(unmapped_dfs, ignore_index=True) if unmapped_dfs else pd.DataFrame(columns = ['x', 'y', 'source_file'])
+        }
+
+    def map_test_file(self, file_path, skip_nan = False):
+        '''
+        Reads the given test CSV file and maps it, tagging the results with the file path (source_file column).
+
+        Parameters
+        ----------
+        file_path : str
+            Path of the test CSV file.
+
+        skip_nan : Boolean
+            Missing-data mode, same as in map_test.
+
+        Raises
+        ------
+        DataSetNotFoundException
+            If the test CSV file is not found.
+
+        InvalidDataFormatException
+            If the test CSV file has not 2 columns, or a test x value is not found in the ideal dataset.
+        '''
+        try:
+            test_df = pd.read_csv(file_path)
+        except FileNotFoundError as ex:
+            raise DataSetNotFoundException(ex)
+        if test_df.shape[1] != 2:
+            raise InvalidDataFormatException(f'Invalid format for test file "{file_path}". It must have 2 columns.')
+
+        result = self.map_test(test_df, skip_nan)
+        return {name: result_df.assign(source_file=file_path) for name, result_df in result.items()}
+
+    def save(self, file_path):
+        '''
+        Exports the mapping model as a compact, versioned artifact (compressed NumPy .npz file), containing the matched 
+        function names, errors, maximum deviations, thresholds and x/y values of the matched ideal functions only.
+        It can be loaded with MappingModel.load for mapping-only runs.
+
+        Parameters
+        ----------
+        file_path : str
+            Path of the artifact file (the .npz extension is added if missing).
+        '''
+        folder = os.path.dirname(file_path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+        np.savez_compressed(
+            file_path,
+            version = np.array(MODEL_ARTIFACT_VERSION),
+            train_cols = np.array(self.train_cols, dtype=str),
+            ideal_cols = np.array(self.ideal_cols, dtype=str),
+            errors = self.errors,
+            max_deviations = self.max_deviations,
+            thresholds = self.thresholds,
+            x = self.x,
+            y = self.y
+        )
+
+    @classmethod
+    def load(cls, file_path):
+        '''
+        Imports a mapping model artifact exported by save. Train and ideal datasets are not needed.
+
+        Parameters
+        ----------
+        file_path : str
+            Path of the artifact file.
+
+        Raises
+        ------
+        InvalidModelArtifactException
+            If the artifact file is missing, corrupted or of an unsupported version.
+        '''
+        try:
+            # allow_pickle is disabled, the artifact only contains plain arrays.
+            with np.load(file_path, allow_pickle=False) as artifact:
+                version = int(artifact['version'])
+                if version != MODEL_ARTIFACT_VERSION:
+                    raise InvalidModelArtifactException(f'Model artifact version {version} is not supported (expected version {MODEL_ARTIFACT_VERSION}).')
+
+                # Setting the attributes directly, as the saved arrays are already sorted and the thresholds precomputed.
+                model = cls.__new__(cls)
+                model.train_cols = artifact['train_cols'].tolist()
+                model.ideal_cols = artifact['ideal_cols'].tolist()
+                model.errors = artifact['errors']
+                model.max_deviations = artifact['max_deviations']
+                model.thresholds = artifact['thresholds']
+                model.x = artifact['x']
+                model.y = artifact['y']
+
+            # Checking that the arrays are consistent, so that a bad artifact fails here and not while mapping.
+            match_count = len(model.ideal_cols)
+            if model.y.shape != (len(model.x), match_count) or model.x.ndim != 1:
+                raise InvalidModelArtifactException(f'Model artifact "{file_path}" has ideal values of shape {model.y.shape}, expected {(len(model.x), match_count)}.')
+            if not (len(model.train_cols) == len(model.errors) == len(model.max_deviations) == len(model.thresholds) == match_count):
+                raise InvalidModelArtifactException(f'Model artifact "{file_path}" has inconsistent numbers of matches.')
+        except InvalidModelArtifactException:
+            raise
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile) as ex:
+            raise InvalidModelArtifactException(f'Could not load model artifact "{file_path}". Error: {ex}.')
+        return model
@@ -0,0 +1,232 @@
+# External imports
+import unittest
+import json
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+from math import sqrt
+
+# Internal imports
+from db_helper import DBHelper, DB_FOLDER
+from data_analysis import DataAnalysis
+from stats_analysis import StatsAnalysis
+from data_visualization import DataVisualization
+
+# File with the stored throughput baselines (and allowed tolerance) of each stage.
+PERF_BASELINES_PATH = 'perf_baselines.json'
+
+# Tolerance used for stages not having their own tolerance in the baselines file (0.5 = fails below 50% of baseline throughput).
+PERF_DEFAULT_TOLERANCE = 0.5
+
+# Set PERF_UPDATE_BASELINES=1 to record the measured throughputs as new baselines instead of comparing against them.
+PERF_UPDATE_BASELINES = os.environ.get('PERF_UPDATE_BASELINES') == '1'
+
+# Scaled inputs, generated with a fixed seed so that every run processes the same data.
+PERF_SEED = 2022
+PERF_ROWS = 10000
+PERF_TEST_ROWS = 400
+PERF_REPEATS = 3
+
+PERF_DB_NAME = 'perf_test_sqlite'
+
+
+def make_scaled_datasets(seed = PERF_SEED, rows = PERF_ROWS, test_rows = PERF_TEST_ROWS):
+    '''
+    Generates train, ideal and test DataFrames with the same structure as the assignment datasets, but with the given number of rows.
+    Train functions are noisy copies of 4 ideal functions, test points are noisy samples of train functions or random points.
+    '''
+    rng = np.random.default_rng(seed)
+    x = np.round(np.linspace(-20, 20, rows), 6)
+
+    ideal_df = pd.DataFrame({'x': x})
+    for index in range(1, 51):
+        ideal_df[f'y{index}'] = rng.uniform(-5, 5) * np.sin(x * rng.uniform(0.1, 2)) + rng.uniform(-1, 1) * x
+
+    train_df = pd.DataFrame({'x': x})
+    for train_index, ideal_index in enumerate((13, 31, 15, 10), start=1):
+        train_df[f'y{train_index}'] = ideal_df[f'y{ideal_index}'] + rng.uniform(-0.5, 0.5, rows)
+
+    test_x = rng.choice(x, test_rows)
+    test_y = np.where(rng.random(test_rows) < 0.5, np.interp(test_x, x, train_df['y1']), rng.uniform(-50, 50, test_rows))
+    test_df = pd.DataFrame({'x': test_x, 'y': test_y})
+
+    return train_df, ideal_df, test_df
+
+
+def reference_find_matching_ideal_functions(train_df, ideal_df):
+    '''
+    Reference (plain loop) implementation of DataAnalysis.find_matching_ideal_functions, as given in the assignment:
+    sum of squared deviations and maximum deviation of every train/ideal pair, sorted by error.
+    '''
+    stats = StatsAnalysis()
+    result = {}
+    for train_col in train_df.columns[1:]:
+        error_list = []
+        for ideal_col in ideal_df.columns[1:]:
+            error = stats.sum_of_deviation_squared(train_df[train_col], ideal_df[ideal_col])
+            max_dev = stats.max_deviation(train_df[train_col], ideal_df[ideal_col])
+            error_list.append((ideal_col, error, max_dev))
+        result[train_col] = stats.sort_list(error_list)[0]
+    return result
+
+
+def reference_map_test_to_ideal(test_df, ideal_df, ideal_match):
+    '''
+    Reference (plain loop) implementation of DataAnalysis.map_test_to_ideal, as given in the assignment: 
+    each test point is mapped to the matched ideal function with least deviation, if it is within maximum deviation times sqrt(2).
+    '''
+    mapped_rows = []
+    unmapped_rows = []
+    for test_x, test_y in test_df.itertuples(index=False):
+        mapping = None
+        for matching in ideal_match.values():
+            ideal_value = float(ideal_df.loc[ideal_df['x'] == test_x, matching[0]].iloc[0])
+            difference = np.abs(test_y - ideal_value)
+            if difference <= matching[2] * sqrt(2) and (mapping is None or difference < mapping[1]):
+                mapping = (matching[0], difference)
+        if mapping is None:
+            unmapped_rows.append((test_x, test_y))
+        else:
+            mapped_rows.append((test_x, test_y, mapping[0], mapping[1]))
+    return {
+        'test_mapped_df': pd.DataFrame(mapped_rows, columns = ['x', 'y', 'ideal_function', 'related_deviation']),
+        'test_unmapped_df': pd.DataFrame(unmapped_rows, columns = ['x', 'y'])
+    }
+
+
+def measure_best_time(function, repeats = PERF_REPEATS):
+    '''
+    Runs the given function several times and returns the best (least) duration in seconds, together with the last result.
+    '''
+    best_time = None
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        duration = time.perf_counter() - start
+        best_time = duration if best_time is None else min(best_time, duration)
+    return best_time, result
+
+
+class PerfTestStages(unittest.TestCase):
+    '''
+    Throughput of each stage (fit, map, DB copy and plot) on scaled inputs, compared against the stored baselines.
+    '''
+
+    @classmethod
+    def setUpClass(cls):
+        cls.train_df, cls.ideal_df, cls.test_df = make_scaled_datasets()
+        cls.data_analysis = DataAnalysis(cls.train_df, cls.ideal_df)
+        cls.train_ideal_match = cls.data_analysis.find_matching_ideal_functions()
+        cls.measured = {}
+        cls.temp_folder = tempfile.mkdtemp()
+
+        cls.baselines = {}
+        if os.path.exists(PERF_BASELINES_PATH):
+            with open(PERF_BASELINES_PATH) as baselines_file:
+                cls.baselines = json.load(baselines_file)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.temp_folder, ignore_errors=True)
+        for suffix in ('.db', '.db-wal', '.db-shm'):
+            if os.path.exists(f'{DB_FOLDER}/{PERF_DB_NAME}{suffix}'):
+                os.remove(f'{DB_FOLDER}/{PERF_DB_NAME}{suffix}')
+
+        if PERF_UPDATE_BASELINES:
+            for stage, throughput in cls.measured.items():
+                tolerance = cls.baselines.get(stage, {}).get('tolerance', PERF_DEFAULT_TOLERANCE)
+                cls.baselines[stage] = {'rows_per_second': round(throughput, 1), 'tolerance': tolerance}
+            with open(PERF_BASELINES_PATH, 'w') as baselines_file:
+                json.dump(cls.baselines, baselines_file, indent=4, sort_keys=True)
+                baselines_file.write('\n')
+
+    def check_throughput(self, stage, rows, duration):
+        '''
+        Records the throughput of the stage and fails if it regressed beyond the tolerance of its stored baseline.
+        '''
+        throughput = rows / duration
+        self.measured[stage] = throughput
+        if PERF_UPDATE_BASELINES:
+            return
+        if stage not in self.baselines:
+            self.skipTest(f'No baseline stored for stage "{stage}". Run with PERF_UPDATE_BASELINES=1 to record it.')
+
+        baseline = self.baselines[stage]
+        minimum_throughput = baseline['rows_per_second'] * (1 - baseline.get('tolerance', PERF_DEFAULT_TOLERANCE))
+        self.assertGreaterEqual(throughput, minimum_throughput, f'Stage "{stage}" regressed: {throughput:.0f} rows/s, baseline is {baseline["rows_per_second"]:.0f} rows/s.')
+
+    def test_fit_throughput(self):
+        duration, _ = measure_best_time(self.data_analysis.find_matching_ideal_functions)
+        self.check_throughput('fit', self.train_df.shape[0] * (self.ideal_df.shape[1] - 1), duration)
+
+    def test_fit_early_abandon_throughput(self):
+        duration, _ = measure_best_time(lambda: self.data_analysis.find_matching_ideal_functions(early_abandon=True))
+        self.check_throughput('fit_early_abandon', self.train_df.shape[0] * (self.ideal_df.shape[1] - 1), duration)
+
+    def test_map_throughput(self):
+        duration, _ = measure_best_time(lambda: self.data_analysis.map_test_to_ideal(self.test_df, self.ideal_df, self.train_ideal_match))
+        self.check_throughput('map', self.test_df.shape[0], duration)
+
+    def test_map_files_throughput(self):
+        # Same test data written 8 times in 8 files each, mapped by 2 worker processes with a single prepared mapping model.
+        # The files hold enough rows for the mapping, not the start of the worker processes, to dominate the duration.
+        test_files = []
+        for file_index, file_test_df in enumerate(np.array_split(pd.concat([self.test_df] * 8, ignore_index=True), 8)):
+            test_files.append(os.path.join(self.temp_folder, f'test_{file_index}.csv'))
+            file_test_df.to_csv(test_files[-1], index=False)
+        duration, _ = measure_best_time(lambda: self.data_analysis.map_test_files_to_ideal(test_files, self.ideal_df, self.train_ideal_match, max_workers=2))
+        self.check_throughput('map_files', self.test_df.shape[0] * 8, duration)
+
+    def test_db_copy_throughput(self):
+        with DBHelper(PERF_DB_NAME) as db_helper:
+            duration, _ = measure_best_time(lambda: db_helper.copy_ideal_to_db(self.ideal_df))
+        self.check_throughput('db_copy', self.ideal_df.shape[0], duration)
+
+    def test_plot_throughput(self):
+        test_mapped_df = self.data_analysis.map_test_to_ideal(self.test_df, self.ideal_df, self.train_ideal_match)['test_mapped_df']
+        data_visualization = DataVisualization()
+        file_url = os.path.join(self.temp_folder, 'visualization.html')
+        duration, _ = measure_best_time(lambda: data_visualization.visualize(self.train_df, self.ideal_df, self.train_ideal_match, test_mapped_df, file_url), repeats=1)
+        self.check_throughput('plot', self.train_df.shape[0], duration)
+
+
+class PerfTestEquivalence(unittest.TestCase):
+    '''
+    Every accelerated path of DataAnalysis must give the same result as the reference implementation, on scaled inputs.
+    '''
+
+    @classmethod
+    def setUpClass(cls):
+        cls.train_df, cls.ideal_df, cls.test_df = make_scaled_datasets()
+        cls.data_analysis = DataAnalysis(cls.train_df, cls.ideal_df)
+        cls.expected_train_ideal_match = reference_find_matching_ideal_functions(cls.train_df, cls.ideal_df)
+        cls.expected_test_map_result = reference_map_test_to_ideal(cls.test_df, cls.ideal_df, cls.expected_train_ideal_match)
+
+    def test_fit_equivalence(self):
+        self.assertDictEqual(self.data_analysis.find_matching_ideal_functions(), self.expected_train_ideal_match, 'Fused fit not identical to reference.')
+
+    def test_fit_early_abandon_equivalence(self):
+        self.assertDictEqual(self.data_analysis.find_matching_ideal_functions(early_abandon=True), self.expected_train_ideal_match, 'Early abandon fit not identical to reference.')
+
+    def test_fit_out_of_core_equivalence(self):
+        train_chunks = (self.train_df.iloc[start:start + 1000] for start in range(0, len(self.train_df), 1000))
+        ideal_chunks = (self.ideal_df.iloc[start:start + 1000] for start in range(0, len(self.ideal_df), 1000))
+        train_ideal_match = self.data_analysis.find_matching_ideal_functions_out_of_core(train_chunks, ideal_chunks)
+        for train_col, (ideal_col, error, max_dev) in self.expected_train_ideal_match.items():
+            self.assertEqual(train_ideal_match[train_col][0], ideal_col, 'Out-of-core fit not matching reference ideal function.')
+            self.assertAlmostEqual(train_ideal_match[train_col][1] / error, 1.0, msg='Out-of-core fit error not matching reference.')
+            self.assertEqual(train_ideal_match[train_col][2], max_dev, 'Out-of-core fit maximum deviation not matching reference.')
+
+
+    def test_map_equivalence(self):
+        test_map_result = self.data_analysis.map_test_to_ideal(self.test_df, self.ideal_df, self.expected_train_ideal_match)
+        for name, expected_df in self.expected_test_map_result.items():
+            pd.testing.assert_frame_equal(test_map_result[name], expected_df, check_dtype=False, obj=f'Vectorized map {name}')
+
+
+if __name__ == "__main__":
+   unittest.main()
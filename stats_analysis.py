@@ -1,6 +1,12 @@
 # External imports
 import numpy as np
 
+# Number of rows summed at a time by the early-abandoning SSE kernel, before comparing against the best error so far.
+EARLY_ABANDON_BLOCK_SIZE = 4096
+
+# Fit criteria (metrics) computed by deviation_metrics, any of them can be used to rank the ideal functions.
+FIT_CRITERIA = ('sse', 'mse', 'rmse', 'mae', 'max_deviation')
+
 class StatsAnalysis():
     '''
     A basic class having statistics methods. The class is created separately only to include at least one inheritance, else it could be part of "data_analysis.py".
@@ -19,6 +25,15 @@ class StatsAnalysis():
         Finds the sum of squared deviation between train_col_data and 
         ideal ideal_col_data. (As per criteria 1 of assignment.)
 
+    sum_of_deviation_squared_bounded(train_col_data, ideal_col_data, upper_bound, block_size)
+        Same as sum_of_deviation_squared, but gives up (returns None) as soon as the partial sum exceeds upper_bound.
+
+    deviation_metrics(train_col_data, ideal_col_data, skip_nan)
+        Finds all fit criteria (SSE, MSE, RMSE, MAE and maximum deviation) in a single pass over the deviations.
+
+    metrics_from_sums(sum_squares, sum_abs, max_dev, count, total_count)
+        Builds the dictionary of all fit criteria from the accumulated sums of a deviation array.
+
     '''
 
     def sort_list(self, list):
@@ -71,12 +86,125 @@ class StatsAnalysis():
         # As per criteria 1 of Assignment. 
         error =  np.sum(np.square(train_col_data-ideal_col_data))
 
-        # Alternative methods to find errors between two columns data:
-        
-        # 1. Root Mean Square Error (RMSE):
-        # error =  np.sqrt(np.sum(np.square(train_col_data-ideal_col_data)) / len(train_col_data))
+        # Alternative methods to find errors between two columns data (RMSE, MSE, MAE, ...) are available in deviation_metrics.
 
-        # 2. Mean Square Error (MSE):
-        # error =  np.sum(np.square(train_col_data-ideal_col_data)) / len(train_col_data)
+        return error
+
+    def sum_of_deviation_squared_bounded(self, train_col_data, ideal_col_data, upper_bound, block_size = EARLY_ABANDON_BLOCK_SIZE):
+        '''
+        Early-abandoning version of sum_of_deviation_squared. The squared deviations are summed block by block 
+        and the computation stops as soon as the partial sum goes above upper_bound, since a sum of squares can only grow.
+
+        ...
+
+        Return
+        ----------
+        The sum of squared deviation, or None if the candidate was abandoned (partial sum exceeded upper_bound).
 
+        Parameters
+        ----------
+        train_col_data: NumPy Array
+            Column data of Train data given y column.
+
+        ideal_col_data: NumPy Array
+            Column data of Idea data given y column.
+
+        upper_bound: float
+            Best (least) error found so far. Use np.inf to never abandon.
+
+        block_size: int
+            Number of rows summed between two checks against upper_bound.
+        '''
+        error = 0.0
+        for start in range(0, len(train_col_data), block_size):
+            error += np.sum(np.square(train_col_data[start:start + block_size] - ideal_col_data[start:start + block_size]))
+            if error > upper_bound:
+                return None
         return error
+
+    def deviation_metrics(self, train_col_data, ideal_col_data, skip_nan = False):
+        '''
+        Finds all fit criteria between train_col_data and ideal_col_data in a single pass: the deviation array 
+        is computed only once and SSE, MSE, RMSE, MAE and maximum deviation are all derived from it.
+
+        ideal_col_data can also be a 2 dimensional array with one ideal function per row, in which case 
+        every metric is an array with one value per ideal function.
+
+        ...
+
+        Return
+        ----------
+        Dictionary with keys 'sse', 'mse', 'rmse', 'mae' and 'max_deviation' (see FIT_CRITERIA), 
+        and 'coverage' (fraction of rows used, always 1 unless skip_nan is True).
+
+        Parameters
+        ----------
+        train_col_data: NumPy Array
+            Column data of Train data given y column.
+
+        ideal_col_data: NumPy Array
+            Column data of Idea data given y column, or 2 dimensional array of several ideal columns (one per row).
+
+        skip_nan: Boolean
+            If True, rows where the train or ideal value is missing (NaN) are skipped instead of making the metrics NaN.
+        '''
+        deviation = np.asarray(ideal_col_data, dtype=float) - np.asarray(train_col_data, dtype=float)
+        total_count = deviation.shape[-1]
+
+        if skip_nan:
+            # Masking missing deviations with 0, which changes neither the sums nor the maximum (of absolute values).
+            valid = ~np.isnan(deviation)
+            count = np.sum(valid, axis=-1)
+            deviation = np.where(valid, deviation, 0.0)
+        else:
+            count = total_count
+        abs_deviation = np.abs(deviation)
+
+        sum_squares = np.sum(np.square(deviation), axis=-1)
+        sum_abs = np.sum(abs_deviation, axis=-1)
+        max_dev = np.max(abs_deviation, axis=-1)
+        if skip_nan:
+            max_dev = np.where(count > 0, max_dev, np.nan)
+
+        return self.metrics_from_sums(sum_squares, sum_abs, max_dev, count, total_count)
+
+    def metrics_from_sums(self, sum_squares, sum_abs, max_dev, count, total_count = None):
+        '''
+        Builds the dictionary of all fit criteria from the accumulated sums of a deviation array. 
+        Useful when the sums are accumulated over several chunks of rows.
+
+        ...
+
+        Parameters
+        ----------
+        sum_squares: float or NumPy Array
+            Sum of squared deviations (SSE, criteria 1 of assignment).
+
+        sum_abs: float or NumPy Array
+            Sum of absolute deviations.
+
+        max_dev: float or NumPy Array
+            Maximum absolute deviation.
+
+        count: int or NumPy Array
+            Number of rows the sums were accumulated over (without missing values).
+
+        total_count: int
+            Number of rows including the missing values, used for the coverage. Default (None) is count (full coverage).
+        '''
+        if total_count is None:
+            total_count = count
+
+        # Metrics of a candidate without any row (count 0) are NaN, and its coverage is 0.
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mse = sum_squares / count
+            mae = sum_abs / count
+            coverage = np.zeros_like(mse) + (np.divide(count, total_count) if total_count else 0.0)
+        return {
+            'sse': sum_squares,
+            'mse': mse,
+            'rmse': np.sqrt(mse),
+            'mae': mae,
+            'max_deviation': max_dev,
+            'coverage': coverage
+        }
@@ -1,13 +1,22 @@
 # External imports
 import unittest
+import numpy as np
 import pandas as pd
+import os
+import tempfile
+import threading
+import sqlalchemy as db
+from concurrent.futures import ThreadPoolExecutor
 
 # Internal imports
 from csv_helper import CSVHelper
 from db_helper import DBHelper
+from hash_helper import hash_data_frame
 from custom_exceptions import *
 from data_analysis import DataAnalysis
 from data_visualization import DataVisualization
+from mapping_model import MappingModel
+from distributed_fitting import FittingWorker, FittingCoordinator
 
 
 class UnitTestCSVHelper(unittest.TestCase):
@@ -24,6 +33,14 @@ class UnitTestCSVHelper(unittest.TestCase):
 
         self.assertTrue(load_success, 'CSV Loading Unit Testing Failed.')
 
+class UnitTestHashHelper(unittest.TestCase):
+    def test_hash_data_frame(self):
+        train_df = pd.read_csv('unittest_datasets/train_ut.csv')
+
+        self.assertEqual(hash_data_frame(train_df), hash_data_frame(train_df.copy()), 'Same content not giving the same hash.')
+        self.assertNotEqual(hash_data_frame(train_df), hash_data_frame(train_df.assign(y1=train_df.y1 + 1)), 'Changed values not changing the hash.')
+        self.assertNotEqual(hash_data_frame(train_df), hash_data_frame(train_df.rename(columns={'y1': 'z1'})), 'Changed columns not changing the hash.')
+
 class UnitTestDBHelper(unittest.TestCase):
     def test_db_operations(self):
         csv_loaded = False
@@ -59,6 +76,189 @@ class UnitTestDBHelper(unittest.TestCase):
         store_test_unmapped_success = db_helper.store_test_unmapped_to_db(test_unmapped_df)
         self.assertTrue(store_test_unmapped_success, "Storing Test_UnMapped failed in unit_test_sqlite database.")
 
+    def test_test_run_storage(self):
+        test_mapped_df = pd.read_csv('unittest_datasets/test_mapped_ut.csv')
+        test_unmapped_df = pd.read_csv('unittest_datasets/test_unmapped_ut.csv')
+
+        db_helper = DBHelper('unit_test_sqlite')
+        first_run_id = DBHelper.new_run_id()
+        second_run_id = DBHelper.new_run_id()
+        metadata = {'test_hash': hash_data_frame(test_mapped_df), 'fit_result': {'y1': ('y13', np.float64(33.15543517310224), np.float64(0.4999699999999976))}}
+
+        self.assertTrue(db_helper.store_test_run_to_db(first_run_id, test_mapped_df, test_unmapped_df, metadata), "Storing first test run failed in unit_test_sqlite database.")
+        self.assertTrue(db_helper.store_test_run_to_db(second_run_id, test_mapped_df.head(10), test_unmapped_df.head(5)), "Storing second test run failed in unit_test_sqlite database.")
+
+        # Earlier run must stay queryable and untouched by the later one.
+        pd.testing.assert_frame_equal(db_helper.load_test_mapped_run_from_db(first_run_id), test_mapped_df)
+        pd.testing.assert_frame_equal(db_helper.load_test_unmapped_run_from_db(first_run_id), test_unmapped_df)
+        self.assertEqual(db_helper.load_test_mapped_run_from_db(second_run_id).shape, (10, 4), 'Not found second run test_mapped shape as expected.')
+
+        runs_df = db_helper.load_runs_from_db()
+        self.assertEqual(runs_df.loc[first_run_id, 'metadata']['test_hash'], metadata['test_hash'], 'Run metadata not stored as expected.')
+        self.assertIn(second_run_id, runs_df.index, 'Second run metadata not stored.')
+        self.assertListEqual(runs_df.loc[first_run_id, 'metadata']['fit_result']['y1'], ['y13', 33.15543517310224, 0.4999699999999976], 'NumPy numbers of run metadata not stored as expected.')
+
+        # Metadata which is not JSON serializable must fail the store operation, without storing anything of the run.
+        third_run_id = DBHelper.new_run_id()
+        self.assertFalse(db_helper.store_test_run_to_db(third_run_id, test_mapped_df, test_unmapped_df, {'model': object()}), 'Storing run with not serializable metadata must fail.')
+        self.assertNotIn(third_run_id, db_helper.load_runs_from_db().index, 'Failed run metadata must not be stored.')
+        self.assertEqual(db_helper.load_test_mapped_run_from_db(third_run_id).shape[0], 0, 'Failed run test_mapped rows must not be stored.')
+
+        # Results of many test files (tagged by source file) stored as a run.
+        files_run_id = DBHelper.new_run_id()
+        files_mapped_df = test_mapped_df.assign(source_file=['test_1.csv', 'test_2.csv'] * (len(test_mapped_df) // 2) + ['test_1.csv'] * (len(test_mapped_df) % 2))
+        files_unmapped_df = test_unmapped_df.assign(source_file='test_1.csv')
+        self.assertTrue(db_helper.store_test_run_to_db(files_run_id, files_mapped_df, files_unmapped_df), 'Storing run of many test files failed in unit_test_sqlite database.')
+        pd.testing.assert_frame_equal(db_helper.load_test_mapped_run_from_db(files_run_id), files_mapped_df)
+        pd.testing.assert_frame_equal(db_helper.load_test_unmapped_run_from_db(files_run_id), files_unmapped_df)
+
+    def test_concurrent_db_operations(self):
+        ideal_df = pd.read_csv('unittest_datasets/ideal_ut.csv')
+        test_mapped_df = pd.read_csv('unittest_datasets/test_mapped_ut.csv')
+        test_unmapped_df = pd.read_csv('unittest_datasets/test_unmapped_ut.csv')
+
+        with DBHelper('unit_test_sqlite') as db_helper:
+            db_helper.copy_ideal_to_db(ideal_df)
+
+            def mapping_worker(worker_index):
+                # Each worker reads the ideal data and writes its own run, from its own thread.
+                loaded_ideal_df = db_helper.load_ideal_from_db()
+                run_id = DBHelper.new_run_id()
+                store_success = db_helper.store_test_run_to_db(run_id, test_mapped_df, test_unmapped_df, {'worker': worker_index})
+                db_helper.release_connection()
+                return loaded_ideal_df.shape, store_success, run_id
+
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                results = list(executor.map(mapping_worker, range(16)))
+
+            for ideal_shape, store_success, run_id in results:
+                self.assertEqual(ideal_shape, ideal_df.shape, 'Ideal data not loaded as expected from worker thread.')
+                self.assertTrue(store_success, 'Storing test run failed from worker thread.')
+                self.assertEqual(db_helper.load_test_mapped_run_from_db(run_id).shape, test_mapped_df.shape, 'Worker run not stored as expected.')
+
+        # Closing again (e.g. by the destructor) must not raise.
+        db_helper.close()
+
+    def test_concurrent_first_runs(self):
+        test_mapped_df = pd.read_csv('unittest_datasets/test_mapped_ut.csv')
+        test_unmapped_df = pd.read_csv('unittest_datasets/test_unmapped_ut.csv')
+
+        # Concurrent first writes of runs on fresh databases, where the run tables do not exist yet.
+        for attempt in range(3):
+            db_name = f'unit_test_fresh_sqlite_{attempt}'
+            try:
+                with DBHelper(db_name) as db_helper:
+                    with ThreadPoolExecutor(max_workers=8) as executor:
+                        results = list(executor.map(lambda _: db_helper.store_test_run_to_db(DBHelper.new_run_id(), test_mapped_df, test_unmapped_df), range(8)))
+                    self.assertEqual(results, [True] * 8, 'Concurrent first runs not all stored on a fresh database.')
+                    self.assertEqual(len(db_helper.load_runs_from_db()), 8, 'Not all runs stored on a fresh database.')
+            finally:
+                for suffix in ('.db', '.db-wal', '.db-shm'):
+                    if os.path.exists(f'database/{db_name}{suffix}'):
+                        os.remove(f'database/{db_name}{suffix}')
+
+    def test_connection_lifecycle_order(self):
+        # release_connection, close and connection can be used in any order.
+        db_helper = DBHelper('unit_test_sqlite')
+        db_helper.release_connection()
+        db_helper.close()
+        self.assertEqual(db_helper.connection.execute(db.text('SELECT 1')).scalar(), 1, 'Connection not usable after close.')
+        db_helper.close()
+        db_helper.release_connection()
+        db_helper.release_connection()
+        db_helper.close()
+
+    def test_short_lived_threads(self):
+        ideal_df = pd.read_csv('unittest_datasets/ideal_ut.csv')
+
+        # More threads than the pool size (with overflow), each reading once without releasing its connection.
+        with DBHelper('unit_test_sqlite', cache_max_bytes=0) as db_helper:
+            db_helper.copy_ideal_to_db(ideal_df)
+            loaded_shapes = []
+
+            def short_lived_worker():
+                loaded_shapes.append(db_helper.load_ideal_from_db().shape)
+                # Connection of the thread, returned to the pool when the thread ends.
+                db_helper.connection.execute(db.text('SELECT 1'))
+
+            for _ in range(40):
+                thread = threading.Thread(target=short_lived_worker)
+                thread.start()
+                thread.join()
+            del thread
+
+            self.assertEqual(loaded_shapes, [ideal_df.shape] * 40, 'Ideal data not loaded by every short-lived thread.')
+            self.assertEqual(db_helper.engine.pool.checkedout(), 0, 'Connections of ended threads not returned to the pool.')
+
+    def test_db_read_cache(self):
+        train_df = pd.read_csv('unittest_datasets/train_ut.csv')
+
+        with DBHelper('unit_test_sqlite') as db_helper:
+            db_helper.copy_train_to_db(train_df)
+
+            loaded_train_df = db_helper.load_train_from_db()
+            self.assertTrue(np.shares_memory(db_helper.load_train_from_db().y1.to_numpy(), loaded_train_df.y1.to_numpy()), 'Repeated load not served from the read cache.')
+            self.assertRaises(ValueError, loaded_train_df.loc.__setitem__, (0, 'y1'), 0.0)
+
+            # Adding or replacing columns of a loaded DataFrame must not change the cached one.
+            loaded_train_df['z'] = 1
+            loaded_train_df['y1'] = loaded_train_df['y1'] * 2
+            pd.testing.assert_frame_equal(db_helper.load_train_from_db().reset_index(drop=True), train_df, check_dtype=False)
+
+            loaded_columns_df = db_helper.load_train_from_db(['x', 'y1'])
+            self.assertEqual(list(loaded_columns_df.columns), ['x', 'y1'], 'Selected columns not loaded as expected.')
+            self.assertTrue(np.shares_memory(db_helper.load_train_from_db(['x', 'y1']).y1.to_numpy(), loaded_columns_df.y1.to_numpy()), 'Repeated load of selected columns not served from the read cache.')
+
+            # Writing the table must invalidate the cache.
+            cached_train_df = db_helper.load_train_from_db()
+            db_helper.copy_train_to_db(train_df.assign(y1=train_df.y1 + 1))
+            reloaded_train_df = db_helper.load_train_from_db()
+            self.assertFalse(np.shares_memory(reloaded_train_df.y1.to_numpy(), cached_train_df.y1.to_numpy()), 'Read cache not invalidated by write.')
+            self.assertAlmostEqual(reloaded_train_df.y1.iloc[0], train_df.y1.iloc[0] + 1, msg='Written data not loaded after write.')
+
+        with DBHelper('unit_test_sqlite', cache_max_bytes=0) as db_helper:
+            self.assertFalse(np.shares_memory(db_helper.load_train_from_db().y1.to_numpy(), db_helper.load_train_from_db().y1.to_numpy()), 'Read cache not disabled.')
+
+    def test_mapping_summary(self):
+        test_mapped_df = pd.read_csv('unittest_datasets/test_mapped_ut.csv')
+        test_unmapped_df = pd.read_csv('unittest_datasets/test_unmapped_ut.csv')
+
+        with DBHelper('unit_test_sqlite') as db_helper:
+            db_helper.store_test_mapped_to_db(test_mapped_df)
+            db_helper.store_test_unmapped_to_db(test_unmapped_df)
+            run_id = DBHelper.new_run_id()
+            db_helper.store_test_run_to_db(run_id, test_mapped_df.head(10), test_unmapped_df.head(5))
+
+            summary = db_helper.load_test_mapping_summary_from_db(deviation_bucket_size=0.25)
+            self.assertEqual(summary['mapped_count'], 42, 'Mapped count not as expected.')
+            self.assertEqual(summary['unmapped_count'], 58, 'Unmapped count not as expected.')
+            self.assertAlmostEqual(summary['mapped_ratio'], 0.42, msg='Mapped ratio not as expected.')
+
+            expected_functions = test_mapped_df.groupby('ideal_function')['related_deviation'].agg(['count', 'mean', 'max'])
+            self.assertListEqual(summary['functions']['count'].tolist(), expected_functions['count'].tolist(), 'Counts per function not as expected.')
+            for column, expected_column in (('mean_deviation', 'mean'), ('max_deviation', 'max')):
+                for value, expected_value in zip(summary['functions'][column], expected_functions[expected_column]):
+                    self.assertAlmostEqual(value, expected_value, msg=f'{column} per function not as expected.')
+
+            expected_distribution = test_mapped_df.groupby(['ideal_function', (test_mapped_df.related_deviation // 0.25).astype(int)]).size()
+            self.assertListEqual(summary['deviation_distribution']['count'].tolist(), expected_distribution.tolist(), 'Deviation distribution not as expected.')
+
+            run_summary = db_helper.load_test_mapping_summary_from_db(run_id)
+            self.assertEqual((run_summary['mapped_count'], run_summary['unmapped_count']), (10, 5), 'Run summary counts not as expected.')
+
+        # Nothing stored yet: empty summary, without creating any table.
+        try:
+            with DBHelper('unit_test_empty_sqlite') as db_helper:
+                for summary_run_id in (None, DBHelper.new_run_id()):
+                    empty_summary = db_helper.load_test_mapping_summary_from_db(summary_run_id)
+                    self.assertEqual((empty_summary['mapped_count'], empty_summary['unmapped_count'], empty_summary['mapped_ratio']), (0, 0, None), 'Summary of empty database not as expected.')
+                    self.assertEqual(len(empty_summary['functions']), 0, 'Summary of empty database must not have functions.')
+                self.assertListEqual(db.inspect(db_helper.engine).get_table_names(), [], 'Summary must not create tables.')
+        finally:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(f'database/unit_test_empty_sqlite.db{suffix}'):
+                    os.remove(f'database/unit_test_empty_sqlite.db{suffix}')
+
 class UnitTestDataAnalysis(unittest.TestCase):
     def test_data_analysis(self):
         csv_loaded = False
@@ -88,5 +288,388 @@ class UnitTestDataAnalysis(unittest.TestCase):
         expected_test_unmapped_df_shape = (58, 2)
         self.assertEqual(test_unmapped_df.shape, expected_test_unmapped_df_shape, 'Not found test_unmapped_df shape as expected.')
 
+    def test_early_abandon_matching(self):
+        train_df = pd.read_csv('unittest_datasets/train_ut.csv')
+        ideal_df = pd.read_csv('unittest_datasets/ideal_ut.csv')
+
+        data_analysis = DataAnalysis(train_df, ideal_df)
+        train_ideal_match = data_analysis.find_matching_ideal_functions()
+        train_ideal_match_early_abandon = data_analysis.find_matching_ideal_functions(early_abandon=True)
+
+        self.assertDictEqual(train_ideal_match_early_abandon, train_ideal_match, "Early abandon search not giving the same match as full search.")
+
+        # With a missing value, no candidate has a finite error: same match as the full search instead of failing.
+        gappy_train_df = train_df.copy()
+        gappy_train_df.loc[5, 'y1'] = np.nan
+        gappy_data_analysis = DataAnalysis(gappy_train_df, ideal_df)
+        gappy_match = gappy_data_analysis.find_matching_ideal_functions()
+        gappy_match_early_abandon = gappy_data_analysis.find_matching_ideal_functions(early_abandon=True)
+        self.assertEqual([matching[0] for matching in gappy_match_early_abandon.values()], [matching[0] for matching in gappy_match.values()], 'Early abandon search not giving the same match as full search with missing values.')
+
+        # With values so large that every error overflows to inf: same match as the full search instead of failing.
+        huge_data_analysis = DataAnalysis(train_df.assign(y1=1e200), ideal_df)
+        with np.errstate(over='ignore'):
+            huge_match = huge_data_analysis.find_matching_ideal_functions()
+            huge_match_early_abandon = huge_data_analysis.find_matching_ideal_functions(early_abandon=True)
+        self.assertEqual(huge_match_early_abandon['y1'], huge_match['y1'], 'Early abandon search not giving the same match as full search with infinite errors.')
+
+    def test_out_of_core_matching(self):
+        train_df = pd.read_csv('unittest_datasets/train_ut.csv')
+        ideal_df = pd.read_csv('unittest_datasets/ideal_ut.csv')
+        train_ideal_match = DataAnalysis(train_df, ideal_df).find_matching_ideal_functions()
+
+        db_helper = DBHelper('unit_test_sqlite')
+        db_helper.copy_train_to_db(train_df)
+        db_helper.copy_ideal_to_db(ideal_df)
+
+        data_analysis = DataAnalysis()
+        chunk_sources = {
+            'db': (db_helper.load_train_chunks_from_db(64), db_helper.load_ideal_chunks_from_db(64)),
+            'csv': (CSVHelper.read_csv_chunks('unittest_datasets/train_ut.csv', 64), CSVHelper.read_csv_chunks('unittest_datasets/ideal_ut.csv', 64))
+        }
+        for source, (train_chunks, ideal_chunks) in chunk_sources.items():
+            train_ideal_match_out_of_core = data_analysis.find_matching_ideal_functions_out_of_core(train_chunks, ideal_chunks)
+            self.assertEqual(train_ideal_match_out_of_core.keys(), train_ideal_match.keys(), f'Out-of-core ({source}) not finding all train functions.')
+            for train_col, (ideal_col, error, max_dev) in train_ideal_match.items():
+                self.assertEqual(train_ideal_match_out_of_core[train_col][0], ideal_col, f'Out-of-core ({source}) not finding expected ideal function.')
+                self.assertAlmostEqual(train_ideal_match_out_of_core[train_col][1], error, msg=f'Out-of-core ({source}) error not as expected.')
+                self.assertEqual(train_ideal_match_out_of_core[train_col][2], max_dev, f'Out-of-core ({source}) maximum deviation not as expected.')
+
+    def test_fit_criteria(self):
+        train_df = pd.read_csv('unittest_datasets/train_ut.csv')
+        ideal_df = pd.read_csv('unittest_datasets/ideal_ut.csv')
+
+        data_analysis = DataAnalysis(train_df, ideal_df)
+        criteria_metrics = {}
+        for criterion in ('sse', 'mse', 'rmse', 'mae', 'max_deviation'):
+            train_ideal_match, match_metrics = data_analysis.find_matching_ideal_functions(criterion=criterion, return_metrics=True)
+            self.assertDictEqual(data_analysis.find_matching_ideal_functions(criterion=criterion), train_ideal_match, 'Result not the same without metrics.')
+            criteria_metrics[criterion] = (train_ideal_match, match_metrics)
+            for train_col, (ideal_col, error, max_dev) in train_ideal_match.items():
+                deviation = (train_df[train_col] - ideal_df[ideal_col]).abs()
+                expected_metrics = {'sse': (deviation ** 2).sum(), 'mse': (deviation ** 2).mean(), 'rmse': ((deviation ** 2).mean()) ** 0.5, 'mae': deviation.mean(), 'max_deviation': deviation.max()}
+                for name, expected_value in expected_metrics.items():
+                    self.assertAlmostEqual(match_metrics[train_col][name], expected_value, msg=f'Metric {name} not as expected for criterion {criterion}.')
+                self.assertAlmostEqual(error, expected_metrics[criterion], msg=f'Error not as expected for criterion {criterion}.')
+                self.assertEqual(max_dev, match_metrics[train_col]['max_deviation'], 'Maximum deviation not as expected.')
+
+        # Metrics belong to their own fit, later fits of the same DataAnalysis must not change them.
+        train_ideal_match, match_metrics = criteria_metrics['sse']
+        for train_col, (ideal_col, error, max_dev) in train_ideal_match.items():
+            self.assertEqual(match_metrics[train_col]['sse'], error, 'Metrics of a fit changed by a later fit.')
+        _, early_abandon_metrics = data_analysis.find_matching_ideal_functions(early_abandon=True, return_metrics=True)
+        for train_col in train_ideal_match:
+            self.assertAlmostEqual(early_abandon_metrics[train_col]['sse'], match_metrics[train_col]['sse'], msg='Early abandon metrics not as expected.')
+
+        self.assertRaises(ValueError, data_analysis.find_matching_ideal_functions, criterion='unknown')
+        self.assertRaises(ValueError, data_analysis.find_matching_ideal_functions, early_abandon=True, criterion='mae')
+
+    def test_map_test_files(self):
+        train_df = pd.read_csv('unittest_datasets/train_ut.csv')
+        ideal_df = pd.read_csv('unittest_datasets/ideal_ut.csv')
+        test_df = pd.read_csv('unittest_datasets/test_ut.csv')
+
+        data_analysis = DataAnalysis(train_df, ideal_df)
+        train_ideal_match = data_analysis.find_matching_ideal_functions()
+
+        with tempfile.TemporaryDirectory() as test_folder:
+            # Splitting the test dataset in 3 files, mapped with a single mapping model.
+            for start in range(0, 100, 40):
+                test_df.iloc[start:start + 40].to_csv(os.path.join(test_folder, f'test_{start}.csv'), index=False)
+            test_map_result = data_analysis.map_test_files_to_ideal(test_folder, ideal_df, train_ideal_match, max_workers=2)
+
+            # Files which are not test data (e.g. train.csv) must be refused instead of being mapped.
+            train_df.to_csv(os.path.join(test_folder, 'train.csv'), index=False)
+            self.assertRaises(InvalidDataFormatException, data_analysis.map_test_files_to_ideal, test_folder, ideal_df, train_ideal_match, max_workers=2)
+            self.assertRaises(InvalidDataFormatException, data_analysis.prepare_mapping_model(ideal_df, train_ideal_match).map_test, train_df)
+
+        test_mapped_df = test_map_result['test_mapped_df']
+        test_unmapped_df = test_map_result['test_unmapped_df']
+        self.assertEqual(test_mapped_df.shape, (42, 5), 'Not found test_mapped_df shape as expected.')
+        self.assertEqual(test_unmapped_df.shape, (58, 3), 'Not found test_unmapped_df shape as expected.')
+        self.assertEqual(pd.concat([test_mapped_df, test_unmapped_df]).source_file.nunique(), 3, 'Results not tagged by source file.')
+
+    def test_mapping_model_artifact(self):
+        train_df = pd.read_csv('unittest_datasets/train_ut.csv')
+        ideal_df = pd.read_csv('unittest_datasets/ideal_ut.csv')
+        test_df = pd.read_csv('unittest_datasets/test_ut.csv')
+
+        data_analysis = DataAnalysis(train_df, ideal_df)
+        model = data_analysis.prepare_mapping_model(ideal_df, data_analysis.find_matching_ideal_functions())
+
+        with tempfile.TemporaryDirectory() as model_folder:
+            model_path = os.path.join(model_folder, 'model.npz')
+            model.save(model_path)
+            loaded_model = MappingModel.load(model_path)
+
+            # Artifact of another (unsupported) version must be refused.
+            unsupported_path = os.path.join(model_folder, 'unsupported.npz')
+            np.savez(unsupported_path, version=np.array(0))
+            self.assertRaises(InvalidModelArtifactException, MappingModel.load, unsupported_path)
+
+            # Truncated artifact must be refused.
+            truncated_path = os.path.join(model_folder, 'truncated.npz')
+            with open(model_path, 'rb') as model_file, open(truncated_path, 'wb') as truncated_file:
+                truncated_file.write(model_file.read()[:100])
+            self.assertRaises(InvalidModelArtifactException, MappingModel.load, truncated_path)
+
+            # Artifacts with inconsistent arrays must be refused.
+            with np.load(model_path) as artifact:
+                arrays = dict(artifact)
+            bad_shape_path = os.path.join(model_folder, 'bad_shape.npz')
+            np.savez(bad_shape_path, **{**arrays, 'y': arrays['y'][:, :3]})
+            self.assertRaises(InvalidModelArtifactException, MappingModel.load, bad_shape_path)
+            bad_thresholds_path = os.path.join(model_folder, 'bad_thresholds.npz')
+            np.savez(bad_thresholds_path, **{**arrays, 'thresholds': arrays['thresholds'][:2]})
+            self.assertRaises(InvalidModelArtifactException, MappingModel.load, bad_thresholds_path)
+
+        self.assertListEqual(loaded_model.ideal_cols, ['y13', 'y31', 'y15', 'y10'], 'Loaded model not having expected matched ideal functions.')
+        self.assertEqual(loaded_model.y.shape, (400, 4), 'Loaded model must only contain the matched ideal functions.')
+        test_map_result = loaded_model.map_test(test_df)
+        for name, expected_df in model.map_test(test_df).items():
+            pd.testing.assert_frame_equal(test_map_result[name], expected_df)
+
+    def test_x_grid_alignment(self):
+        train_df = pd.read_csv('unittest_datasets/train_ut.csv')
+        ideal_df = pd.read_csv('unittest_datasets/ideal_ut.csv')
+        train_ideal_match = DataAnalysis(train_df, ideal_df).find_matching_ideal_functions()
+        expected_ideal_cols = [matching[0] for matching in train_ideal_match.values()]
+
+        # Same x values in a different order (and different index) must give exactly the same result.
+        shuffled_ideal_df = ideal_df.sample(frac=1, random_state=1).reset_index(drop=True)
+        self.assertDictEqual(DataAnalysis(train_df, shuffled_ideal_df).find_matching_ideal_functions(), train_ideal_match, 'Exact alignment not giving the same match for shuffled ideal data.')
+
+        # Ideal data on a coarser grid (every other x value).
+        coarse_ideal_df = ideal_df.iloc[::2]
+        exact_match = DataAnalysis(train_df, coarse_ideal_df).find_matching_ideal_functions()
+        self.assertListEqual([matching[0] for matching in exact_match.values()], expected_ideal_cols, 'Exact alignment not finding expected ideal functions.')
+        for alignment_method in ('nearest', 'interpolate'):
+            data_analysis = DataAnalysis(train_df, coarse_ideal_df, alignment_method)
+            aligned_match = data_analysis.find_matching_ideal_functions()
+            self.assertListEqual([matching[0] for matching in aligned_match.values()], expected_ideal_cols, f'Alignment {alignment_method} not finding expected ideal functions.')
+            self.assertDictEqual(data_analysis.find_matching_ideal_functions(early_abandon=True), aligned_match, f'Early abandon with alignment {alignment_method} not giving the same match.')
+
+        self.assertRaises(ValueError, DataAnalysis(train_df, ideal_df, 'unknown').find_matching_ideal_functions)
+
+        # Changes made in place to the datasets are taken into account by the next fit.
+        data_analysis = DataAnalysis(train_df.copy(), ideal_df)
+        data_analysis.find_matching_ideal_functions()
+        data_analysis.train_df['y1'] = ideal_df['y1']
+        self.assertEqual(data_analysis.find_matching_ideal_functions()['y1'], ('y1', 0.0, 0.0), 'In place change of train data not taken into account.')
+
+    def test_missing_data(self):
+        train_df = pd.read_csv('unittest_datasets/train_ut.csv')
+        ideal_df = pd.read_csv('unittest_datasets/ideal_ut.csv')
+        test_df = pd.read_csv('unittest_datasets/test_ut.csv')
+        train_ideal_match = DataAnalysis(train_df, ideal_df).find_matching_ideal_functions()
+        expected_ideal_cols = [matching[0] for matching in train_ideal_match.values()]
+
+        # Gaps in a train function and in its matched ideal function, and a matched ideal function (of y2) with values in 5 rows only.
+        train_df.loc[::10, 'y1'] = np.nan
+        ideal_df.loc[3::7, 'y13'] = np.nan
+        ideal_df.loc[5:, 'y31'] = np.nan
+
+        data_analysis = DataAnalysis(train_df, ideal_df)
+        gappy_match, gappy_metrics = data_analysis.find_matching_ideal_functions(skip_nan=True, return_metrics=True)
+        gappy_ideal_cols = [matching[0] for matching in gappy_match.values()]
+        self.assertListEqual(gappy_ideal_cols[:1] + gappy_ideal_cols[2:], expected_ideal_cols[:1] + expected_ideal_cols[2:], 'Missing-data mode not finding expected ideal functions.')
+        expected_coverage = (train_df['y1'].notna() & ideal_df['y13'].notna()).mean()
+        self.assertAlmostEqual(gappy_metrics['y1']['coverage'], expected_coverage, msg='Coverage not as expected.')
+        self.assertEqual(gappy_metrics['y3']['coverage'], 1.0, 'Coverage of complete data not as expected.')
+
+        # y31 only covers 5 rows, so it is a candidate for y2 only with a lower minimum coverage.
+        self.assertNotEqual(gappy_match['y2'][0], 'y31', 'Ideal function with low coverage not excluded.')
+        self.assertEqual(data_analysis.find_matching_ideal_functions(skip_nan=True, criterion='mse', min_coverage=0)['y2'][0], 'y31', 'Ideal function with low coverage not included.')
+        self.assertRaises(InvalidDataFormatException, data_analysis.find_matching_ideal_functions, skip_nan=True, min_coverage=1.0)
+        self.assertRaises(ValueError, data_analysis.find_matching_ideal_functions, early_abandon=True, skip_nan=True)
+
+        train_chunks = (train_df.iloc[start:start + 64] for start in range(0, len(train_df), 64))
+        ideal_chunks = (ideal_df.iloc[start:start + 64] for start in range(0, len(ideal_df), 64))
+        gappy_match_out_of_core, gappy_metrics_out_of_core = DataAnalysis().find_matching_ideal_functions_out_of_core(train_chunks, ideal_chunks, skip_nan=True, return_metrics=True)
+        self.assertAlmostEqual(gappy_metrics_out_of_core['y1']['coverage'], expected_coverage, msg='Out-of-core coverage not as expected.')
+        for train_col, (ideal_col, error, max_dev) in gappy_match.items():
+            self.assertEqual(gappy_match_out_of_core[train_col][0], ideal_col, 'Out-of-core missing-data mode not finding expected ideal function.')
+            self.assertAlmostEqual(gappy_match_out_of_core[train_col][1], error, msg='Out-of-core missing-data mode error not as expected.')
+            self.assertEqual(gappy_match_out_of_core[train_col][2], max_dev, 'Out-of-core missing-data mode maximum deviation not as expected.')
+
+        # Test points with a missing x or y value are left unmapped in missing-data mode.
+        test_map_result = data_analysis.map_test_to_ideal(test_df, ideal_df, train_ideal_match)
+        gappy_test_df = test_df.copy()
+        gappy_test_df.loc[0, 'x'] = np.nan
+        gappy_test_df.loc[2, 'y'] = np.nan
+        self.assertRaises(InvalidDataFormatException, data_analysis.map_test_to_ideal, gappy_test_df, ideal_df, train_ideal_match)
+        gappy_map_result = data_analysis.map_test_to_ideal(gappy_test_df, ideal_df, train_ideal_match, skip_nan=True)
+        self.assertEqual(gappy_map_result['test_mapped_df'].shape[0] + gappy_map_result['test_unmapped_df'].shape[0], test_df.shape[0], 'Not all test points in mapping result.')
+        self.assertTrue(gappy_map_result['test_mapped_df'][['x', 'y']].notna().all().all(), 'Test points with missing values mapped.')
+        self.assertLessEqual(gappy_map_result['test_mapped_df'].shape[0], test_map_result['test_mapped_df'].shape[0], 'More test points mapped with missing values.')
+
+    def test_distributed_matching(self):
+        train_df = pd.read_csv('unittest_datasets/train_ut.csv')
+        ideal_df = pd.read_csv('unittest_datasets/ideal_ut.csv')
+        data_analysis = DataAnalysis(train_df, ideal_df)
+
+        class FlakyFittingWorker(FittingWorker):
+            # Fails the first shard it gets, so that the coordinator has to retry it on another worker.
+            failed = False
+            def score_shard(self, *args):
+                if not FlakyFittingWorker.failed:
+                    FlakyFittingWorker.failed = True
+                    raise RuntimeError('Worker failure.')
+                return super().score_shard(*args)
+
+        # A port that was free, so that nothing listens on it (worker down).
+        with FittingWorker() as down_worker:
+            down_worker_url = down_worker.url
+
+        with FittingWorker() as worker_1, FittingWorker() as worker_2, FlakyFittingWorker() as flaky_worker:
+            worker_urls = [worker_1.url, down_worker_url, flaky_worker.url, worker_2.url]
+            for criterion in ('sse', 'mae', 'max_deviation'):
+                train_ideal_match, match_metrics = data_analysis.find_matching_ideal_functions(criterion=criterion, return_metrics=True)
+                distributed_match, distributed_metrics = data_analysis.find_matching_ideal_functions_distributed(worker_urls, criterion, shard_size=7, return_metrics=True)
+                self.assertDictEqual(distributed_match, train_ideal_match, f'Distributed fit not identical for criterion {criterion}.')
+                self.assertDictEqual(distributed_metrics, match_metrics, f'Distributed fit metrics not identical for criterion {criterion}.')
+            self.assertTrue(FlakyFittingWorker.failed, 'Flaky worker not used.')
+
+            # Local best-k of every worker merged into the global best-k.
+            train_values = train_df[['y1']].to_numpy().T
+            candidates = FittingCoordinator(worker_urls, shard_size=7, k=3).find_best_candidates(train_values, ideal_df.iloc[:, 1:].to_numpy().T)
+            expected_errors = sorted(((train_df['y1'] - ideal_df[ideal_col]) ** 2).sum() for ideal_col in ideal_df.columns[1:])[:3]
+            self.assertEqual(len(candidates[0][0]), 3, 'Not finding best 3 candidates.')
+            for error, expected_error in zip(candidates[0][1]['sse'], expected_errors):
+                self.assertAlmostEqual(error, expected_error, msg='Best candidates not as expected.')
+
+            # Missing-data mode.
+            gappy_train_df = train_df.copy()
+            gappy_train_df.loc[::10, 'y1'] = np.nan
+            gappy_data_analysis = DataAnalysis(gappy_train_df, ideal_df)
+            self.assertDictEqual(gappy_data_analysis.find_matching_ideal_functions_distributed(worker_urls, skip_nan=True, shard_size=7), gappy_data_analysis.find_matching_ideal_functions(skip_nan=True), 'Distributed fit not identical in missing-data mode.')
+
+        self.assertRaises(DistributedFittingException, data_analysis.find_matching_ideal_functions_distributed, [down_worker_url], max_retries=1)
+
+        class ForgetfulFittingWorker(FittingWorker):
+            # Counts the train data received, and forgets it once (as if restarted), so that the coordinator has to send it again.
+            train_count = 0
+            forgot = False
+            def train(self, *args):
+                ForgetfulFittingWorker.train_count += 1
+                super().train(*args)
+            def score_fit_shard(self, fit_id, ideal_values):
+                if not ForgetfulFittingWorker.forgot:
+                    ForgetfulFittingWorker.forgot = True
+                    self.release(fit_id)
+                return super().score_fit_shard(fit_id, ideal_values)
+
+        # Train data sent once for all shards, and once more after the worker lost it.
+        with ForgetfulFittingWorker() as forgetful_worker:
+            self.assertDictEqual(data_analysis.find_matching_ideal_functions_distributed([forgetful_worker.url], shard_size=7), data_analysis.find_matching_ideal_functions(), 'Distributed fit not identical with a worker losing the train data.')
+            self.assertTrue(ForgetfulFittingWorker.forgot, 'Forgetful worker not used.')
+            self.assertEqual(ForgetfulFittingWorker.train_count, 2, 'Train data not sent once per worker (and again once lost).')
+
+class UnitTestDataVisualization(unittest.TestCase):
+    def test_downsampling(self):
+        x = np.linspace(-20, 20, 100000)
+        y = np.sin(x)
+        y[12345] = 900
+        y[67890] = -40
+
+        for name, (downsampled_x, downsampled_y) in {'minmax': DataVisualization.downsample_min_max(x, y, 450), 'lttb': DataVisualization.downsample_lttb(x, y, 1800)}.items():
+            self.assertLessEqual(len(downsampled_x), 1800, f'Downsampling {name} not bounded.')
+            self.assertTrue(np.all(np.diff(downsampled_x) >= 0), f'Downsampling {name} not in x order.')
+            self.assertEqual((downsampled_y.max(), downsampled_y.min()), (900, -40), f'Downsampling {name} not keeping peaks.')
+            self.assertEqual((downsampled_x[0], downsampled_x[-1]), (x[0], x[-1]), f'Downsampling {name} not keeping first and last points.')
+
+        scatter_x, scatter_y = DataVisualization.cap_scatter_density(x, y, 500)
+        self.assertLessEqual(len(scatter_x), 500, 'Scatter density not capped.')
+        self.assertEqual(scatter_y.max(), 900, 'Scatter density cap not keeping outlier.')
+
+        # Short series are plotted as they are.
+        short_x, short_y = DataVisualization.downsample_lttb(x[:100], y[:100])
+        self.assertTrue(np.array_equal(short_y, y[:100]), 'Short series downsampled.')
+
+        self.assertRaises(ValueError, DataVisualization, 'unknown')
+
+    def test_visualization_layout(self):
+        train_df = pd.read_csv('unittest_datasets/train_ut.csv')
+        ideal_df = pd.read_csv('unittest_datasets/ideal_ut.csv')
+        test_mapped_df = pd.read_csv('unittest_datasets/test_mapped_ut.csv')
+
+        # 6 train functions, the last two matched to ideal functions already matched by others.
+        train_df = train_df.assign(y5=train_df['y1'], y6=train_df['y2'])
+        train_ideal_match = {'y1': ('y13', 0.0, 0.5), 'y2': ('y31', 0.0, 0.5), 'y3': ('y15', 0.0, 0.5), 'y4': ('y10', 0.0, 0.5), 'y5': ('y13', 0.0, 0.5), 'y6': ('y31', 0.0, 0.5)}
+
+        with tempfile.TemporaryDirectory() as temp_folder:
+            layout = DataVisualization().visualize(train_df, ideal_df, train_ideal_match, test_mapped_df, os.path.join(temp_folder, 'visualization.html'))
+
+        self.assertEqual(len(layout.children), len(train_ideal_match), 'Not one row per train function.')
+        sources = {renderer.data_source.id for graph_row in layout.children for graph in graph_row.children for renderer in graph.renderers}
+        # One source per train function, and one line source and one scatter source per unique matched ideal function.
+        self.assertEqual(len(sources), 6 + 4 * 2, 'Data sources not shared between plots of the same function.')
+        for graph_row in layout.children:
+            _, ideal_graph, test_graph = graph_row.children
+            self.assertIs(ideal_graph.renderers[0].data_source, test_graph.renderers[0].data_source, 'Matched ideal function source not shared.')
+
+    def test_visualization_report(self):
+        train_df = pd.read_csv('unittest_datasets/train_ut.csv')
+        ideal_df = pd.read_csv('unittest_datasets/ideal_ut.csv')
+        test_mapped_df = pd.read_csv('unittest_datasets/test_mapped_ut.csv')
+        train_ideal_match = {'y1': ('y13', 33.15543517310224, 0.4999699999999976), 'y2': ('y31', 30.83450463458651, 0.49812999999999974), 'y3': ('y15', 34.679790780916896, 0.4975619999999985), 'y4': ('y10', 33.01178951893059, 0.49966569999999955)}
+
+        with tempfile.TemporaryDirectory() as temp_folder:
+            visualization_url = os.path.join(temp_folder, 'visualization.html')
+            DataVisualization().visualize(train_df, ideal_df, train_ideal_match, test_mapped_df, visualization_url)
+            index_url = DataVisualization().visualize_report(train_df, ideal_df, train_ideal_match, test_mapped_df, os.path.join(temp_folder, 'report'), max_workers=2)
+
+            with open(index_url) as index_file:
+                index_page = index_file.read()
+            for train_col, matching in train_ideal_match.items():
+                page_url = os.path.join(temp_folder, 'report', f'{train_col}.html')
+                self.assertIn(f'href="{train_col}.html"', index_page, f'Report index not linking page of {train_col}.')
+                self.assertIn(matching[0], index_page, f'Report index not showing ideal function of {train_col}.')
+                with open(page_url) as page_file:
+                    page = page_file.read()
+                self.assertIn('webgl', page, f'Report page of {train_col} not using WebGL output backend.')
+                self.assertLess(os.path.getsize(page_url), os.path.getsize(visualization_url), f'Report page of {train_col} not smaller than whole visualization.')
+
+    def test_visualization_skip_unchanged(self):
+        train_df = pd.read_csv('unittest_datasets/train_ut.csv')
+        ideal_df = pd.read_csv('unittest_datasets/ideal_ut.csv')
+        test_mapped_df = pd.read_csv('unittest_datasets/test_mapped_ut.csv')
+        train_ideal_match = {'y1': ('y13', 33.15543517310224, 0.4999699999999976), 'y2': ('y31', 30.83450463458651, 0.49812999999999974), 'y3': ('y15', 34.679790780916896, 0.4975619999999985), 'y4': ('y10', 33.01178951893059, 0.49966569999999955)}
+
+        with tempfile.TemporaryDirectory() as temp_folder:
+            file_url = os.path.join(temp_folder, 'visualization.html')
+            data_visualization = DataVisualization()
+            self.assertIsNotNone(data_visualization.visualize(train_df, ideal_df, train_ideal_match, test_mapped_df, file_url), 'Visualization not rendered.')
+            self.assertTrue(os.path.exists(os.path.join(temp_folder, 'visualization.manifest.json')), 'Visualization manifest not saved.')
+
+            self.assertIsNone(data_visualization.visualize(train_df, ideal_df, train_ideal_match, test_mapped_df, file_url), 'Unchanged visualization rendered again.')
+            self.assertIsNotNone(data_visualization.visualize(train_df, ideal_df, train_ideal_match, test_mapped_df, file_url, force=True), 'Visualization not rendered with force.')
+
+            # Any change of the inputs, settings or html file renders it again.
+            changed_test_mapped_df = test_mapped_df.assign(related_deviation=test_mapped_df['related_deviation'] + 0.01)
+            self.assertIsNotNone(data_visualization.visualize(train_df, ideal_df, train_ideal_match, changed_test_mapped_df, file_url), 'Visualization not rendered for changed inputs.')
+            self.assertIsNotNone(DataVisualization('lttb').visualize(train_df, ideal_df, train_ideal_match, changed_test_mapped_df, file_url), 'Visualization not rendered for changed settings.')
+            with open(file_url, 'a') as html_file:
+                html_file.write('<!-- edited -->')
+            self.assertIsNotNone(DataVisualization('lttb').visualize(train_df, ideal_df, train_ideal_match, changed_test_mapped_df, file_url), 'Visualization not rendered for changed html file.')
+
+    def test_visualization_output_size(self):
+        x = np.round(np.linspace(-20, 20, 100000), 6)
+        train_df = pd.DataFrame({'x': x, 'y1': np.sin(x)})
+        ideal_df = pd.DataFrame({'x': x, 'y13': np.sin(x)})
+        train_ideal_match = {f'y{index}': ('y13', 0.0, 0.5) for index in range(1, 5)}
+        train_df = train_df.assign(y2=train_df['y1'], y3=train_df['y1'], y4=train_df['y1'])
+        test_mapped_df = pd.DataFrame({'x': x, 'y': np.sin(x), 'ideal_function': 'y13', 'related_deviation': 0.0})
+
+        with tempfile.TemporaryDirectory() as temp_folder:
+            file_sizes = {}
+            for downsample in ('minmax', 'lttb', None):
+                file_url = os.path.join(temp_folder, f'visualization_{downsample}.html')
+                DataVisualization(downsample, None if downsample is None else 2000).visualize(train_df, ideal_df, train_ideal_match, test_mapped_df, file_url)
+                file_sizes[downsample] = os.path.getsize(file_url)
+
+        for downsample in ('minmax', 'lttb'):
+            self.assertLess(file_sizes[downsample] * 10, file_sizes[None], f'Visualization output not downsampled with {downsample}.')
+
 if __name__ == "__main__":
    unittest.main()
\ No newline at end of file
@@ -0,0 +1,127 @@
+# External imports
+import numpy as np
+
+# Internal imports
+from custom_exceptions import InvalidDataFormatException
+
+# Methods available to align the ideal dataset on the x grid of the train dataset.
+ALIGNMENT_METHODS = ('exact', 'nearest', 'interpolate')
+
+class XGridAlignment():
+    '''
+    Reconciles the x grids of the train and ideal datasets once, so that all scoring works on contiguous NumPy arrays
+    sharing the same x values in the same order (no pandas index alignment for every train/ideal pair).
+    The train x grid is kept, and the ideal functions are aligned on it with one of the ALIGNMENT_METHODS:
+        - 'exact': train rows whose x value is not in the ideal dataset are dropped (join on x).
+        - 'nearest': each train x uses the ideal row with the nearest x value.
+        - 'interpolate': ideal functions are linearly interpolated at each train x. Train rows outside of the
+          ideal x range are dropped (no extrapolation).
+
+    ...
+
+    Attributes
+    ----------
+    method : str
+        Alignment method used, one of ALIGNMENT_METHODS.
+    x : NumPy Array
+        Aligned x values.
+    train_cols : List
+        Train functions (Y column names).
+    ideal_cols : List
+        Ideal functions (Y column names).
+    train_values : NumPy Array
+        Aligned train values, one contiguous row per train function.
+    ideal_values : NumPy Array
+        Aligned ideal values, one contiguous row per ideal function.
+    '''
+
+    def __init__(self, train_df, ideal_df, method = 'exact'):
+        '''
+        XGridAlignment class constructor, aligning the ideal dataset on the x grid of the train dataset.
+        ...
+
+        Parameters
+        ----------
+        train_df: DataFrame
+            a pandas DataFrame for train dataset, first column being 'x'.
+
+        ideal_df : DataFrame
+            a pandas DataFrame for ideal dataset, first column being 'x'.
+
+        method : str
+            Alignment method, one of ALIGNMENT_METHODS. Default is 'exact'.
+
+        Raises
+        ------
+        ValueError
+            If method is unknown.
+
+        InvalidDataFormatException
+            If no train x value can be aligned with the ideal dataset.
+        '''
+        if method not in ALIGNMENT_METHODS:
+            raise ValueError(f'Unknown alignment method "{method}", must be one of {ALIGNMENT_METHODS}.')
+
+        self.method = method
+        self.train_cols = list(train_df.columns[1:])
+        self.ideal_cols = list(ideal_df.columns[1:])
+
+        train_x = train_df['x'].to_numpy(dtype=float)
+        ideal_x = ideal_df['x'].to_numpy(dtype=float)
+        train_values = train_df[self.train_cols].to_numpy(dtype=float)
+        ideal_values = ideal_df[self.ideal_cols].to_numpy(dtype=float)
+
+        if np.array_equal(train_x, ideal_x):
+            # Same grid (the usual case), nothing to align.
+            keep = np.ones(len(train_x), dtype=bool)
+            aligned_ideal_values = ideal_values
+        elif len(ideal_x) == 0:
+            keep = np.zeros(len(train_x), dtype=bool)
+            aligned_ideal_values = ideal_values
+        else:
+            # Sorting the ideal x grid once, so that train x values can be found with binary searches.
+            order = np.argsort(ideal_x, kind='stable')
+            align = {'exact': self.__align_exact, 'nearest': self.__align_nearest, 'interpolate': self.__align_interpolate}[method]
+            keep, aligned_ideal_values = align(train_x, ideal_x[order], ideal_values[order])
+
+        if not np.any(keep):
+            raise InvalidDataFormatException(f'No x value of train dataset could be aligned with ideal dataset (alignment method "{method}").')
+
+        self.x = train_x[keep]
+        # Transposing so that each function is a contiguous row, same memory layout as a single column.
+        self.train_values = np.ascontiguousarray(train_values[keep].T)
+        self.ideal_values = np.ascontiguousarray(aligned_ideal_values.T)
+
+    def __align_exact(self, train_x, ideal_x, ideal_values):
+        '''
+        Keeps the train rows whose x value is in the (sorted) ideal x grid, and the related ideal rows.
+        '''
+        positions = np.minimum(np.searchsorted(ideal_x, train_x), len(ideal_x) - 1)
+        keep = ideal_x[positions] == train_x
+        return keep, ideal_values[positions[keep]]
+
+    def __align_nearest(self, train_x, ideal_x, ideal_values):
+        '''
+        Uses the ideal row with the nearest x value (the lower one in case of a tie) for every train row.
+        '''
+        right = np.clip(np.searchsorted(ideal_x, train_x), 1, len(ideal_x) - 1) if len(ideal_x) > 1 else np.zeros(len(train_x), dtype=int)
+        left = np.maximum(right - 1, 0)
+        positions = np.where(np.abs(train_x - ideal_x[left]) <= np.abs(ideal_x[right] - train_x), left, right)
+        return np.ones(len(train_x), dtype=bool), ideal_values[positions]
+
+    def __align_interpolate(self, train_x, ideal_x, ideal_values):
+        '''
+        Linearly interpolates all ideal functions at every train x inside the ideal x range, at once.
+        '''
+        keep = (train_x >= ideal_x[0]) & (train_x <= ideal_x[-1])
+        kept_x = train_x[keep]
+        right = np.clip(np.searchsorted(ideal_x, kept_x, side='right'), 1, len(ideal_x) - 1) if len(ideal_x) > 1 else np.zeros(len(kept_x), dtype=int)
+        left = np.maximum(right - 1, 0)
+
+        # Weight of the right neighbour, 0 when train x is exactly on the ideal grid (or both neighbours have the same x).
+        span = ideal_x[right] - ideal_x[left]
+        weights = np.divide(kept_x - ideal_x[left], span, out=np.zeros(len(kept_x)), where=span > 0)[:, None]
+        aligned_values = ideal_values[left] + (ideal_values[right] - ideal_values[left]) * weights
+        # Using the grid values as they are where no interpolation is needed, so that they stay exact.
+        aligned_values = np.where(weights == 0, ideal_values[left], np.where(weights == 1, ideal_values[right], aligned_values))
+        return keep, aligned_values